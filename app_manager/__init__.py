@@ -1,5 +1,3 @@
-# from .celery import app as celery_app
+from .celery import app as celery_app
 
-# __all__ = ('celery_app',)
-
-# Comentado temporalmente para ejecutar sin Celery
\ No newline at end of file
+__all__ = ('celery_app',)
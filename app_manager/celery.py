@@ -15,8 +15,13 @@ app.autodiscover_tasks()
 
 # Configurar tareas periódicas
 app.conf.beat_schedule = {
+    'sync-products-incremental': {
+        'task': 'apps.cotizador.cache.tasks.sync_products_task',
+        'schedule': crontab(minute='*/5'),  # Cada 5 minutos, solo cambios
+    },
     'sync-products-monday-8am': {
         'task': 'apps.cotizador.cache.tasks.sync_products_task',
         'schedule': crontab(hour=8, minute=0, day_of_week=0),  # Lunes 8:00 AM
+        'kwargs': {'full': True},
     },
 }
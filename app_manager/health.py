@@ -0,0 +1,32 @@
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework.permissions import AllowAny
+
+from apps.core import ercules, resilience
+
+
+class UpstreamHealthAPIView(APIView):
+    """
+    Estado de los servicios externos (Ercules y Odoo): circuit breaker,
+    llamadas en curso y métricas por endpoint de Ercules.
+    Siempre responde 200 para que un servicio caído no saque de rotación a la
+    instancia; ``status`` es 'degraded' si algún circuito no está cerrado.
+
+    Sin límite de solicitudes para que los monitores puedan consultarlo con
+    frecuencia. Sin autenticación solo se publica el estado de cada circuito;
+    el detalle (URLs, fallas, ocupación y métricas) es para usuarios staff.
+    """
+    permission_classes = [AllowAny]
+    throttle_classes = []
+
+    def get(self, request):
+        upstreams = resilience.get_health()
+        degraded = any(info['state'] != resilience.STATE_CLOSED for info in upstreams.values())
+        data = {'status': 'degraded' if degraded else 'ok'}
+
+        if request.user and request.user.is_staff:
+            data['upstreams'] = upstreams
+            data['endpoints'] = ercules.get_stats()
+        else:
+            data['upstreams'] = {upstream: {'state': info['state']} for upstream, info in upstreams.items()}
+        return Response(data)
@@ -18,4 +18,6 @@ class DatabaseRouter:
     def allow_migrate(self, db, app_label, model_name=None, **hints):
         if db == 'erp-portalgebesa-com':
             return False  # No realizar migraciones en la base de datos ERP
+        if db == 'tasks':
+            return False  # Es la misma base que default
         return True
@@ -135,6 +135,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     # Third party apps
     'rest_framework',
     'rest_framework_simplejwt',
@@ -218,6 +219,11 @@ DATABASES = {
     }
 }
 
+# Misma base que default en una conexión aparte: el registro de tareas de
+# sincronización (task_registry) escribe su estado por aquí para que se
+# confirme de inmediato aunque la tarea corra dentro de una transacción
+DATABASES['tasks'] = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+
 MIGRATIONS_MODULES = {
     'analytics': None,
 }
@@ -342,6 +348,107 @@ CACHE_TTL = 60 * 15
 # Cache key prefix
 CACHE_KEY_PREFIX = 'app_manager'
 
+# Cache backend: Redis compartido entre workers si está configurado,
+# memoria local del proceso en caso contrario
+REDIS_URL = config('REDIS_URL', default='')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': CACHE_KEY_PREFIX,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': CACHE_KEY_PREFIX,
+        }
+    }
+
+# Caché de la API product_data de Ercules (segundos)
+PRODUCT_DATA_CACHE_TTL = config('PRODUCT_DATA_CACHE_TTL', default=300, cast=int)
+PRODUCT_DATA_CACHE_STALE_TTL = config('PRODUCT_DATA_CACHE_STALE_TTL', default=3600, cast=int)
+PRODUCT_DATA_CACHE_LOCK_TIMEOUT = config('PRODUCT_DATA_CACHE_LOCK_TIMEOUT', default=30, cast=int)
+PRODUCT_DATA_TIMEOUT = (5, 30)  # (connect, read)
+
+# Consulta de precios por lote (POST productos/precios/): máximo de códigos por
+# solicitud, códigos por llamada a product_data y llamadas en paralelo (nunca
+# más de la mitad del max_concurrent del bulkhead de ercules_product)
+PRODUCT_PRICE_BATCH_MAX = config('PRODUCT_PRICE_BATCH_MAX', default=500, cast=int)
+PRODUCT_PRICE_CHUNK_SIZE = config('PRODUCT_PRICE_CHUNK_SIZE', default=50, cast=int)
+PRODUCT_PRICE_MAX_WORKERS = config('PRODUCT_PRICE_MAX_WORKERS', default=3, cast=int)
+
+# Cliente HTTP de las APIs de Ercules (apps/core/ercules.py): reintentos de
+# los GET ante errores de conexión o 502/503/504, tamaño del pool por host y
+# timeouts (conexión, lectura) por endpoint, ej. {'clientes': (5, 60)}
+ERCULES_RETRIES = config('ERCULES_RETRIES', default=2, cast=int)
+# Segundos máximos de una llamada contando timeouts, reintentos y backoff. Debe
+# quedar por debajo del timeout de los workers de gunicorn (120s); cada
+# endpoint hace solo los reintentos que caben y su lectura se limita a este tope
+ERCULES_CALL_BUDGET = config('ERCULES_CALL_BUDGET', default=100, cast=int)
+ERCULES_RETRY_BACKOFF = config('ERCULES_RETRY_BACKOFF', default=0.5, cast=float)
+ERCULES_POOL_MAXSIZE = config('ERCULES_POOL_MAXSIZE', default=10, cast=int)
+ERCULES_TIMEOUTS = {}
+# Llamadas idénticas y concurrentes a Ercules se hacen una sola vez y se
+# comparte la respuesta (apps/core/singleflight.py)
+SINGLEFLIGHT_ENABLED = config('SINGLEFLIGHT_ENABLED', default=True, cast=bool)
+# Conexiones por event loop del cliente async (vistas proxy en modo ASGI)
+ERCULES_ASYNC_POOL_MAXSIZE = config('ERCULES_ASYNC_POOL_MAXSIZE', default=100, cast=int)
+
+# Modo del servidor (ver gunicorn.conf.py): 'wsgi' con workers sync o 'asgi'
+# con workers de uvicorn. En modo ASGI las vistas proxy de Ercules (almacenes,
+# pronóstico, clientes externos, validación, detalles y precio de productos)
+# se atienden con sus versiones async
+SERVER_MODE = config('SERVER_MODE', default='wsgi').lower()
+ASYNC_PROXY_VIEWS = config('ASYNC_PROXY_VIEWS', default=SERVER_MODE == 'asgi', cast=bool)
+
+# Sincronización incremental de productos: margen (segundos) que se resta a la
+# marca de agua para no perder cambios de transacciones largas del ERP
+PRODUCT_SYNC_OVERLAP_SECONDS = config('PRODUCT_SYNC_OVERLAP_SECONDS', default=120, cast=int)
+
+# Filas que se leen del ERP por viaje del cursor y productos por lote de upsert
+PRODUCT_SYNC_ITERSIZE = config('PRODUCT_SYNC_ITERSIZE', default=2000, cast=int)
+PRODUCT_SYNC_BATCH_SIZE = config('PRODUCT_SYNC_BATCH_SIZE', default=100, cast=int)
+
+# Productos por consulta de su estado actual (sync_hash e imagen) durante la sincronización
+PRODUCT_SYNC_LOOKUP_SIZE = config('PRODUCT_SYNC_LOOKUP_SIZE', default=1000, cast=int)
+
+# Upserts concurrentes a Supabase durante las sincronizaciones
+SYNC_UPSERT_MAX_WORKERS = config('SYNC_UPSERT_MAX_WORKERS', default=4, cast=int)
+SYNC_UPSERT_MAX_RETRIES = config('SYNC_UPSERT_MAX_RETRIES', default=5, cast=int)
+SYNC_UPSERT_TARGET_LATENCY = config('SYNC_UPSERT_TARGET_LATENCY', default=2.0, cast=float)  # segundos
+
+# Método de carga de las sincronizaciones: 'rest' (API de Supabase) o
+# 'copy' (COPY + INSERT ... ON CONFLICT por la conexión directa)
+SYNC_LOADER = config('SYNC_LOADER', default='rest')
+
+# Celery: las sincronizaciones lanzadas desde la API se ejecutan en los workers
+CELERY_BROKER_URL = config('CELERY_BROKER_URL', default=REDIS_URL or 'redis://localhost:6379/0')
+CELERY_RESULT_BACKEND = config('CELERY_RESULT_BACKEND', default=CELERY_BROKER_URL)
+CELERY_TASK_TRACK_STARTED = True
+
+# Segundos sin reportar avance tras los cuales una tarea activa se considera
+# abandonada y deja de bloquear nuevas ejecuciones (ver SyncTask)
+SYNC_TASK_STALE_SECONDS = config('SYNC_TASK_STALE_SECONDS', default=2 * 60 * 60, cast=int)
+
+# Líneas de cotización a partir de las cuales los cambios de un kit se
+# propagan en segundo plano (Celery) en lugar de dentro de la solicitud
+KIT_PROPAGATION_ASYNC_THRESHOLD = config('KIT_PROPAGATION_ASYNC_THRESHOLD', default=500, cast=int)
+
+# Conteos de la paginación: hasta este número de filas estimadas se cuenta
+# con COUNT(*), arriba se reporta el estimado del planificador. Los conteos se
+# guardan en caché por firma de filtros hasta la siguiente sincronización
+PAGINATION_EXACT_COUNT_THRESHOLD = config('PAGINATION_EXACT_COUNT_THRESHOLD', default=5000, cast=int)
+PAGINATION_COUNT_CACHE_TTL = config('PAGINATION_COUNT_CACHE_TTL', default=600, cast=int)
+
+# Capacidades del esquema conocidas de antemano ('tabla.columna': bool); las que
+# no aparezcan se consultan en la base de datos la primera vez que se usan
+# (ver apps/cotizador/schema.py)
+SCHEMA_CAPABILITIES = {}
+
 # Logging configuration
 import os
 
@@ -552,3 +659,9 @@ LOGGING = {
 
 # Odoo configuration
 ODOO_ENDPOINT = os.environ.get('ODOO_ENDPOINT', 'https://erp.portalgebesa.com/send_request?model=sale.order')
+ODOO_TIMEOUT = (10, 90)  # (connect, read)
+
+# Circuit breaker y bulkhead por servicio externo (apps/core/resilience.py).
+# Se combinan con resilience.DEFAULTS; 'default' aplica a todos, ej.
+# {'default': {'max_concurrent': 4}, 'odoo_order': {'reset_timeout': 60}}
+UPSTREAM_RESILIENCE = {}
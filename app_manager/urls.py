@@ -3,12 +3,16 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from .email_check import CheckEmailAPIView
+from .health import UpstreamHealthAPIView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     
     # Endpoint público para verificar emails (accesible sin autenticación)
     path('api/v1/check-email/', CheckEmailAPIView.as_view(), name='public-check-email'),
+
+    # Estado de los servicios externos (circuit breakers)
+    path('api/v1/health/upstreams/', UpstreamHealthAPIView.as_view(), name='health-upstreams'),
     
     # API v1 URLs
     path('api/v1/analytics/', include('apps.analytics.urls')),
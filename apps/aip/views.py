@@ -7,11 +7,11 @@ from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.response import Response
 from rest_framework import status
 import os
-import requests
 import json
 
 #Importamos la tabla de productos del cotizador para poder consultar la descripcion en espaniol
 from apps.cotizador.cache.models import ProductsCache
+from apps.core import ercules
 
 
 if not settings.OPENAI_API_KEY:
@@ -193,11 +193,20 @@ class UploadAIPXMLView(APIView):
 
             if claves_completas:
                 products_param = ",".join(claves_completas)
-                api_url = f"https://api2.ercules.mx/api/v1/common/product_data?user_id=2&products={products_param}&product_tmpl_ids=0&line_ids=0&group_ids=0&type_ids=0&family_ids=0&only_line=1"
+                params = {
+                    'user_id': 2,
+                    'products': products_param,
+                    'product_tmpl_ids': 0,
+                    'line_ids': 0,
+                    'group_ids': 0,
+                    'type_ids': 0,
+                    'family_ids': 0,
+                    'only_line': 1,
+                }
                 
                 try:
-                    print(f"Llamando a la API con URL: {api_url}")
-                    response = requests.get(api_url)
+                    print(f"Llamando a la API product_data con {len(claves_completas)} claves")
+                    response = ercules.get('product_data', params=params)
                     if response.status_code == 200:  
                         api_response = response.json()
                         print(f"Respuesta de la API")
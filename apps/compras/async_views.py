@@ -0,0 +1,146 @@
+"""
+Versiones async de las vistas proxy de compras (almacenes y pronóstico de
+existencias). Responden igual que AlmacenViewSet y PronosticoExistenciasAPIView;
+se enrutan en lugar de ellas cuando ASYNC_PROXY_VIEWS está activo.
+"""
+from rest_framework import status
+
+from apps.core import ercules
+from apps.core.async_views import api_response, async_api_view
+
+# Parámetros de la API externa para obtener almacenes
+ALMACENES_PARAMS = {
+    'user_id': 2,  # ID del usuario para la API externa
+    'classification': 0,
+    'names': 0
+}
+
+
+@async_api_view()
+async def almacenes_list(request):
+    """
+    Obtiene la lista de almacenes directamente desde la API externa
+    """
+    try:
+        response = await ercules.aget('almacenes', params=ALMACENES_PARAMS)
+
+        if response.status_code == 200:
+            return api_response(response.json())
+        else:
+            return api_response({
+                'status': 'error',
+                'message': f'Error en la API externa: {response.status_code}',
+                'detail': response.text
+            }, status=response.status_code)
+    except Exception as e:
+        return api_response({
+            'status': 'error',
+            'message': f'Error al consultar la API externa: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@async_api_view()
+async def almacenes_detail(request, pk=None):
+    """
+    Obtiene los detalles de un almacén específico directamente desde la API externa
+    """
+    try:
+        response = await ercules.aget('almacenes', params=ALMACENES_PARAMS)
+
+        if response.status_code == 200:
+            # Buscar el almacén específico por su ID
+            almacenes_data = response.json()
+            for item in almacenes_data.get('data', []):
+                if str(item.get('id')) == str(pk):
+                    return api_response(item)
+
+            # Si no se encuentra el almacén
+            return api_response({
+                'status': 'error',
+                'message': f'Almacén con ID {pk} no encontrado'
+            }, status=status.HTTP_404_NOT_FOUND)
+        else:
+            return api_response({
+                'status': 'error',
+                'message': f'Error en la API externa: {response.status_code}',
+                'detail': response.text
+            }, status=response.status_code)
+
+    except Exception as e:
+        return api_response({
+            'status': 'error',
+            'message': f'Error al consultar la API externa: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@async_api_view()
+async def almacenes_test_connection(request):
+    """
+    Verifica la conectividad con la API externa de almacenes
+    """
+    try:
+        response = await ercules.aget('almacenes', params=ALMACENES_PARAMS)
+
+        if response.status_code == 200:
+            return api_response({
+                'status': 'success',
+                'message': 'Conectividad con la API externa verificada correctamente',
+                'total_almacenes': len(response.json().get('data', []))
+            })
+        else:
+            return api_response({
+                'status': 'error',
+                'message': f'Error en la API externa: {response.status_code}',
+                'detail': response.text
+            }, status=response.status_code)
+
+    except Exception as e:
+        return api_response({
+            'status': 'error',
+            'message': f'Error al sincronizar almacenes: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@async_api_view()
+async def pronostico_existencias(request):
+    """
+    Obtiene los datos del pronóstico de existencias para almacenes y categorías especificadas
+    """
+    categ_ids = request.query_params.get('categ_ids')
+
+    # Validar parámetros requeridos
+    if not categ_ids:
+        return api_response({
+            'status': 'error',
+            'message': 'Se requiere el parámetro categ_ids'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    params = {
+        'user_id': 2,  # ID del usuario para la API externa
+        'warehouse_ids': request.query_params.get('warehouse_ids', '0'),
+        'categ_ids': categ_ids,
+        'group_ids': request.query_params.get('group_ids', '0'),
+        'line_ids': request.query_params.get('line_ids', '0'),
+        'products': request.query_params.get('products', '0'),
+        'codes': request.query_params.get('codes', '0'),
+        'order': request.query_params.get('order', 'consumption'),
+        'limit': request.query_params.get('limit', '100')
+    }
+
+    try:
+        response = await ercules.aget('pronostico_existencias', params=params)
+
+        if response.status_code == 200:
+            return api_response(response.json())
+        else:
+            return api_response({
+                'status': 'error',
+                'message': f'Error en la API externa: {response.status_code}',
+                'detail': response.text
+            }, status=status.HTTP_502_BAD_GATEWAY)
+
+    except Exception as e:
+        return api_response({
+            'status': 'error',
+            'message': f'Error al obtener pronóstico de existencias: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
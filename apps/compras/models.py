@@ -34,8 +34,8 @@ class Categoria(models.Model):
     def __str__(self):
         return f"{self.nombre} ({self.categoria_id})"
 
-import requests
 from rest_framework import status
+from apps.core import ercules
 
 class Almacen:
     """
@@ -43,7 +43,7 @@ class Almacen:
     Esta clase NO almacena datos localmente, sino que sirve como interfaz para la API externa.
     Todos los datos son consultados en tiempo real a la API externa cada vez que se necesitan.
     """
-    API_URL = 'https://api2.ercules.mx/api/v1/common/location_classifications'
+    API_URL = ercules.get_url('almacenes')
     
     @classmethod
     def obtener_parametros_api(cls):
@@ -74,7 +74,7 @@ class Almacen:
             if filtros and isinstance(filtros, dict):
                 params.update(filtros)
                 
-            response = requests.get(cls.API_URL, params=params)
+            response = ercules.get('almacenes', params=params)
             
             if response.status_code == 200:
                 return response.json()
@@ -4,6 +4,7 @@ import logging
 import unicodedata
 from django.conf import settings
 from decouple import config
+from apps.core import resilience
 
 logger = logging.getLogger(__name__)
 
@@ -132,7 +133,10 @@ class OdooService:
             logger.info(f"Headers prepared for Odoo. Login: {login_email_header}")
             logger.info(f"Payload to be sent to Odoo: {json.dumps(data, indent=2)}") # Added payload logging
 
-            response = requests.post(odoo_endpoint, json=data, headers=headers)
+            response = resilience.call(
+                'odoo_order', requests.post, odoo_endpoint,
+                json=data, headers=headers, timeout=settings.ODOO_TIMEOUT
+            )
             response.raise_for_status()  # Raise HTTPError for bad responses (4xx or 5xx)
             
             odoo_response_data = response.json()
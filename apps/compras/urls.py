@@ -1,4 +1,5 @@
-from django.urls import path, include
+from django.conf import settings
+from django.urls import path, re_path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
     CategoriaViewSet,
@@ -24,3 +25,14 @@ urlpatterns = [
     path('pronostico-existencias/', PronosticoExistenciasAPIView.as_view(), name='pronostico-existencias'),
     path('categorias-productos/', CategoriaProductoViewSet.as_view(), name='categorias-productos'),
 ]
+
+# Vistas proxy async (servidor ASGI): tienen prioridad sobre las del router
+if settings.ASYNC_PROXY_VIEWS:
+    from . import async_views
+
+    urlpatterns = [
+        path('almacenes/', async_views.almacenes_list, name='almacenes-list-async'),
+        path('almacenes/test_connection/', async_views.almacenes_test_connection, name='almacenes-test-connection-async'),
+        re_path(r'^almacenes/(?P<pk>[^/.]+)/$', async_views.almacenes_detail, name='almacenes-detail-async'),
+        path('pronostico-existencias/', async_views.pronostico_existencias, name='pronostico-existencias-async'),
+    ] + urlpatterns
@@ -16,6 +16,7 @@ logger = logging.getLogger(__name__) # Define logger for this module
 import requests
 import json
 from datetime import datetime, timedelta
+from apps.core import ercules
 from .services import OdooService, OdooAuthError, OdooApiError # Import custom exceptions
 from .serializers import (
     CategoriaSerializer,
@@ -140,8 +141,6 @@ class AlmacenViewSet(viewsets.ViewSet):
         """
         Obtiene la lista de almacenes directamente desde la API externa
         """
-        # URL de la API externa para obtener almacenes
-        api_url = 'https://api2.ercules.mx/api/v1/common/location_classifications'
         
         try:
             # Parámetros para la consulta
@@ -152,7 +151,7 @@ class AlmacenViewSet(viewsets.ViewSet):
             }
             
             # Realizar la solicitud a la API externa
-            response = requests.get(api_url, params=params)
+            response = ercules.get('almacenes', params=params)
             
             if response.status_code == 200:
                 return Response(response.json())
@@ -172,8 +171,6 @@ class AlmacenViewSet(viewsets.ViewSet):
         """
         Obtiene los detalles de un almacén específico directamente desde la API externa
         """
-        # URL de la API externa para obtener almacenes
-        api_url = 'https://api2.ercules.mx/api/v1/common/location_classifications'
         
         try:
             # Parámetros para la consulta
@@ -184,7 +181,7 @@ class AlmacenViewSet(viewsets.ViewSet):
             }
             
             # Realizar la solicitud a la API externa
-            response = requests.get(api_url, params=params)
+            response = ercules.get('almacenes', params=params)
             
             if response.status_code == 200:
                 # Buscar el almacén específico por su ID
@@ -216,8 +213,6 @@ class AlmacenViewSet(viewsets.ViewSet):
         """
         Verifica la conectividad con la API externa de almacenes
         """
-        # URL de la API externa para obtener almacenes
-        api_url = 'https://api2.ercules.mx/api/v1/common/location_classifications'
         
         try:
             # Parámetros para la consulta
@@ -228,7 +223,7 @@ class AlmacenViewSet(viewsets.ViewSet):
             }
             
             # Realizar la solicitud a la API externa
-            response = requests.get(api_url, params=params)
+            response = ercules.get('almacenes', params=params)
             
             if response.status_code == 200:
                 return Response({
@@ -260,8 +255,6 @@ class ProveedorViewSet(viewsets.ViewSet):
         """
         Obtiene la lista de proveedores directamente desde la API externa
         """
-        # URL de la API externa para obtener proveedores
-        api_url = 'https://api2.ercules.mx/api/v1/common/res_partner'
 
         # Obtener parámetros de la consulta, con valores por defecto razonables
         fecha_ini = request.query_params.get('fecha_ini', '2015-01-01')
@@ -283,7 +276,7 @@ class ProveedorViewSet(viewsets.ViewSet):
             }
 
             # Realizar la solicitud a la API externa
-            response = requests.get(api_url, params=params)
+            response = ercules.get('proveedores', params=params)
 
             if response.status_code == 200:
                 return Response(response.json())
@@ -321,8 +314,6 @@ class CategoriaProductoViewSet(APIView):
         """
         Obtiene la lista de categorías de productos desde la API externa
         """
-        # URL de la API externa para obtener categorías de productos
-        api_url = 'https://api2.ercules.mx/api/v1/common/product_classifications'
         
         try:
             # Parámetros para la consulta
@@ -333,7 +324,7 @@ class CategoriaProductoViewSet(APIView):
             }
             
             # Realizar la solicitud a la API externa
-            response = requests.get(api_url, params=params)
+            response = ercules.get('categorias_producto', params=params)
             
             if response.status_code == 200:
                 categorias_data = response.json()
@@ -410,8 +401,6 @@ class PronosticoExistenciasAPIView(APIView):
                 'message': 'Se requiere el parámetro categ_ids'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # URL de la API externa para pronóstico de existencias
-        api_url = 'https://api2.ercules.mx/api/v1/stock/stock_forecasting'
         
         try:
             # Parámetros para la consulta
@@ -428,7 +417,7 @@ class PronosticoExistenciasAPIView(APIView):
             }
             
             # Realizar la solicitud a la API externa
-            response = requests.get(api_url, params=params)
+            response = ercules.get('pronostico_existencias', params=params)
             
             if response.status_code == 200:
                 pronostico_data = response.json()
@@ -0,0 +1,96 @@
+"""
+Utilidades para vistas async que actúan como proxy de servicios externos.
+
+DRF 3.14 no soporta vistas async, así que estas vistas son funciones async de
+Django que reutilizan la autenticación (JWT), los límites de solicitudes
+(DEFAULT_THROTTLE_CLASSES) y el renderer JSON de DRF para responder igual que
+sus equivalentes síncronas. Solo se enrutan cuando
+ASYNC_PROXY_VIEWS está activo (ver gunicorn.conf.py, SERVER_MODE=asgi).
+
+Dentro de la vista, el ORM y los atributos relacionados del usuario se deben
+consultar con ``sync_to_async`` o con los métodos async del ORM (``aget``...).
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from rest_framework import exceptions, status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+
+def api_response(data, status=status.HTTP_200_OK, headers=None):
+    """Respuesta JSON con el mismo formato que ``rest_framework.response.Response``."""
+    response = HttpResponse(JSONRenderer().render(data), status=status, content_type='application/json')
+    for name, value in (headers or {}).items():
+        response[name] = value
+    return response
+
+
+def _authenticate(django_request):
+    authenticators = [auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+    request = Request(django_request, authenticators=authenticators)
+    # Forzar la autenticación aquí (hilo síncrono) y no dentro de la vista async
+    request.user
+    return request
+
+
+def _check_throttles(request, view):
+    """
+    Aplica DEFAULT_THROTTLE_CLASSES como ``APIView.check_throttles``: lanza
+    Throttled con la espera más larga si algún límite se excedió.
+    """
+    durations = []
+    for throttle_class in api_settings.DEFAULT_THROTTLE_CLASSES:
+        throttle = throttle_class()
+        if not throttle.allow_request(request, view):
+            durations.append(throttle.wait())
+    if durations:
+        durations = [duration for duration in durations if duration is not None]
+        raise exceptions.Throttled(max(durations, default=None))
+
+
+def async_api_view(methods=('GET',), authenticated=True):
+    """
+    Decorador para vistas async: valida el método, autentica con las clases
+    de DEFAULT_AUTHENTICATION_CLASSES, aplica DEFAULT_THROTTLE_CLASSES (429
+    con Retry-After) y pasa a la vista un ``Request`` de DRF.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                error = exceptions.MethodNotAllowed(request.method)
+                return api_response({'detail': error.detail}, status=error.status_code)
+
+            try:
+                drf_request = await sync_to_async(_authenticate)(request)
+            except exceptions.APIException as e:
+                return api_response({'detail': e.detail}, status=e.status_code)
+
+            if authenticated and not drf_request.user.is_authenticated:
+                error = exceptions.NotAuthenticated()
+                authenticator = drf_request.authenticators[0] if drf_request.authenticators else None
+                header = authenticator.authenticate_header(drf_request) if authenticator else None
+                return api_response(
+                    {'detail': error.detail},
+                    status=status.HTTP_401_UNAUTHORIZED if header else status.HTTP_403_FORBIDDEN,
+                    headers={'WWW-Authenticate': header} if header else None
+                )
+
+            try:
+                await sync_to_async(_check_throttles)(drf_request, view)
+            except exceptions.Throttled as e:
+                return api_response(
+                    {'detail': e.detail},
+                    status=e.status_code,
+                    headers={'Retry-After': '%d' % e.wait} if e.wait else None
+                )
+
+            return await view(drf_request, *args, **kwargs)
+
+        # Igual que APIView: la autenticación es por token, no por sesión
+        wrapper.csrf_exempt = True
+        return wrapper
+    return decorator
@@ -0,0 +1,379 @@
+"""
+Cliente HTTP compartido para las APIs de Ercules (api.ercules.mx y api2.ercules.mx).
+
+En lugar de un ``requests.get`` por llamada (un handshake TLS nuevo cada vez y,
+en la mayoría de los casos, sin timeout), todas las llamadas pasan por aquí:
+
+- Una ``requests.Session`` por proceso con pool de conexiones keep-alive. Se
+  crea de forma perezosa y se vuelve a crear si el proceso cambió (fork de
+  gunicorn o Celery).
+- Timeouts de conexión y lectura por endpoint (``ENDPOINTS``), que se pueden
+  ajustar con ``ERCULES_TIMEOUTS`` en settings.
+- Reintentos con backoff exponencial para los GET (idempotentes) ante errores
+  de conexión y respuestas 502/503/504.
+- Un tope por llamada (``ERCULES_CALL_BUDGET``) para el peor caso de timeouts
+  más reintentos: cada endpoint hace solo los reintentos que caben en él, así
+  un servicio lento no retiene al worker hasta que gunicorn lo mata.
+- Métricas por endpoint (solicitudes, errores y latencia) en la caché de
+  Django, compartidas por todos los workers.
+- Circuit breaker y bulkhead por servicio (apps/core/resilience.py).
+- Las llamadas idénticas y concurrentes (mismo endpoint y parámetros) se
+  hacen una sola vez y su respuesta se comparte entre workers
+  (apps/core/singleflight.py).
+
+Las vistas async usan ``aget``, con un ``httpx.AsyncClient`` por event loop y
+los mismos timeouts, reintentos, métricas y circuit breaker. Los errores de
+conexión se convierten a las excepciones de ``requests`` para que el código
+que llama maneje igual ambos caminos.
+
+Uso:
+    from apps.core import ercules
+    response = ercules.get('almacenes', params={'user_id': 2, 'classification': 0, 'names': 0})
+    response = await ercules.aget('almacenes', params={...})
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+import weakref
+
+import httpx
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.util.retry import Retry
+
+from . import resilience, singleflight
+
+logger = logging.getLogger(__name__)
+
+BASE_URLS = {
+    'api': 'https://api.ercules.mx/api/v1',
+    'api2': 'https://api2.ercules.mx/api/v1',
+}
+
+# nombre: (api, ruta, (timeout de conexión, timeout de lectura), servicio)
+# El servicio agrupa los endpoints que comparten circuit breaker y bulkhead
+# (ver apps/core/resilience.py)
+ENDPOINTS = {
+    'almacenes': ('api2', 'common/location_classifications', (5, 30), 'ercules_stock'),
+    'proveedores': ('api2', 'common/res_partner', (5, 60), 'ercules_partner'),
+    'clientes': ('api', 'common/res_partner', (5, 90), 'ercules_partner'),
+    'categorias_producto': ('api2', 'common/product_classifications', (5, 30), 'ercules_product'),
+    'pronostico_existencias': ('api2', 'stock/stock_forecasting', (5, 60), 'ercules_stock'),
+    'product_data': ('api2', 'common/product_data', (5, 30), 'ercules_product'),
+}
+
+KEY_PREFIX = 'ercules'
+STATS_KEYS = ('requests', 'errors', 'latency_ms')
+
+_RETRY_STATUSES = (502, 503, 504)
+_TRANSPORT_HEADERS = ('content-encoding', 'content-length', 'transfer-encoding', 'connection')
+
+_lock = threading.Lock()
+# Una sesión por número de reintentos (el Retry de urllib3 es por adaptador)
+_sessions = {}
+_sessions_pid = None
+
+# Un AsyncClient por event loop: un cliente no se puede usar desde otro loop
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def _get_setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _build_session(retries):
+    retries = Retry(
+        total=retries,
+        backoff_factor=_get_setting('ERCULES_RETRY_BACKOFF', 0.5),
+        status_forcelist=_RETRY_STATUSES,
+        allowed_methods=frozenset(['GET']),
+        raise_on_status=False,
+    )
+    pool_size = _get_setting('ERCULES_POOL_MAXSIZE', 10)
+    adapter = HTTPAdapter(max_retries=retries, pool_connections=len(BASE_URLS), pool_maxsize=pool_size)
+
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session(retries=None):
+    """
+    Retorna la sesión del proceso actual con ``retries`` reintentos (por
+    defecto ERCULES_RETRIES), creándola si hace falta.
+    """
+    global _sessions_pid
+    if retries is None:
+        retries = _get_setting('ERCULES_RETRIES', 2)
+    pid = os.getpid()
+    session = _sessions.get(retries) if _sessions_pid == pid else None
+    if session is None:
+        with _lock:
+            if _sessions_pid != pid:
+                _sessions.clear()
+                _sessions_pid = pid
+            session = _sessions.get(retries)
+            if session is None:
+                session = _sessions[retries] = _build_session(retries)
+    return session
+
+
+def get_url(endpoint):
+    """URL completa de un endpoint registrado."""
+    api, path = ENDPOINTS[endpoint][:2]
+    return f"{BASE_URLS[api]}/{path}"
+
+
+def _call_budget():
+    return _get_setting('ERCULES_CALL_BUDGET', 100)
+
+
+def _cap_timeout(timeout):
+    """Limita la lectura para que un solo intento quepa en ERCULES_CALL_BUDGET."""
+    connect, read = timeout
+    return connect, min(read, max(1, _call_budget() - connect))
+
+
+def _worst_case(timeout, retries):
+    """Segundos que puede tardar una llamada: todos los intentos más el backoff."""
+    backoff = _get_setting('ERCULES_RETRY_BACKOFF', 0.5)
+    return (retries + 1) * sum(timeout) + sum(backoff * (2 ** attempt) for attempt in range(retries))
+
+
+def get_timeout(endpoint, timeout=None):
+    """
+    Timeout (conexión, lectura) de un endpoint, con la configuración de
+    settings (o ``timeout`` si se indica), limitado por ERCULES_CALL_BUDGET.
+    """
+    if timeout is None:
+        overrides = _get_setting('ERCULES_TIMEOUTS', {})
+        timeout = overrides.get(endpoint, ENDPOINTS[endpoint][2])
+    return _cap_timeout(timeout)
+
+
+def get_retries(endpoint, timeout=None):
+    """
+    Reintentos de un endpoint: hasta ERCULES_RETRIES, pero solo los que caben
+    en ERCULES_CALL_BUDGET con su timeout.
+    """
+    timeout = get_timeout(endpoint, timeout)
+    retries = _get_setting('ERCULES_RETRIES', 2)
+    while retries > 0 and _worst_case(timeout, retries) > _call_budget():
+        retries -= 1
+    return retries
+
+
+def get_max_duration(endpoint, timeout=None):
+    """Segundos que puede tardar como máximo una llamada al endpoint, con reintentos."""
+    timeout = get_timeout(endpoint, timeout)
+    return _worst_case(timeout, get_retries(endpoint, timeout))
+
+
+def _incr_stat(endpoint, name, amount=1):
+    key = f'{KEY_PREFIX}:stats:{endpoint}:{name}'
+    try:
+        cache.add(key, 0, timeout=None)
+        cache.incr(key, amount)
+    except ValueError:
+        cache.set(key, amount, timeout=None)
+    except Exception as e:
+        # Las métricas nunca deben romper la llamada a la API
+        logger.debug(f"No se pudo actualizar la métrica {key}: {str(e)}")
+
+
+def _record(endpoint, elapsed, error):
+    _incr_stat(endpoint, 'requests')
+    _incr_stat(endpoint, 'latency_ms', int(elapsed * 1000))
+    if error:
+        _incr_stat(endpoint, 'errors')
+
+
+def _snapshot(response):
+    """Copia serializable de una respuesta, para compartirla entre workers."""
+    # El contenido ya está descomprimido: no copiar las cabeceras de transporte
+    headers = {
+        name: value for name, value in response.headers.items()
+        if name.lower() not in _TRANSPORT_HEADERS
+    }
+    return {
+        'status_code': response.status_code,
+        'content': response.content,
+        'headers': headers,
+        'url': str(response.url),
+    }
+
+
+def _flight(endpoint, params, timeout):
+    """Llave y duración del lock de singleflight para una llamada."""
+    key = singleflight.build_key(endpoint, params)
+    # El lock debe durar lo que la llamada con todos sus reintentos; si vence
+    # antes, los que esperan llaman al servicio por su cuenta
+    lock_timeout = int(get_max_duration(endpoint, timeout)) + 5
+    return key, lock_timeout
+
+
+def get(endpoint, params=None, timeout=None):
+    """
+    GET a un endpoint registrado en ``ENDPOINTS``. Retorna el
+    ``requests.Response``; los errores de conexión se propagan como
+    ``requests.exceptions.RequestException`` después de los reintentos, y
+    ``resilience.UpstreamUnavailable`` si el servicio está caído o saturado.
+    """
+    key, lock_timeout = _flight(endpoint, params, timeout)
+    snapshot = singleflight.do(
+        endpoint, key, lambda: _snapshot(_get(endpoint, params, timeout)), lock_timeout=lock_timeout
+    )
+
+    response = requests.Response()
+    response.status_code = snapshot['status_code']
+    response._content = snapshot['content']
+    response.headers = CaseInsensitiveDict(snapshot['headers'])
+    response.url = snapshot['url']
+    response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+    return response
+
+
+def _get(endpoint, params=None, timeout=None):
+    url = get_url(endpoint)
+    upstream = ENDPOINTS[endpoint][3]
+    start = time.monotonic()
+    try:
+        response = resilience.call(
+            upstream, get_session(get_retries(endpoint, timeout)).get, url,
+            params=params, timeout=get_timeout(endpoint, timeout),
+            max_duration=get_max_duration(endpoint, timeout)
+        )
+    except requests.exceptions.RequestException as e:
+        elapsed = time.monotonic() - start
+        _record(endpoint, elapsed, error=True)
+        logger.warning(f"Ercules {endpoint}: error después de {elapsed:.2f}s: {str(e)}")
+        raise
+
+    elapsed = time.monotonic() - start
+    _record(endpoint, elapsed, error=response.status_code >= 500)
+    logger.info(f"Ercules {endpoint}: {response.status_code} en {elapsed:.2f}s")
+    return response
+
+
+def get_async_client():
+    """Retorna el AsyncClient del event loop actual, creándolo si hace falta."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        pool_size = _get_setting('ERCULES_ASYNC_POOL_MAXSIZE', 100)
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+        _async_clients[loop] = client
+    return client
+
+
+def _as_requests_error(error):
+    """Convierte un error de httpx en la excepción equivalente de requests."""
+    if isinstance(error, httpx.TimeoutException):
+        return requests.exceptions.Timeout(str(error))
+    return requests.exceptions.ConnectionError(str(error))
+
+
+async def _aget_with_retries(url, params, timeout, retries):
+    connect, read = timeout
+    timeout = httpx.Timeout(read, connect=connect)
+    backoff = _get_setting('ERCULES_RETRY_BACKOFF', 0.5)
+
+    for attempt in range(retries + 1):
+        try:
+            response = await get_async_client().get(url, params=params, timeout=timeout)
+        except httpx.TransportError as e:
+            if attempt == retries:
+                raise _as_requests_error(e) from e
+        else:
+            if response.status_code not in _RETRY_STATUSES or attempt == retries:
+                return response
+        await asyncio.sleep(backoff * (2 ** attempt))
+
+
+async def aget(endpoint, params=None, timeout=None):
+    """
+    Versión async de ``get``. Retorna un ``httpx.Response`` (misma interfaz
+    que usan las vistas: ``status_code``, ``json()`` y ``text``).
+    """
+    async def request():
+        return _snapshot(await _aget(endpoint, params, timeout))
+
+    key, lock_timeout = _flight(endpoint, params, timeout)
+    snapshot = await singleflight.ado(endpoint, key, request, lock_timeout=lock_timeout)
+    return httpx.Response(
+        snapshot['status_code'],
+        content=snapshot['content'],
+        headers=snapshot['headers'],
+        request=httpx.Request('GET', snapshot['url']),
+    )
+
+
+async def _aget(endpoint, params=None, timeout=None):
+    url = get_url(endpoint)
+    upstream = ENDPOINTS[endpoint][3]
+    record = sync_to_async(_record, thread_sensitive=False)
+    start = time.monotonic()
+    try:
+        response = await resilience.acall(
+            upstream, _aget_with_retries, url, params,
+            get_timeout(endpoint, timeout), get_retries(endpoint, timeout),
+            max_duration=get_max_duration(endpoint, timeout)
+        )
+    except requests.exceptions.RequestException as e:
+        elapsed = time.monotonic() - start
+        await record(endpoint, elapsed, error=True)
+        logger.warning(f"Ercules {endpoint}: error después de {elapsed:.2f}s: {str(e)}")
+        raise
+
+    elapsed = time.monotonic() - start
+    await record(endpoint, elapsed, error=response.status_code >= 500)
+    logger.info(f"Ercules {endpoint}: {response.status_code} en {elapsed:.2f}s")
+    return response
+
+
+def get_stats():
+    """
+    Contadores acumulados por endpoint: solicitudes, errores, tasa de error,
+    latencia promedio en milisegundos y llamadas ahorradas por singleflight.
+    """
+    keys = [
+        f'{KEY_PREFIX}:stats:{endpoint}:{name}'
+        for endpoint in ENDPOINTS for name in STATS_KEYS
+    ]
+    values = cache.get_many(keys)
+    coalescing = singleflight.get_stats(list(ENDPOINTS))
+
+    stats = {}
+    for endpoint in ENDPOINTS:
+        counters = {name: values.get(f'{KEY_PREFIX}:stats:{endpoint}:{name}', 0) for name in STATS_KEYS}
+        total = counters['requests']
+        stats[endpoint] = {
+            'url': get_url(endpoint),
+            'upstream': ENDPOINTS[endpoint][3],
+            'timeout': list(get_timeout(endpoint)),
+            'retries': get_retries(endpoint),
+            'requests': total,
+            'errors': counters['errors'],
+            'error_rate': round(counters['errors'] / total, 4) if total else 0.0,
+            'avg_latency_ms': round(counters['latency_ms'] / total, 1) if total else 0.0,
+            'singleflight': coalescing[endpoint],
+        }
+    return stats
+
+
+def reset_stats():
+    """Reinicia los contadores de todos los endpoints."""
+    cache.delete_many([
+        f'{KEY_PREFIX}:stats:{endpoint}:{name}'
+        for endpoint in ENDPOINTS for name in STATS_KEYS
+    ])
+    singleflight.reset_stats(list(ENDPOINTS))
@@ -0,0 +1,305 @@
+"""
+Circuit breaker y bulkhead para las llamadas a servicios externos (Ercules y Odoo).
+
+Cuando un servicio externo se vuelve lento, cada worker sync de gunicorn queda
+bloqueado esperando su respuesta y el resto de los endpoints (por ejemplo el
+CRUD de cotizaciones) se queda sin workers. Este módulo limita el daño por
+servicio (``UPSTREAMS``):
+
+- Circuit breaker: después de ``failure_threshold`` fallas (error de conexión,
+  timeout o status >= 500) dentro de ``failure_window`` segundos, el circuito
+  se abre y las llamadas fallan de inmediato durante ``reset_timeout``
+  segundos. Después se deja pasar una sola llamada de prueba (medio abierto):
+  si responde bien el circuito se cierra, si no se vuelve a abrir.
+- Bulkhead: como máximo ``max_concurrent`` workers pueden estar esperando al
+  mismo servicio. Cada lugar es una llave en la caché con vencimiento, para
+  que un worker que muere no lo retenga para siempre. El vencimiento se toma
+  de la duración máxima de la llamada (``max_duration``, o el ``timeout`` de
+  la llamada) más un margen, así el lugar no se libera mientras sigue en curso.
+
+El estado vive en la caché de Django (Redis en producción), por lo que todos
+los workers lo comparten. Los valores se pueden ajustar por servicio con
+``UPSTREAM_RESILIENCE`` en settings.
+
+En las vistas async (``acall``) una llamada en espera no ocupa un worker, así
+que el bulkhead es un semáforo por proceso con ``max_concurrent_async``
+lugares; el circuit breaker es el mismo.
+
+Uso:
+    response = resilience.call('odoo_order', requests.post, url, data=payload, timeout=(5, 90))
+    response = resilience.call('ercules_stock', session.get, url, timeout=(5, 30), max_duration=70.5)
+    response = await resilience.acall('ercules_stock', coroutine_function, *args, max_duration=70.5)
+"""
+import asyncio
+import logging
+import time
+import uuid
+import weakref
+
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'failure_threshold': 5,
+    'failure_window': 60,
+    'reset_timeout': 30,
+    'max_concurrent': 4,
+    # Vigencia de un lugar del bulkhead cuando no se conoce la duración
+    # máxima de la llamada
+    'lease': 150,
+    # Segundos que se agregan a la duración máxima de la llamada
+    'lease_margin': 10,
+    # Llamadas simultáneas por proceso desde vistas async
+    'max_concurrent_async': 100,
+}
+
+UPSTREAMS = {
+    'ercules_product': 'Ercules productos (product_data, clasificaciones)',
+    'ercules_stock': 'Ercules almacenes y pronóstico de existencias',
+    'ercules_partner': 'Ercules clientes y proveedores',
+    'odoo_order': 'Odoo órdenes de venta y compra',
+}
+
+KEY_PREFIX = 'upstream'
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+# Semáforos del bulkhead async por event loop y servicio
+_async_bulkheads = weakref.WeakKeyDictionary()
+
+
+class UpstreamUnavailable(requests.exceptions.RequestException):
+    """
+    La llamada no se hizo porque el servicio está marcado como caído o saturado.
+    Hereda de RequestException para que los manejadores existentes la traten
+    como cualquier otro error de conexión.
+    """
+
+    def __init__(self, upstream, reason):
+        self.upstream = upstream
+        self.reason = reason
+        super().__init__(f"Servicio {upstream} no disponible: {reason}")
+
+
+class CircuitOpenError(UpstreamUnavailable):
+    """El circuit breaker del servicio está abierto."""
+
+    def __init__(self, upstream):
+        super().__init__(upstream, 'circuito abierto')
+
+
+class BulkheadFullError(UpstreamUnavailable):
+    """Ya hay demasiadas llamadas en curso al servicio."""
+
+    def __init__(self, upstream):
+        super().__init__(upstream, 'demasiadas llamadas en curso')
+
+
+def get_config(upstream):
+    """Configuración del servicio: DEFAULTS combinados con UPSTREAM_RESILIENCE."""
+    overrides = getattr(settings, 'UPSTREAM_RESILIENCE', {})
+    return {**DEFAULTS, **overrides.get('default', {}), **overrides.get(upstream, {})}
+
+
+def _key(upstream, name):
+    return f'{KEY_PREFIX}:{upstream}:{name}'
+
+
+def _lease(config, max_duration=None, timeout=None):
+    """
+    Vigencia de un lugar del bulkhead o de la llave de prueba: la duración
+    máxima de la llamada (o su timeout, si no hace reintentos) más un margen.
+    """
+    if max_duration is None and timeout is not None:
+        max_duration = sum(timeout) if isinstance(timeout, (tuple, list)) else timeout
+    if max_duration is None:
+        return config['lease']
+    return int(max_duration + config['lease_margin']) + 1
+
+
+# --- Circuit breaker ---
+
+def get_state(upstream):
+    """Estado actual del circuito: closed, open o half_open."""
+    if cache.get(_key(upstream, 'open')):
+        return STATE_OPEN
+    if cache.get(_key(upstream, 'tripped')):
+        return STATE_HALF_OPEN
+    return STATE_CLOSED
+
+
+def _allow(upstream, config, lease):
+    """
+    Indica si se puede llamar al servicio. En medio abierto solo el worker que
+    obtiene la llave de prueba hace la llamada.
+    """
+    state = get_state(upstream)
+    if state == STATE_CLOSED:
+        return True
+    if state == STATE_OPEN:
+        return False
+    return cache.add(_key(upstream, 'probe'), 1, timeout=lease)
+
+
+def _open(upstream, config):
+    # 'open' vence después de reset_timeout (pasa a medio abierto); 'tripped'
+    # dura más para recordar que la siguiente llamada es una prueba
+    cache.set(_key(upstream, 'open'), time.time() + config['reset_timeout'], timeout=config['reset_timeout'])
+    cache.set(_key(upstream, 'tripped'), 1, timeout=config['reset_timeout'] + config['lease'])
+    cache.delete_many([_key(upstream, 'failures'), _key(upstream, 'probe')])
+    logger.warning(f"Circuito abierto para {upstream} durante {config['reset_timeout']}s")
+
+
+def record_success(upstream):
+    """Una llamada exitosa cierra el circuito si estaba en prueba."""
+    if cache.get(_key(upstream, 'tripped')):
+        cache.delete_many([_key(upstream, 'tripped'), _key(upstream, 'probe'), _key(upstream, 'failures')])
+        logger.info(f"Circuito cerrado para {upstream}")
+
+
+def record_failure(upstream):
+    """Registra una falla y abre el circuito al llegar al umbral."""
+    config = get_config(upstream)
+    if cache.get(_key(upstream, 'tripped')):
+        # Falló la llamada de prueba
+        _open(upstream, config)
+        return
+
+    key = _key(upstream, 'failures')
+    cache.add(key, 0, timeout=config['failure_window'])
+    try:
+        failures = cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=config['failure_window'])
+        failures = 1
+    if failures >= config['failure_threshold']:
+        _open(upstream, config)
+
+
+# --- Bulkhead ---
+
+def _acquire_slot(upstream, config, lease):
+    """Toma un lugar libre del bulkhead; retorna su llave o None si están ocupados."""
+    token = uuid.uuid4().hex
+    for slot in range(config['max_concurrent']):
+        key = _key(upstream, f'slot:{slot}')
+        if cache.add(key, token, timeout=lease):
+            return key
+    return None
+
+
+def _in_flight(upstream, config):
+    keys = [_key(upstream, f'slot:{slot}') for slot in range(config['max_concurrent'])]
+    return len(cache.get_many(keys))
+
+
+# --- Llamadas ---
+
+def _is_failure(response):
+    return getattr(response, 'status_code', 0) >= 500
+
+
+def call(upstream, func, *args, max_duration=None, **kwargs):
+    """
+    Ejecuta ``func(*args, **kwargs)`` (normalmente ``requests.get/post`` o un
+    método de una sesión) protegida por el circuit breaker y el bulkhead del
+    servicio. Lanza CircuitOpenError o BulkheadFullError sin llamar al
+    servicio cuando corresponde.
+
+    ``max_duration`` son los segundos que puede tardar la llamada contando sus
+    reintentos; si no se indica se usa el ``timeout`` de la llamada.
+    """
+    config = get_config(upstream)
+    lease = _lease(config, max_duration, kwargs.get('timeout'))
+    if not _allow(upstream, config, lease):
+        raise CircuitOpenError(upstream)
+
+    slot = _acquire_slot(upstream, config, lease)
+    if slot is None:
+        cache.delete(_key(upstream, 'probe'))
+        logger.warning(f"Bulkhead lleno para {upstream} ({config['max_concurrent']} llamadas en curso)")
+        raise BulkheadFullError(upstream)
+
+    try:
+        response = func(*args, **kwargs)
+    except requests.exceptions.RequestException:
+        record_failure(upstream)
+        raise
+    finally:
+        cache.delete(slot)
+
+    if _is_failure(response):
+        record_failure(upstream)
+    else:
+        record_success(upstream)
+    return response
+
+
+def _async_bulkhead(upstream, config):
+    semaphores = _async_bulkheads.setdefault(asyncio.get_running_loop(), {})
+    if upstream not in semaphores:
+        semaphores[upstream] = asyncio.Semaphore(config['max_concurrent_async'])
+    return semaphores[upstream]
+
+
+async def acall(upstream, func, *args, max_duration=None, **kwargs):
+    """
+    Versión async de ``call``: ``func`` es una función async. El estado del
+    circuito se consulta y actualiza en la caché compartida.
+    """
+    config = get_config(upstream)
+    lease = _lease(config, max_duration, kwargs.get('timeout'))
+    if not await sync_to_async(_allow, thread_sensitive=False)(upstream, config, lease):
+        raise CircuitOpenError(upstream)
+
+    semaphore = _async_bulkhead(upstream, config)
+    if semaphore.locked():
+        await sync_to_async(cache.delete, thread_sensitive=False)(_key(upstream, 'probe'))
+        logger.warning(f"Bulkhead async lleno para {upstream} ({config['max_concurrent_async']} llamadas en curso)")
+        raise BulkheadFullError(upstream)
+
+    async with semaphore:
+        try:
+            response = await func(*args, **kwargs)
+        except requests.exceptions.RequestException:
+            await sync_to_async(record_failure, thread_sensitive=False)(upstream)
+            raise
+
+    if _is_failure(response):
+        await sync_to_async(record_failure, thread_sensitive=False)(upstream)
+    else:
+        await sync_to_async(record_success, thread_sensitive=False)(upstream)
+    return response
+
+
+def get_health():
+    """Estado del circuito y ocupación del bulkhead de cada servicio."""
+    health = {}
+    for upstream, description in UPSTREAMS.items():
+        config = get_config(upstream)
+        open_until = cache.get(_key(upstream, 'open'))
+        health[upstream] = {
+            'description': description,
+            'state': get_state(upstream),
+            'recent_failures': cache.get(_key(upstream, 'failures'), 0),
+            'failure_threshold': config['failure_threshold'],
+            'retry_in_seconds': max(0, round(open_until - time.time(), 1)) if open_until else 0,
+            'in_flight': _in_flight(upstream, config),
+            'max_concurrent': config['max_concurrent'],
+        }
+    return health
+
+
+def reset(upstream):
+    """Cierra el circuito y libera el bulkhead de un servicio."""
+    config = get_config(upstream)
+    cache.delete_many(
+        [_key(upstream, name) for name in ('open', 'tripped', 'probe', 'failures')]
+        + [_key(upstream, f'slot:{slot}') for slot in range(config['max_concurrent'])]
+    )
@@ -0,0 +1,244 @@
+"""
+Coalescencia de llamadas idénticas y concurrentes (singleflight) entre workers.
+
+Cuando varias solicitudes piden lo mismo al mismo tiempo (por ejemplo, un
+equipo de ventas abriendo la misma cotización), solo la primera hace la
+llamada externa; las demás esperan su resultado y lo comparten:
+
+- El primero que obtiene el lock de la llave (``cache.add``) es el líder:
+  guarda en el lock un id de vuelo, ejecuta la función y libera el lock. Solo
+  si alguien se registró como en espera guarda el resultado bajo ese id
+  durante ``RESULT_TTL`` segundos; sin esperas no escribe nada en la caché.
+- Los demás leen el id de vuelo del lock, se registran como en espera y
+  sondean la caché hasta ver el resultado de ese vuelo. Si el líder falló con un error de ``requests`` (o
+  de ``resilience``) se propaga el mismo tipo de error; si el lock vence o
+  desaparece sin resultado, hacen la llamada ellos mismos.
+
+No es una caché: una vez liberado el lock, la siguiente llamada inicia un vuelo
+nuevo y vuelve a ir al servicio externo; el resultado de un vuelo anterior no
+se reutiliza. Los resultados deben ser serializables por la caché.
+
+Los contadores (líderes, llamadas ahorradas y esperas sin resultado) se
+guardan por espacio de nombres en la misma caché.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import time
+import uuid
+
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from . import resilience
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'singleflight'
+STATS_KEYS = ('leaders', 'saved', 'fallbacks')
+
+# Segundos que el resultado queda disponible para los que esperan
+RESULT_TTL = 10
+# Intervalo de sondeo mientras otro worker hace la llamada
+_WAIT_INTERVAL = 0.05
+
+
+def build_key(namespace, params):
+    """Llave estable para un espacio de nombres y sus parámetros."""
+    payload = json.dumps(params or {}, sort_keys=True, default=str)
+    digest = hashlib.sha1(payload.encode('utf-8')).hexdigest()
+    return f'{namespace}:{digest}'
+
+
+def is_enabled():
+    return getattr(settings, 'SINGLEFLIGHT_ENABLED', True)
+
+
+def _incr_stat(namespace, name):
+    key = f'{KEY_PREFIX}:stats:{namespace}:{name}'
+    try:
+        cache.add(key, 0, timeout=None)
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+    except Exception as e:
+        logger.debug(f"No se pudo actualizar la métrica {key}: {str(e)}")
+
+
+def _result_key(key, flight):
+    return f'{KEY_PREFIX}:{key}:result:{flight}'
+
+
+def _waiters_key(key, flight):
+    return f'{KEY_PREFIX}:{key}:waiters:{flight}'
+
+
+def _register_waiter(key, flight, lock_timeout):
+    """Avisa al líder del vuelo que hay alguien esperando su resultado."""
+    waiters_key = _waiters_key(key, flight)
+    try:
+        cache.add(waiters_key, 0, timeout=lock_timeout)
+        cache.incr(waiters_key)
+    except ValueError:
+        cache.set(waiters_key, 1, timeout=lock_timeout)
+
+
+def _publish(key, flight, entry):
+    """
+    Guarda el resultado del vuelo solo si alguien lo está esperando: sin
+    esperas no se escribe la respuesta (que puede ser grande) en la caché.
+    """
+    if cache.get(_waiters_key(key, flight)):
+        cache.set(_result_key(key, flight), entry, timeout=RESULT_TTL)
+
+
+def _error_payload(error):
+    payload = {'error': str(error), 'error_type': type(error).__name__}
+    if isinstance(error, resilience.UpstreamUnavailable):
+        payload['upstream'] = error.upstream
+        payload['reason'] = error.reason
+    return payload
+
+
+def _rebuild_error(entry):
+    """Recrea el error del líder con su mismo tipo."""
+    if 'upstream' in entry:
+        if entry['error_type'] == resilience.CircuitOpenError.__name__:
+            return resilience.CircuitOpenError(entry['upstream'])
+        if entry['error_type'] == resilience.BulkheadFullError.__name__:
+            return resilience.BulkheadFullError(entry['upstream'])
+        return resilience.UpstreamUnavailable(entry['upstream'], entry['reason'])
+    error_class = getattr(requests.exceptions, entry['error_type'], requests.exceptions.RequestException)
+    return error_class(entry['error'])
+
+
+def _unwrap(entry):
+    """Retorna el resultado compartido o lanza el error del líder."""
+    if 'error' in entry:
+        raise _rebuild_error(entry)
+    return entry['result']
+
+
+def _release(lock_key, flight):
+    # Si el lock venció y ya es de otro vuelo, no borrarlo
+    if cache.get(lock_key) == flight:
+        cache.delete(lock_key)
+
+
+def _lead(namespace, key, lock_key, flight, func):
+    _incr_stat(namespace, 'leaders')
+    try:
+        result = func()
+    except requests.exceptions.RequestException as e:
+        _publish(key, flight, _error_payload(e))
+        raise
+    else:
+        _publish(key, flight, {'result': result})
+        return result
+    finally:
+        _release(lock_key, flight)
+
+
+def do(namespace, key, func, lock_timeout=30):
+    """
+    Ejecuta ``func()`` una sola vez para todas las llamadas concurrentes con
+    la misma llave y retorna su resultado a cada una.
+
+    Cada líder guarda un id de vuelo en el lock y su resultado bajo ese id;
+    los demás solo leen el resultado del vuelo que vieron en el lock, nunca el
+    de un vuelo anterior.
+    """
+    if not is_enabled():
+        return func()
+
+    lock_key = f'{KEY_PREFIX}:{key}:lock'
+    flight = uuid.uuid4().hex
+    leader = None
+    deadline = time.time() + lock_timeout
+
+    while time.time() < deadline:
+        if leader is None:
+            if cache.add(lock_key, flight, timeout=lock_timeout):
+                return _lead(namespace, key, lock_key, flight, func)
+            # Si el lock se liberó entre add y get, volver a intentar tomarlo
+            leader = cache.get(lock_key)
+            if leader is not None:
+                _register_waiter(key, leader, lock_timeout)
+            continue
+
+        # Otro worker ya está haciendo la misma llamada: esperar su resultado
+        time.sleep(_WAIT_INTERVAL)
+        entry = cache.get(_result_key(key, leader))
+        if entry is None and cache.get(lock_key) != leader:
+            # El líder terminó o su lock venció: el resultado pudo llegar justo antes
+            entry = cache.get(_result_key(key, leader))
+            if entry is None:
+                break
+        if entry is not None:
+            _incr_stat(namespace, 'saved')
+            return _unwrap(entry)
+
+    _incr_stat(namespace, 'fallbacks')
+    return func()
+
+
+async def ado(namespace, key, func, lock_timeout=30):
+    """Versión async de ``do``: ``func`` es una función async."""
+    if not is_enabled():
+        return await func()
+
+    lock_key = f'{KEY_PREFIX}:{key}:lock'
+    flight = uuid.uuid4().hex
+    leader = None
+    deadline = time.time() + lock_timeout
+    incr_stat = sync_to_async(_incr_stat, thread_sensitive=False)
+
+    while time.time() < deadline:
+        if leader is None:
+            if await cache.aadd(lock_key, flight, timeout=lock_timeout):
+                await incr_stat(namespace, 'leaders')
+                publish = sync_to_async(_publish, thread_sensitive=False)
+                try:
+                    result = await func()
+                except requests.exceptions.RequestException as e:
+                    await publish(key, flight, _error_payload(e))
+                    raise
+                else:
+                    await publish(key, flight, {'result': result})
+                    return result
+                finally:
+                    await sync_to_async(_release, thread_sensitive=False)(lock_key, flight)
+            leader = await cache.aget(lock_key)
+            if leader is not None:
+                await sync_to_async(_register_waiter, thread_sensitive=False)(key, leader, lock_timeout)
+            continue
+
+        await asyncio.sleep(_WAIT_INTERVAL)
+        entry = await cache.aget(_result_key(key, leader))
+        if entry is None and await cache.aget(lock_key) != leader:
+            entry = await cache.aget(_result_key(key, leader))
+            if entry is None:
+                break
+        if entry is not None:
+            await incr_stat(namespace, 'saved')
+            return _unwrap(entry)
+
+    await incr_stat(namespace, 'fallbacks')
+    return await func()
+
+
+def get_stats(namespaces):
+    """Contadores por espacio de nombres: líderes, llamadas ahorradas y esperas sin resultado."""
+    keys = [f'{KEY_PREFIX}:stats:{namespace}:{name}' for namespace in namespaces for name in STATS_KEYS]
+    values = cache.get_many(keys)
+    return {
+        namespace: {name: values.get(f'{KEY_PREFIX}:stats:{namespace}:{name}', 0) for name in STATS_KEYS}
+        for namespace in namespaces
+    }
+
+
+def reset_stats(namespaces):
+    cache.delete_many([f'{KEY_PREFIX}:stats:{namespace}:{name}' for namespace in namespaces for name in STATS_KEYS])
@@ -1,4 +1,5 @@
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
 from django.utils.safestring import mark_safe
 from django.utils.html import format_html
 from django.urls import reverse
@@ -12,6 +13,14 @@ from django.utils.html import mark_safe
 
 # Register your models here.
 
+class ProductTemplateChangeList(ChangeList):
+    """
+    Precarga las imágenes de los productos de la página con una sola consulta.
+    """
+    def get_results(self, request):
+        super().get_results(request)
+        self.result_list = ProductTemplate.precargar_imagenes(self.result_list)
+
 @admin.register(ProductTemplate)
 class ProductTemplateAdmin(admin.ModelAdmin):
     list_display = (
@@ -59,6 +68,9 @@ class ProductTemplateAdmin(admin.ModelAdmin):
     image_gallery.short_description = 'Galería de Imágenes'
     image_gallery.allow_tags = True
 
+    def get_changelist(self, request, **kwargs):
+        return ProductTemplateChangeList
+
     def get_queryset(self, request):
         return super().get_queryset(request).using('erp-portalgebesa-com')
 
@@ -0,0 +1,107 @@
+"""
+Versiones async de las vistas proxy del cotizador que consultan la API de
+Ercules (clientes externos y validación de productos). Responden igual que
+SyncViewSet.get_external_clients y SyncViewSet.validate_product; se enrutan en
+lugar de ellas cuando ASYNC_PROXY_VIEWS está activo.
+"""
+from asgiref.sync import sync_to_async
+from rest_framework import status
+
+from apps.core import ercules
+from apps.core.async_views import api_response, async_api_view
+from .cache.product_data import afetch_product_data, ProductDataError
+from .views import SyncViewSet
+
+
+def _get_user_api(user):
+    """user_api de la unidad del usuario, o None si no tiene (consulta la base de datos)."""
+    try:
+        unidad = getattr(user, 'unidad', None)
+        return getattr(unidad, 'user_api', None) if unidad else None
+    except Exception as e:
+        print(f"Error al obtener user_api: {str(e)}")
+        return None
+
+
+@async_api_view()
+async def external_clients(request):
+    try:
+        user_api = await sync_to_async(_get_user_api)(request.user)
+
+        if not user_api:
+            # Si no tiene user_api, devolver lista vacía sin consultar la API
+            print(f"Usuario {request.user.username} no tiene user_api configurado. No se consultará la API.")
+            # Devolvemos un array vacío para mantener compatibilidad con el frontend
+            return api_response([], status=status.HTTP_200_OK)
+
+        # Si tiene user_api, usarlo como user_id
+        print(f"Usando user_api: {user_api} como user_id para la consulta de clientes")
+        params = {
+            'user_id': user_api,
+            'fecha_ini': request.query_params.get('fecha_ini', '2009-09-01'),
+            'fecha_fin': request.query_params.get('fecha_fin', '2025-09-04'),
+            'name': request.query_params.get('name', '0')
+        }
+        print(f"Parámetros enviados a la API: {params}")
+
+        response = await ercules.aget('clientes', params=params)
+
+        # Verificar si la respuesta es exitosa
+        if response.status_code != 200:
+            return api_response({
+                'status': 'error',
+                'message': f'Error al consultar la API: {response.status_code}'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        clients_data = response.json()
+        print(f"Respuesta de la API: {len(clients_data)} registros")
+
+        return api_response(SyncViewSet.formatear_clientes_externos(clients_data), status=status.HTTP_200_OK)
+
+    except Exception as e:
+        import traceback
+        print(f"Error al obtener clientes externos: {str(e)}")
+        print(traceback.format_exc())
+        return api_response({
+            'status': 'error',
+            'message': f'Error al obtener clientes externos: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@async_api_view()
+async def validate_product(request):
+    """
+    Valida productos especiales consultando la API product_data de Ercules
+    (mismos parámetros que SyncViewSet.validate_product).
+    """
+    try:
+        params = {
+            'user_id': request.query_params.get('user_id', '2'),
+            'products': request.query_params.get('products', ''),
+            'product_tmpl_ids': request.query_params.get('product_tmpl_ids', '0'),
+            'line_ids': request.query_params.get('line_ids', '0'),
+            'group_ids': request.query_params.get('group_ids', '0'),
+            'type_ids': request.query_params.get('type_ids', '0'),
+            'family_ids': request.query_params.get('family_ids', '0'),
+            'only_line': request.query_params.get('only_line', '0')
+        }
+
+        # Consultar la API a través de la caché compartida
+        try:
+            product_data = await afetch_product_data(params)
+        except ProductDataError as e:
+            return api_response({
+                'status': 'error',
+                'message': f'Error al consultar la API: {e.status_code}'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        return api_response(product_data, status=status.HTTP_200_OK)
+
+    except Exception as e:
+        import traceback
+        print(f"Error al validar producto: {str(e)}")
+        print(traceback.format_exc())
+        return api_response({
+            'status': 'error',
+            'message': f'Error al validar producto: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -0,0 +1,111 @@
+"""
+Versiones async de los endpoints de productos que consultan la API
+product_data (detalles y precio). Responden igual que
+ProductsCacheViewSet.get_details y ProductsCacheViewSet.precio; se enrutan en
+lugar de ellos cuando ASYNC_PROXY_VIEWS está activo.
+"""
+import requests
+from rest_framework import status
+
+from apps.core.async_views import api_response, async_api_view
+from .models import ProductsCache
+from .product_data import afetch_product_data, ProductDataError
+from .views import ProductsCacheViewSet
+
+
+@async_api_view()
+async def get_details(request, clave=None):
+    """
+    Obtiene los detalles y datos del producto desde la API externa
+    """
+    if not clave:
+        return api_response(
+            {"error": "Debe proporcionar una clave de producto"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    try:
+        # Consultar la API externa a través de la caché compartida
+        data = await afetch_product_data({
+            "product_tmpl_ids": clave,
+            "only_line": 1
+        })
+
+        # Procesar cada producto en la respuesta
+        processed_data = [ProductsCacheViewSet._process_product_data(product) for product in data]
+        return api_response(processed_data)
+
+    except ProductDataError as e:
+        return api_response(
+            {"error": str(e)},
+            status=status.HTTP_502_BAD_GATEWAY
+        )
+    except requests.RequestException as e:
+        return api_response(
+            {"error": f"Error de conexión: {str(e)}"},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+    except Exception as e:
+        return api_response(
+            {"error": f"Error inesperado: {str(e)}"},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@async_api_view()
+async def precio(request, reference_mask=None):
+    """
+    Obtiene los detalles completos y precios de un producto por su reference_mask
+    """
+    if not reference_mask:
+        return api_response(
+            {"error": "Debe proporcionar un reference_mask de producto"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    try:
+        # Consultar la API externa a través de la caché compartida
+        data = await afetch_product_data({
+            "product_tmpl_ids": reference_mask,
+            "only_line": 1
+        })
+
+        if not data:
+            return api_response(
+                {'error': f'No se encontró el producto con reference_mask: {reference_mask}'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        # Procesar el primer producto en la respuesta
+        processed_data = ProductsCacheViewSet._process_product_data(data[0])
+
+        # Intentar obtener datos del caché si existen
+        try:
+            cached_product = await ProductsCache.objects.aget(reference_mask=reference_mask)
+            processed_data['cache'] = {
+                'id': cached_product.id,
+                'reference_mask': cached_product.reference_mask,
+                'name': cached_product.name,
+                'image_url': cached_product.image_url,
+                'last_sync': cached_product.last_sync
+            }
+        except ProductsCache.DoesNotExist:
+            processed_data['cache'] = None
+
+        return api_response(processed_data)
+
+    except ProductDataError as e:
+        return api_response(
+            {"error": str(e)},
+            status=status.HTTP_502_BAD_GATEWAY
+        )
+    except requests.RequestException as e:
+        return api_response(
+            {"error": f"Error de conexión: {str(e)}"},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+    except Exception as e:
+        return api_response(
+            {'error': f'Error al obtener la información: {str(e)}'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
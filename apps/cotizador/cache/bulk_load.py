@@ -0,0 +1,130 @@
+"""
+Carga masiva con COPY sobre la conexión directa a la base de datos.
+
+products_cache y cotizador_cliente viven en la misma base de datos que la
+conexión ``default`` de Django, por lo que las sincronizaciones pueden
+escribirlas sin pasar por la API REST de Supabase:
+
+1. Se crea una tabla temporal con las mismas columnas (ON COMMIT DROP).
+2. Los registros se envían con COPY en bloques de ``chunk_size`` filas.
+3. Un solo ``INSERT ... SELECT ... ON CONFLICT DO UPDATE`` los aplica.
+
+Todo ocurre en una transacción, así que la carga es atómica.
+"""
+import io
+import logging
+import time
+
+from django.conf import settings
+from django.db import connections, transaction
+
+logger = logging.getLogger(__name__)
+
+LOADER_REST = 'rest'
+LOADER_COPY = 'copy'
+LOADERS = (LOADER_REST, LOADER_COPY)
+
+
+def get_loader(loader=None):
+    """
+    Retorna el método de carga a usar: el indicado o ``SYNC_LOADER`` de settings.
+    """
+    loader = (loader or getattr(settings, 'SYNC_LOADER', LOADER_REST)).lower()
+    if loader not in LOADERS:
+        raise ValueError(f"Método de carga no válido: {loader}. Opciones: {', '.join(LOADERS)}")
+    return loader
+
+
+def _copy_value(value):
+    """Convierte un valor al formato de texto de COPY."""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    return (
+        str(value)
+        .replace('\\', '\\\\')
+        .replace('\t', '\\t')
+        .replace('\n', '\\n')
+        .replace('\r', '\\r')
+    )
+
+
+def _copy_chunk(cursor, staging_table, columns, rows):
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write('\t'.join(_copy_value(row.get(column)) for column in columns))
+        buffer.write('\n')
+    buffer.seek(0)
+    cursor.copy_expert(
+        f'COPY {staging_table} ({", ".join(columns)}) FROM STDIN',
+        buffer
+    )
+
+
+def copy_upsert(table, columns, rows, conflict_column, using='default', chunk_size=5000,
+                compare_column=None):
+    """
+    Carga los registros en ``table`` con COPY a una tabla temporal seguido de
+    un INSERT ... ON CONFLICT (``conflict_column``) DO UPDATE.
+
+    Si hay registros repetidos por ``conflict_column`` solo se aplica uno de ellos.
+
+    Args:
+        table (str): Tabla destino.
+        columns (list): Columnas a cargar; el resto conserva su valor actual.
+        rows (iterable): Diccionarios con los valores de cada registro.
+        conflict_column (str): Columna única usada para el upsert.
+        using (str): Alias de la conexión de Django.
+        chunk_size (int): Filas enviadas por cada COPY.
+        compare_column (str): Columna (ej. un hash de contenido) que, si no
+            cambió, hace que la fila existente no se reescriba.
+
+    Returns:
+        dict: received (filas enviadas), written (filas insertadas o
+        actualizadas) y seconds.
+    """
+    started = time.monotonic()
+    staging_table = f'{table}_staging'
+    update_columns = [column for column in columns if column != conflict_column]
+    received = 0
+
+    with transaction.atomic(using=using):
+        with connections[using].cursor() as cursor:
+            # Solo los tipos de las columnas, sin restricciones ni triggers
+            cursor.execute(
+                f'CREATE TEMP TABLE {staging_table} ON COMMIT DROP AS '
+                f'SELECT {", ".join(columns)} FROM {table} WITH NO DATA'
+            )
+
+            chunk = []
+            for row in rows:
+                chunk.append(row)
+                if len(chunk) >= chunk_size:
+                    _copy_chunk(cursor, staging_table, columns, chunk)
+                    received += len(chunk)
+                    chunk = []
+            if chunk:
+                _copy_chunk(cursor, staging_table, columns, chunk)
+                received += len(chunk)
+
+            column_list = ', '.join(columns)
+            cursor.execute(
+                f'INSERT INTO {table} ({column_list}) '
+                f'SELECT DISTINCT ON ({conflict_column}) {column_list} FROM {staging_table} '
+                f'ORDER BY {conflict_column} '
+                f'ON CONFLICT ({conflict_column}) DO UPDATE SET '
+                + ', '.join(f'{column} = EXCLUDED.{column}' for column in update_columns)
+                + (
+                    f' WHERE {table}.{compare_column} IS DISTINCT FROM EXCLUDED.{compare_column}'
+                    if compare_column else ''
+                )
+            )
+            written = cursor.rowcount
+
+            # Liberar la tabla temporal por si la transacción externa continúa
+            cursor.execute(f'DROP TABLE {staging_table}')
+
+    seconds = round(time.monotonic() - started, 3)
+    logger.info(f"COPY {table}: {received} filas recibidas, {written} escritas en {seconds}s")
+    return {'received': received, 'written': written, 'seconds': seconds}
@@ -4,9 +4,22 @@ from apps.cotizador.cache.sync import sync_products_to_supabase
 class Command(BaseCommand):
     help = 'Sincroniza productos desde PostgreSQL a Supabase'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Sincronización completa en lugar de incremental'
+        )
+        parser.add_argument(
+            '--loader',
+            choices=['rest', 'copy'],
+            default=None,
+            help="Método de carga: 'rest' (API de Supabase) o 'copy' (COPY directo). Por defecto SYNC_LOADER"
+        )
+
     def handle(self, *args, **options):
         try:
-            count = sync_products_to_supabase()
+            count = sync_products_to_supabase(full=options['full'], loader=options['loader'])
             self.stdout.write(
                 self.style.SUCCESS(f'Sincronizados {count} productos exitosamente')
             )
@@ -1,4 +1,8 @@
+import uuid
 from django.db import models
+from django.db.models import Q
+from django.contrib.postgres.search import SearchVectorField
+from django.core.serializers.json import DjangoJSONEncoder
 from django.utils.html import mark_safe
 
 class ProductsCache(models.Model):
@@ -23,6 +27,10 @@ class ProductsCache(models.Model):
     group_name = models.CharField(max_length=255, null=True)
     image_url = models.URLField(max_length=512, null=True)
     last_sync = models.DateTimeField(auto_now=True)
+    # Mantenido por trigger en la base de datos (ver migración 0045)
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Hash del contenido sincronizado, para omitir productos sin cambios
+    sync_hash = models.CharField(max_length=32, null=True, editable=False)
 
     class Meta:
         managed = False  # Django no manejará la creación/modificación de la tabla
@@ -40,4 +48,90 @@ class ProductsCache(models.Model):
         """
         if self.image_url:
             return mark_safe(f'<img src="{self.image_url}" style="max-height: 50px;" />')
-        return '-'
\ No newline at end of file
+        return '-'
+
+class SyncWatermark(models.Model):
+    """
+    Marca de agua de una sincronización incremental.
+    Guarda el write_date más reciente del ERP procesado en la última
+    sincronización exitosa, para leer solo los registros modificados después.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    last_write_date = models.DateTimeField(null=True, blank=True)
+    last_full_sync = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        app_label = 'cotizador'
+        verbose_name = "Marca de sincronización"
+        verbose_name_plural = "Marcas de sincronización"
+
+    def __str__(self):
+        return f"{self.name} - {self.last_write_date}"
+
+class SyncTask(models.Model):
+    """
+    Registro persistente de una tarea de sincronización ejecutada en Celery.
+    Lo comparten todos los workers, por lo que el estado sobrevive a reinicios
+    y se puede consultar desde cualquier proceso.
+
+    Solo puede haber una tarea activa (pendiente o en ejecución) por nombre.
+    """
+    STATUS_PENDING = 'PENDING'
+    STATUS_RUNNING = 'RUNNING'
+    STATUS_COMPLETED = 'COMPLETED'
+    STATUS_ERROR = 'ERROR'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pendiente'),
+        (STATUS_RUNNING, 'En ejecución'),
+        (STATUS_COMPLETED, 'Completada'),
+        (STATUS_ERROR, 'Error'),
+    ]
+    ACTIVE_STATUSES = (STATUS_PENDING, STATUS_RUNNING)
+
+    task_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    name = models.CharField(max_length=100, db_index=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    progress = models.PositiveSmallIntegerField(default=0, help_text="Porcentaje de avance (0-100)")
+    message = models.CharField(max_length=255, blank=True, default='')
+    params = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder)
+    stats = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    error = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        app_label = 'cotizador'
+        ordering = ['-created_at']
+        verbose_name = "Tarea de sincronización"
+        verbose_name_plural = "Tareas de sincronización"
+        constraints = [
+            # Evita que dos sincronizaciones del mismo tipo corran a la vez
+            models.UniqueConstraint(
+                fields=['name'],
+                condition=Q(status__in=['PENDING', 'RUNNING']),
+                name='unique_active_sync_task'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.task_id}) - {self.status}"
+
+    def to_dict(self):
+        """
+        Representación usada por el endpoint task_status.
+        """
+        return {
+            'task_id': str(self.task_id),
+            'name': self.name,
+            'status': self.status,
+            'progress': self.progress,
+            'message': self.message,
+            'params': self.params,
+            'stats': self.stats,
+            'error': self.error,
+            'timestamp': self.updated_at.isoformat() if self.updated_at else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
@@ -0,0 +1,290 @@
+"""
+Caché de lectura compartida para la API ``product_data`` de Ercules.
+
+Los endpoints de detalle, precio y validación de productos consultan la misma
+API externa una y otra vez para el mismo ``reference_mask``. Este módulo pone
+una caché (el backend ``default`` de Django, Redis en producción) delante de
+esa API:
+
+- La llave se construye a partir de los parámetros normalizados de la consulta.
+- Las entradas son frescas durante ``PRODUCT_DATA_CACHE_TTL`` segundos; después
+  se sirven como "stale" mientras se refrescan en segundo plano, hasta
+  ``PRODUCT_DATA_CACHE_STALE_TTL`` segundos adicionales.
+- Un lock por llave hace que los misses concurrentes se colapsen en una sola
+  llamada a la API externa.
+- Los contadores de hits/misses se guardan en la misma caché para que todos los
+  workers reporten la misma tasa de aciertos.
+
+``afetch_product_data`` es la versión para vistas async: misma caché, misma
+llave y mismos contadores, pero la espera y la llamada a la API no bloquean el
+event loop.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from apps.core import ercules
+
+logger = logging.getLogger(__name__)
+
+PRODUCT_DATA_URL = ercules.get_url('product_data')
+
+# Valores por defecto de la API; se combinan con los parámetros de cada consulta
+# para que dos consultas equivalentes generen la misma llave.
+DEFAULT_PARAMS = {
+    'user_id': 2,
+    'products': 0,
+    'product_tmpl_ids': 0,
+    'line_ids': 0,
+    'group_ids': 0,
+    'type_ids': 0,
+    'family_ids': 0,
+    'only_line': 0,
+}
+
+KEY_PREFIX = 'product_data'
+STATS_KEYS = ('hits', 'stale_hits', 'misses', 'coalesced', 'errors')
+
+# Intervalo de sondeo mientras otro worker resuelve el mismo miss
+_WAIT_INTERVAL = 0.05
+
+
+class ProductDataError(Exception):
+    """La API product_data respondió con un status HTTP distinto de 200."""
+
+    def __init__(self, status_code):
+        self.status_code = status_code
+        super().__init__(f"Error al consultar la API externa: {status_code}")
+
+
+def _get_setting(name, default):
+    return getattr(settings, name, default)
+
+
+def normalize_params(params):
+    """
+    Combina los parámetros con los valores por defecto y los convierte a texto
+    sin espacios, de modo que ``{'products': 'A, B'}`` y ``{'products': 'A,B'}``
+    generen la misma consulta.
+    """
+    normalized = {}
+    for key, value in {**DEFAULT_PARAMS, **(params or {})}.items():
+        if value is None or str(value).strip() == '':
+            value = DEFAULT_PARAMS.get(key, '')
+        normalized[key] = ','.join(part.strip() for part in str(value).split(','))
+    return normalized
+
+
+def build_cache_key(params):
+    """Llave de caché estable para un conjunto de parámetros normalizados."""
+    payload = json.dumps(params, sort_keys=True)
+    digest = hashlib.sha1(payload.encode('utf-8')).hexdigest()
+    return f'{KEY_PREFIX}:entry:{digest}'
+
+
+def _incr_stat(name):
+    key = f'{KEY_PREFIX}:stats:{name}'
+    # add() no sobrescribe si la llave ya existe; incr() es atómico en Redis
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+
+
+def get_cache_stats():
+    """
+    Retorna los contadores acumulados y la tasa de aciertos de la caché.
+    """
+    values = cache.get_many([f'{KEY_PREFIX}:stats:{name}' for name in STATS_KEYS])
+    stats = {name: values.get(f'{KEY_PREFIX}:stats:{name}', 0) for name in STATS_KEYS}
+    served_from_cache = stats['hits'] + stats['stale_hits'] + stats['coalesced']
+    total = served_from_cache + stats['misses']
+    stats['total'] = total
+    stats['hit_rate'] = round(served_from_cache / total, 4) if total else 0.0
+    stats['ttl'] = _get_setting('PRODUCT_DATA_CACHE_TTL', 300)
+    stats['stale_ttl'] = _get_setting('PRODUCT_DATA_CACHE_STALE_TTL', 3600)
+    return stats
+
+
+def reset_cache_stats():
+    """Reinicia los contadores de la caché."""
+    cache.delete_many([f'{KEY_PREFIX}:stats:{name}' for name in STATS_KEYS])
+
+
+def _request_upstream(params):
+    response = ercules.get(
+        'product_data',
+        params=params,
+        timeout=_get_setting('PRODUCT_DATA_TIMEOUT', None),
+    )
+    if response.status_code != 200:
+        raise ProductDataError(response.status_code)
+    return response.json()
+
+
+def _store(key, data):
+    ttl = _get_setting('PRODUCT_DATA_CACHE_TTL', 300)
+    stale_ttl = _get_setting('PRODUCT_DATA_CACHE_STALE_TTL', 3600)
+    cache.set(key, {'data': data, 'fetched_at': time.time()}, timeout=ttl + stale_ttl)
+
+
+def _fetch_and_store(key, params):
+    data = _request_upstream(params)
+    _store(key, data)
+    return data
+
+
+def _refresh_in_background(key, lock_key, params):
+    def run():
+        try:
+            _fetch_and_store(key, params)
+        except Exception as e:
+            _incr_stat('errors')
+            logger.warning(f"No se pudo refrescar product_data {params}: {str(e)}")
+        finally:
+            cache.delete(lock_key)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+
+
+def fetch_product_data(params):
+    """
+    Consulta la API product_data pasando por la caché compartida.
+
+    Args:
+        params (dict): Parámetros de la consulta; los que falten toman el valor
+            de ``DEFAULT_PARAMS``.
+
+    Returns:
+        list: La respuesta JSON de la API.
+
+    Raises:
+        ProductDataError: Si la API responde con un status distinto de 200.
+        requests.RequestException: Si hay un error de conexión.
+    """
+    params = normalize_params(params)
+    key = build_cache_key(params)
+    lock_key = f'{key}:lock'
+    ttl = _get_setting('PRODUCT_DATA_CACHE_TTL', 300)
+    lock_timeout = _get_setting('PRODUCT_DATA_CACHE_LOCK_TIMEOUT', 30)
+
+    entry = cache.get(key)
+    if entry is not None:
+        if time.time() - entry['fetched_at'] < ttl:
+            _incr_stat('hits')
+            return entry['data']
+
+        # Entrada vencida: se sirve tal cual y solo un worker la refresca
+        _incr_stat('stale_hits')
+        if cache.add(lock_key, 1, timeout=lock_timeout):
+            _refresh_in_background(key, lock_key, params)
+        return entry['data']
+
+    if cache.add(lock_key, 1, timeout=lock_timeout):
+        _incr_stat('misses')
+        try:
+            return _fetch_and_store(key, params)
+        except Exception:
+            _incr_stat('errors')
+            raise
+        finally:
+            cache.delete(lock_key)
+
+    # Otro worker ya está consultando la misma llave: esperar su resultado
+    deadline = time.time() + lock_timeout
+    while time.time() < deadline:
+        time.sleep(_WAIT_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            _incr_stat('coalesced')
+            return entry['data']
+        if cache.get(lock_key) is None:
+            # El otro worker terminó sin guardar (error); consultar directamente
+            break
+
+    _incr_stat('misses')
+    try:
+        return _fetch_and_store(key, params)
+    except Exception:
+        _incr_stat('errors')
+        raise
+
+
+async def _arequest_upstream(params):
+    response = await ercules.aget(
+        'product_data',
+        params=params,
+        timeout=_get_setting('PRODUCT_DATA_TIMEOUT', None),
+    )
+    if response.status_code != 200:
+        raise ProductDataError(response.status_code)
+    return response.json()
+
+
+async def _afetch_and_store(key, params):
+    data = await _arequest_upstream(params)
+    await sync_to_async(_store, thread_sensitive=False)(key, data)
+    return data
+
+
+async def afetch_product_data(params):
+    """
+    Versión async de ``fetch_product_data``; mismos parámetros, resultado y
+    excepciones.
+    """
+    params = normalize_params(params)
+    key = build_cache_key(params)
+    lock_key = f'{key}:lock'
+    ttl = _get_setting('PRODUCT_DATA_CACHE_TTL', 300)
+    lock_timeout = _get_setting('PRODUCT_DATA_CACHE_LOCK_TIMEOUT', 30)
+    incr_stat = sync_to_async(_incr_stat, thread_sensitive=False)
+
+    entry = await cache.aget(key)
+    if entry is not None:
+        if time.time() - entry['fetched_at'] < ttl:
+            await incr_stat('hits')
+            return entry['data']
+
+        # Entrada vencida: se sirve tal cual y solo un worker la refresca
+        await incr_stat('stale_hits')
+        if await cache.aadd(lock_key, 1, timeout=lock_timeout):
+            _refresh_in_background(key, lock_key, params)
+        return entry['data']
+
+    if await cache.aadd(lock_key, 1, timeout=lock_timeout):
+        await incr_stat('misses')
+        try:
+            return await _afetch_and_store(key, params)
+        except Exception:
+            await incr_stat('errors')
+            raise
+        finally:
+            await cache.adelete(lock_key)
+
+    # Otro worker ya está consultando la misma llave: esperar su resultado
+    deadline = time.time() + lock_timeout
+    while time.time() < deadline:
+        await asyncio.sleep(_WAIT_INTERVAL)
+        entry = await cache.aget(key)
+        if entry is not None:
+            await incr_stat('coalesced')
+            return entry['data']
+        if await cache.aget(lock_key) is None:
+            # El otro worker terminó sin guardar (error); consultar directamente
+            break
+
+    await incr_stat('misses')
+    try:
+        return await _afetch_and_store(key, params)
+    except Exception:
+        await incr_stat('errors')
+        raise
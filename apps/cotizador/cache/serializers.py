@@ -1,3 +1,4 @@
+from django.conf import settings
 from rest_framework import serializers
 from .models import ProductsCache
 from apps.cotizador.models import CotizadorImagenproducto
@@ -58,3 +59,33 @@ class ProductImageUploadSerializer(serializers.Serializer):
             )
         
         return value
+
+class ProductPriceBatchSerializer(serializers.Serializer):
+    """
+    Serializador para la consulta de precios de varios productos.
+    Acepta una lista de reference_mask o un texto separado por comas.
+    """
+    reference_masks = serializers.JSONField(
+        help_text="Lista de reference_mask (o texto separado por comas)"
+    )
+
+    def validate_reference_masks(self, value):
+        """
+        Normalizar a una lista sin vacíos ni duplicados (conservando el orden)
+        y validar el máximo por solicitud.
+        """
+        if isinstance(value, str):
+            value = value.split(',')
+        if not isinstance(value, list):
+            raise serializers.ValidationError("Debe ser una lista de reference_mask")
+
+        codes = list(dict.fromkeys(str(code).strip() for code in value if str(code).strip()))
+        if not codes:
+            raise serializers.ValidationError("Debe proporcionar al menos un reference_mask")
+
+        max_codes = getattr(settings, 'PRODUCT_PRICE_BATCH_MAX', 500)
+        if len(codes) > max_codes:
+            raise serializers.ValidationError(
+                f"Se permiten como máximo {max_codes} productos por solicitud ({len(codes)} recibidos)"
+            )
+        return codes
@@ -1,355 +1,684 @@
-from django.db import connections
+from django.db import connections, transaction
+from django.utils import timezone
 from supabase import create_client, Client
 from django.conf import settings
 from decimal import Decimal
-import time
+import hashlib
+import json
 import logging
-from datetime import datetime
+import os
+from contextlib import nullcontext
+from datetime import datetime, timedelta, timezone as dt_timezone
+from apps.cotizador.models import Cliente, CotizadorImagenproducto
+from apps.cotizador.pagination import bump_count_version
+from .models import ProductsCache, SyncWatermark
+from .upsert import BatchUpserter
+from .bulk_load import LOADER_COPY, _copy_chunk, copy_upsert, get_loader
 
-def sync_products_to_supabase():
+logger = logging.getLogger(__name__)
+
+ERP_DATABASE = 'erp-portalgebesa-com'
+
+# Nombre de la marca de agua de la sincronización de productos
+PRODUCTS_WATERMARK = 'products'
+
+# Productos del ERP con su jerarquía y nombre en español
+PRODUCTS_SELECT = """
+    SELECT 
+        pt.id,
+        pt.reference_mask,
+        pt.note_pricelist,  
+        pt.type_id,
+        pt.family_id,
+        pt.line_id,
+        pt.group_id,
+        pt.is_line,
+        pt.pricelist,
+        pt.active,
+        -- Nueva columna "code"
+        COALESCE(pt.reference_mask, pt.note_pricelist) AS code,
+        -- Información adicional de las tablas relacionadas
+        ptype.name   AS type_name,
+        pfam.name    AS family_name,
+        pline.name   AS line_name,
+        pgroup.name  AS group_name,
+        -- Nueva columna con la traducción en español
+        it.value AS name_spanish,
+        -- Fecha de la última modificación del producto, su jerarquía o su traducción
+        GREATEST(pt.write_date, ptype.write_date, pfam.write_date, pline.write_date,
+                 pgroup.write_date, it.write_date) AS change_date
+    FROM product_template pt
+        LEFT JOIN product_type ptype 
+            ON pt.type_id = ptype.id
+        LEFT JOIN product_family pfam 
+            ON pt.family_id = pfam.id
+        LEFT JOIN product_line pline 
+            ON pt.line_id = pline.id
+        LEFT JOIN product_group pgroup 
+            ON pt.group_id = pgroup.id
+        -- Agrega la unión con ir_translation para obtener la traducción en español
+        LEFT JOIN ir_translation it 
+            ON it.res_id = pt.id
+               AND it.name = 'product.template,name'
+               AND it.lang = 'es_MX'
+"""
+
+# Orden de lectura: los productos con la misma llave llegan juntos y el
+# deduplicado solo compara con el anterior
+PRODUCTS_ORDER = "    ORDER BY code\n"
+
+# Tabla temporal con las llaves que llegaron del ERP en una sincronización completa
+SEEN_TABLE = 'products_cache_seen'
+
+# Condición que define qué productos del ERP pertenecen a products_cache
+PRODUCTS_CONDITION = """
+        pt.is_line = TRUE
+        AND pt.active = TRUE
+        AND (
+            (
+                pt.reference_mask IS NOT NULL
+                AND pt.reference_mask NOT IN (
+                    'LLR1SCANT', 'LLR1SCANTWM', 'LLRBLAPMBBFLPF162329NT', 
+                    'LLRBLAPMFFLPF162329NT', 'LLRBLAPMSBBFLPF162329NT', 
+                    'LLRBLAPMSFFLPF162329NT', 'LLRBPMBBFLPF162329NT', 
+                    'LLRBPMFFLPF162329NT', 'LLRBPMSBBFLPF162329NT', 
+                    'LLRBPMSFFLPF162329NT', 'LLRBWSLP242442', 'LLRBWSLP302442', 
+                    'LLRBWSRELP242442', 'LLRBWSRELP302442', 'LLRBWSSLP2460', 
+                    'LLRBWSSLP2465', 'LLRBWSSLP2472', 'LLRBWSSLP3060', 
+                    'LLRBWSSLP3065', 'LLRBWSSLP3072', 'LLRC1DLP602024', 
+                    'LLRC1DLP712024', 'LLRCANTSS', 'LLRCANTSSWM', 'LLRCC2720', 
+                    'LLRCOUNTBR', 'LLRCRBRKIT', 'LLRCWSSLP363624', 'LLRCWSSLP423624', 
+                    'LLRCWSSLP424224', 'LLRCWSSLP424230', 'LLRCWSSLP483624', 
+                    'LLRCWSSLP484224', 'LLRCWSSLP484230', 'LLRCWSSLP484824', 
+                    'LLRCWSSLP484830', 'LLRCWSSLP603624', 'LLRCWSSLP604224', 
+                    'LLRCWSSLP604230', 'LLRCWSSLP604824', 'LLRCWSSLP604830', 
+                    'LLREHWSLP367224', 'LLREHWSLP367230', 'LLREIWSLP2460', 
+                    'LLREIWSLP2472', 'LLREIWSLP3072', 'LLREL01525MPS120', 
+                    'LLREL01525MPS72', 'LLREL01525S120', 'LLREL01525S72', 
+                    'LLREL0153611SMAM172', 'LLREL0153611SMBM172', 
+                    'LLREL0153611SMCM172', 'LLREL0153620SMA72', 
+                    'LLREL0153620SMB72', 'LLREL0153620SMC72', 'LLREL0181922E120', 
+                    'LLREL0181922E72', 'LLREL01820M22120', 'LLREL01820M2272', 
+                    'LLREL01820M22D172', 'LLREL01820M2X22120', 'LLREL01820M2X2272', 
+                    'LLREL01820M2X22U5/U5120', 'LLREL01820M2X22U5/U572', 
+                    'LLREL01820M2X40120', 'LLREL01820M2X4072', 
+                    'LLREL01826M3X4002120', 'LLREL01826M3X400272', 
+                    'LLREL01826M4X4001120', 'LLREL01826M4X400172', 'LLREL02137C1172', 
+                    'LLREL02137C2072', 'LLREL0251122120', 'LLREL025112272', 
+                    'LLREL0251133120', 'LLREL025113372', 'LLREL02511B22U572', 
+                    'LLREL02511B31U172', 'LLREL02511B33U3172', 'LLREL02511B4072', 
+                    'LLREL0252022XA120', 'LLREL0252022XA72', 'LLREL0252022YA120', 
+                    'LLREL0252022YA72', 'LLREL0252022Z120', 'LLREL0252022Z72', 
+                    'LLREL0252033XA120', 'LLREL0252033XA72', 'LLREL0252033YA120', 
+                    'LLREL0252033YA72', 'LLREL0252033Z120', 'LLREL0252033Z72', 
+                    'LLREL0335911120', 'LLREL033591172', 'LLREL0335911M1120', 
+                    'LLREL0335911M172', 'LLREL0335920120', 'LLREL033592072', 
+                    'LLREL03373EN22120', 'LLREL03373EN2272', 'LLREL03373EN22M2120', 
+                    'LLREL03373EN22M272', 'LLREL03373GN22M1120', 
+                    'LLREL03373GN22M172', 'LLREL03373GN31M1120', 
+                    'LLREL03373GN31M172', 'LLREL03373TT40120', 'LLREL03373TT4072', 
+                    'LLREL03378GN22120', 'LLREL03378GN2272', 'LLREL03378GN22M1120', 
+                    'LLREL03378GN22M172', 'LLREL03378GN22M2120', 
+                    'LLREL03378GN22M272', 'LLREL03378GN31120', 'LLREL03378GN3172', 
+                    'LLREL03378GN31M1120', 'LLREL03378GN31M172', 'LLREL03378GN40120', 
+                    'LLREL03378GN4072', 'LLREL03378TT22MMT120', 'LLREL03378TT22MMT72', 
+                    'LLREL03378TT40120', 'LLREL03378TT4072', 'LLREL0338522120', 
+                    'LLREL033852272', 'LLREL0338522M1120', 'LLREL0338522M172', 
+                    'LLREL0338522M2120', 'LLREL0338522M272', 'LLREL0338531120', 
+                    'LLREL033853172', 'LLREL0338531M1120', 'LLREL0338531M172', 
+                    'LLREL0338540120', 'LLREL033854072', 'LLREL0377021MR1120', 
+                    'LLREL0377021MR172', 'LLREL0377030120', 'LLREL037703072', 
+                    'LLREL0381621MR1120', 'LLREL0381621MR172', 'LLREL0381630120', 
+                    'LLREL038163072', 'LLREL0407311AMR172', 'LLREL0407320A72', 
+                    'LLREL0407321AMR172', 'LLREL0407330A72', 'LLREL0407332AMR272', 
+                    'LLREL0407350A72', 'LLREL0407611UB172', 'LLREL040762072', 
+                    'LLREL0407621UB172', 'LLREL040763072', 'LLREL0407632UB272', 
+                    'LLREL040765072', 'LLREL04262A11UB148', 'LLREL04262A11UB160', 
+                    'LLREL04262S11UB1120', 'LLREL04262S11UB172', 'LLREL0428611M1120', 
+                    'LLREL0428611M172', 'LLREL0428620120', 'LLREL042862072', 
+                    'LLREL0431511AA120', 'LLREL0431511AA72', 'LLREL0431511AZ120', 
+                    'LLREL0431511AZ72', 'LLREL0431520A120', 'LLREL0431520A72', 
+                    'LLREL0431520Z120', 'LLREL0431520Z72', 'LLREL0431521AA120', 
+                    'LLREL0431521AA72', 'LLREL0431521AZ120', 'LLREL0431521AZ72', 
+                    'LLREL0431530A120', 'LLREL0431530A72', 'LLREL0431530Z72', 
+                    'LLREL0431532AA120', 'LLREL0431532AA72', 'LLREL0431532AZ120', 
+                    'LLREL0431532AZ72', 'LLREL0431550A120', 'LLREL0431550A72', 
+                    'LLREL0431550Z120', 'LLREL0431550Z72', 'LLREL0475572', 
+                    'LLREL0475672', 'LLREL0481431U172', 'LLREL05451A110', 
+                    'LLREL05451A111', 'LLREL05451A112', 'LLREL05451A113', 
+                    'LLREL05451A114', 'LLREL05451A115', 'LLREL05451A116', 
+                    'LLREL05451A117', 'LLREL0806232', 'LLREL0806832', 'LLREL080863', 
+                    'LLREL080923', 'LLREL081803', 'LLREL420813', 'LLREL420823', 
+                    'LLREL5241332', 'LLREL524263C', 'LLREL524263G', 'LLREL524633', 
+                    'LLREL524903', 'LLREPTWSLP367224', 'LLREPTWSLP367230', 
+                    'LLREPWSLP367224', 'LLREPWSLP367230', 'LLREWSCCLP363624', 
+                    'LLREWSCCLP423624', 'LLREWSCCLP424224', 'LLREWSCCLP424230', 
+                    'LLREWSCCLP483624', 'LLREWSCCLP484224', 'LLREWSCCLP484230', 
+                    'LLREWSCCLP484824', 'LLREWSCCLP484830', 'LLREWSCCLP603624', 
+                    'LLREWSCCLP604224', 'LLREWSCCLP604230', 'LLREWSCCLP604824', 
+                    'LLREWSCCLP604830', 'LLREWSLP2424', 'LLREWSLP2430', 
+                    'LLREWSLP2436', 'LLREWSLP2442', 'LLREWSLP2448', 'LLREWSLP3024', 
+                    'LLREWSLP3030', 'LLREWSLP3036', 'LLREWSLP3042', 'LLREWSLP3048'
+                )
+            )
+            OR (pt.reference_mask IS NULL AND pt.pricelist = TRUE)
+        )
+"""
+
+def _build_products_query(since=None):
+    """
+    Construye la consulta de productos activos del ERP.
+    Si se indica ``since``, solo incluye los productos (o su jerarquía o su
+    nombre en español) modificados después de esa fecha.
+    """
+    query = PRODUCTS_SELECT + "    WHERE\n" + PRODUCTS_CONDITION
+    params = []
+    if since is not None:
+        query += """        AND GREATEST(pt.write_date, ptype.write_date, pfam.write_date,
+                     pline.write_date, pgroup.write_date, it.write_date) > %s
+"""
+        params.append(since)
+    return query, params
+
+def _get_deactivated_product_ids(since):
+    """
+    Obtiene los IDs de productos modificados después de ``since`` que ya no
+    cumplen la condición de products_cache (archivados, sin línea o excluidos).
+    """
+    with connections[ERP_DATABASE].cursor() as cursor:
+        cursor.execute(
+            "SELECT pt.id FROM product_template pt "
+            "WHERE pt.write_date > %s AND NOT COALESCE((" + PRODUCTS_CONDITION + "), FALSE)",
+            [since]
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+def _to_erp_datetime(value):
+    """Convierte una fecha con zona horaria al formato UTC sin zona que usa el ERP."""
+    return timezone.make_naive(value, dt_timezone.utc) if timezone.is_aware(value) else value
+
+def _from_erp_datetime(value):
+    """Convierte un write_date del ERP (UTC sin zona) a una fecha con zona horaria."""
+    return timezone.make_aware(value, dt_timezone.utc) if timezone.is_naive(value) else value
+
+def row_hash(row, fields):
+    """
+    Hash del contenido sincronizado de un registro, para detectar cambios.
+    """
+    payload = json.dumps([row.get(field) for field in fields], default=str)
+    return hashlib.md5(payload.encode('utf-8')).hexdigest()
+
+def _skip_unchanged(rows, key_field, hash_fields, existing_hashes, stats):
+    """
+    Agrega sync_hash a cada registro y solo deja pasar los nuevos o modificados.
+    Cuenta insertados, actualizados y sin cambios en ``stats``.
+    """
+    for row in rows:
+        row['sync_hash'] = row_hash(row, hash_fields)
+        key = row[key_field]
+        if key not in existing_hashes:
+            stats['inserted'] += 1
+        elif existing_hashes[key] != row['sync_hash']:
+            stats['updated'] += 1
+        else:
+            stats['unchanged'] += 1
+            continue
+        yield row
+
+# Columnas de products_cache que escribe la carga con COPY
+PRODUCT_COPY_COLUMNS = [
+    'id', 'name', 'reference_mask', 'type_id', 'family_id', 'line_id', 'group_id',
+    'type_name', 'family_name', 'line_name', 'group_name', 'is_line', 'active',
+    'image_url', 'last_sync', 'sync_hash'
+]
+
+# Campos que forman el hash de contenido de un producto (todo menos last_sync)
+PRODUCT_HASH_FIELDS = [
+    'id', 'name', 'reference_mask', 'type_id', 'family_id', 'line_id', 'group_id',
+    'type_name', 'family_name', 'line_name', 'group_name', 'is_line', 'active',
+    'image_url'
+]
+
+# Campos que forman el hash de contenido de un cliente
+CLIENT_HASH_FIELDS = ['partner_id', 'name_partner', 'rfc']
+
+# Campos de products_cache que se toman de cada fila del ERP
+PRODUCT_FIELDS = [
+    'id', 'name_spanish', 'reference_mask', 'type_id', 'family_id',
+    'line_id', 'group_id', 'type_name', 'family_name',
+    'line_name', 'group_name', 'is_line', 'active',
+    'default_code', 'description_sale', 'image_url', 'last_sync'
+]
+
+def _rss_mb():
+    """
+    Memoria residente (RSS) actual del proceso en MB, leída de /proc; None si
+    no está disponible. Es barata, así que se muestrea durante la sincronización.
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            pages = int(statm.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return round(pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024), 1)
+
+def _sample_memory(stats):
+    """Registra en ``stats`` la RSS máxima vista en esta sincronización."""
+    rss = _rss_mb()
+    if rss is not None and (stats['peak_rss_mb'] is None or rss > stats['peak_rss_mb']):
+        stats['peak_rss_mb'] = rss
+
+def _iter_erp_products(query, params, itersize):
+    """
+    Lee los productos del ERP con un cursor del lado del servidor, trayendo
+    ``itersize`` filas por viaje, y los entrega uno a uno como diccionarios.
+    """
+    connection = connections[ERP_DATABASE]
+    # El cursor con nombre vive dentro de la transacción; sin ella Django lo abre
+    # WITH HOLD y PostgreSQL materializa todo el resultado al hacer commit
+    with transaction.atomic(using=ERP_DATABASE):
+        with connection.chunked_cursor() as cursor:
+            cursor.execute(query, params)
+            columns = [desc[0] for desc in cursor.description]
+            while True:
+                rows = cursor.fetchmany(itersize)
+                if not rows:
+                    break
+                for row in rows:
+                    yield dict(zip(columns, row))
+
+def _count_erp_products(query, params):
+    """Cuenta las filas que devolverá la consulta de productos (para reportar avance)."""
+    with connections[ERP_DATABASE].cursor() as cursor:
+        cursor.execute(f"SELECT COUNT(*) FROM ({query}) AS productos", params)
+        return cursor.fetchone()[0]
+
+def _report_progress(items, progress_callback, expected, every=500):
+    """
+    Deja pasar los elementos y reporta el avance cada ``every`` elementos,
+    entre 5% y 95% (el resto corresponde a preparación y cierre).
+    """
+    for count, item in enumerate(items, start=1):
+        if count % every == 0 and expected:
+            progress_callback(
+                min(95, 5 + int(90 * count / expected)),
+                f"{count} de {expected} productos procesados"
+            )
+        yield item
+
+def _transform_products(products, stats):
+    """
+    Convierte cada fila del ERP en un registro de products_cache.
+    """
+    for product in products:
+        stats['total'] += 1
+        if stats['total'] % 1000 == 0:
+            _sample_memory(stats)
+        try:
+            # Validar datos requeridos
+            if not product['id']:
+                raise ValueError(f"ID faltante para el producto: {product.get('name_spanish', 'N/A')}")
+
+            # Registrar la modificación más reciente para la marca de agua
+            change_date = product.get('change_date')
+            if change_date and (stats['max_change_date'] is None or change_date > stats['max_change_date']):
+                stats['max_change_date'] = change_date
+
+            # Si reference_mask es nulo, usar note_pricelist
+            if product['reference_mask'] is None and product.get('note_pricelist'):
+                product['reference_mask'] = product['note_pricelist']
+
+            # Crear un nuevo diccionario con solo los campos permitidos y mapear name_spanish a name
+            filtered_product = {}
+            for field in PRODUCT_FIELDS:
+                if field in product:
+                    if field == 'name_spanish':
+                        filtered_product['name'] = product[field]  # Usar name_spanish como name
+                    else:
+                        filtered_product[field] = product[field]
+
+            # Agregar timestamp
+            filtered_product['last_sync'] = timezone.now().isoformat()
+
+            yield filtered_product
+
+        except Exception as e:
+            print(f" Error en producto {product.get('reference_mask') or product.get('id') or 'desconocido'}: {str(e)}")
+
+def _dedupe_products(products):
+    """
+    Descarta productos sin reference_mask y los repetidos (la llave de products_cache).
+    Los productos llegan ordenados por llave (PRODUCTS_ORDER), así que basta
+    compararlos con el anterior.
+    """
+    previous = None
+    for product in products:
+        reference_mask = product.get('reference_mask')
+        if not reference_mask:
+            print(f" Advertencia: Producto ID {product.get('id')} sin reference_mask ni note_pricelist")
+            continue
+        if reference_mask == previous:
+            continue
+        previous = reference_mask
+        yield product
+
+def _chunks(items, size):
+    """Agrupa los elementos de un iterable en listas de hasta ``size`` elementos."""
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _resolve_existing(products, stats, lookup_size=1000):
+    """
+    Consulta, por bloques de ``lookup_size`` productos, solo el estado de esas
+    llaves: imagen y sync_hash en products_cache e imagen en
+    cotizador_imagenproducto. Preserva la imagen ya asignada o usa la de
+    cotizador_imagenproducto, y deja pasar solo los productos nuevos o modificados.
+    """
+    for chunk in _chunks(products, lookup_size):
+        keys = [product['reference_mask'] for product in chunk]
+        existing_images = {}
+        existing_hashes = {}
+        for reference_mask, image_url, sync_hash in ProductsCache.objects.filter(
+            reference_mask__in=keys
+        ).values_list('reference_mask', 'image_url', 'sync_hash'):
+            existing_hashes[reference_mask] = sync_hash
+            if image_url:
+                existing_images[reference_mask] = image_url
+        images_map = dict(
+            CotizadorImagenproducto.objects.filter(clave_padre__in=keys).values_list('clave_padre', 'url')
+        )
+
+        for product in chunk:
+            reference_mask = product['reference_mask']
+            if reference_mask in existing_images:
+                product['image_url'] = existing_images[reference_mask]
+                stats['preserved_images'] += 1
+            else:
+                product['image_url'] = images_map.get(reference_mask)
+                if product['image_url']:
+                    stats['with_images'] += 1
+
+        yield from _skip_unchanged(chunk, 'reference_mask', PRODUCT_HASH_FIELDS, existing_hashes, stats)
+
+def _create_seen_table():
+    """Crea (vacía) la tabla temporal de llaves vistas en la conexión default."""
+    with connections['default'].cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {SEEN_TABLE}")
+        cursor.execute(f"CREATE TEMP TABLE {SEEN_TABLE} (reference_mask text NOT NULL)")
+
+def _drop_seen_table():
+    with connections['default'].cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {SEEN_TABLE}")
+
+def _record_seen(products, chunk_size=5000):
+    """
+    Deja pasar los productos y copia su reference_mask a SEEN_TABLE con COPY,
+    en bloques de ``chunk_size`` llaves.
+    """
+    pending = []
+    for product in products:
+        pending.append({'reference_mask': product['reference_mask']})
+        if len(pending) >= chunk_size:
+            with connections['default'].cursor() as cursor:
+                _copy_chunk(cursor, SEEN_TABLE, ['reference_mask'], pending)
+            pending = []
+        yield product
+    if pending:
+        with connections['default'].cursor() as cursor:
+            _copy_chunk(cursor, SEEN_TABLE, ['reference_mask'], pending)
+
+def _delete_unseen_products():
+    """
+    Elimina de products_cache los productos cuya llave no llegó del ERP, con
+    un anti-join contra SEEN_TABLE. Retorna el número de filas eliminadas.
+    """
+    with connections['default'].cursor() as cursor:
+        cursor.execute(f"ANALYZE {SEEN_TABLE}")
+        cursor.execute(
+            f"DELETE FROM {ProductsCache._meta.db_table} pc "
+            f"WHERE NOT EXISTS (SELECT 1 FROM {SEEN_TABLE} s WHERE s.reference_mask = pc.reference_mask)"
+        )
+        return cursor.rowcount
+
+def sync_products_to_supabase(full=False, loader=None, progress_callback=None):
     """
     Sincroniza los productos desde PostgreSQL a Supabase.
+
+    Por defecto la sincronización es incremental: solo lee los productos del ERP
+    modificados desde la última sincronización exitosa (marca de agua por
+    write_date) y elimina de products_cache los productos desactivados.
+
+    Los productos fluyen en streaming (cursor del servidor -> transformación ->
+    deduplicado -> estado actual por bloques -> lotes -> upsert), por lo que la
+    memoria depende del tamaño de lote y no del tamaño del catálogo: el estado
+    en products_cache y las imágenes se consultan solo para las llaves de cada
+    bloque, y en la sincronización completa las llaves vistas se guardan en una
+    tabla temporal para depurar products_cache en la base de datos. Los lotes
+    se envían de forma concurrente con BatchUpserter.
+
+    Args:
+        full (bool): Si es True relee todo el catálogo y elimina de products_cache
+            los productos que ya no existen en el ERP. También se hace una
+            sincronización completa si aún no existe marca de agua.
+        loader (str): 'rest' (upserts por la API de Supabase) o 'copy' (COPY por
+            la conexión directa, en una sola transacción). Por defecto SYNC_LOADER.
+        progress_callback (callable): Función opcional ``(porcentaje, mensaje)``
+            para reportar el avance (ver task_registry).
     """
-    print("Iniciando sincronización de productos...")
-    
-    # Configuración de Supabase
-    print("Conectando a Supabase...")
-    supabase: Client = create_client(
-        settings.SUPABASE_URL,
-        settings.SUPABASE_KEY
-    )
+    loader = get_loader(loader)
+    watermark, _ = SyncWatermark.objects.get_or_create(name=PRODUCTS_WATERMARK)
+    if watermark.last_write_date is None:
+        full = True
+
+    # Margen para no perder registros de transacciones que confirmaron
+    # después de la última lectura con un write_date anterior
+    since = None
+    if not full:
+        overlap = getattr(settings, 'PRODUCT_SYNC_OVERLAP_SECONDS', 120)
+        since = _to_erp_datetime(watermark.last_write_date - timedelta(seconds=overlap))
+
+    print(f"Iniciando sincronización de productos ({'completa' if full else f'incremental desde {since}'}, carga {loader})...")
 
     # Estadísticas
-    total_products = 0
-    successful_products = 0
-    products_with_images = 0
-    preserved_images = 0
+    stats = {
+        'total': 0,
+        'successful': 0,
+        'with_images': 0,
+        'preserved_images': 0,
+        'failed_batches': 0,
+        'upstream_calls': 0,
+        'max_change_date': None,
+        'inserted': 0,
+        'updated': 0,
+        'unchanged': 0,
+        'peak_rss_mb': None,
+    }
+    deleted_products = 0
     start_time = datetime.now()
+    sync_started_at = timezone.now()
+    upsert_stats = None
+    memory_at_start = _rss_mb()
+    _sample_memory(stats)
 
     # Obtener datos de PostgreSQL
     print("Obteniendo productos de la base de datos ERP...")
-    with connections['erp-portalgebesa-com'].cursor() as cursor:
-        cursor.execute("""
-            SELECT 
-                pt.id,
-                pt.reference_mask,
-                pt.note_pricelist,  
-                pt.type_id,
-                pt.family_id,
-                pt.line_id,
-                pt.group_id,
-                pt.is_line,
-                pt.pricelist,
-                pt.active,
-                -- Nueva columna "code"
-                COALESCE(pt.reference_mask, pt.note_pricelist) AS code,
-                -- Información adicional de las tablas relacionadas
-                ptype.name   AS type_name,
-                pfam.name    AS family_name,
-                pline.name   AS line_name,
-                pgroup.name  AS group_name,
-                -- Nueva columna con la traducción en español
-                it.value AS name_spanish
-            FROM product_template pt
-                LEFT JOIN product_type ptype 
-                    ON pt.type_id = ptype.id
-                LEFT JOIN product_family pfam 
-                    ON pt.family_id = pfam.id
-                LEFT JOIN product_line pline 
-                    ON pt.line_id = pline.id
-                LEFT JOIN product_group pgroup 
-                    ON pt.group_id = pgroup.id
-                -- Agrega la unión con ir_translation para obtener la traducción en español
-                LEFT JOIN ir_translation it 
-                    ON it.res_id = pt.id
-                       AND it.name = 'product.template,name'
-                       AND it.lang = 'es_MX'
-            WHERE 
-                pt.is_line = TRUE
-                AND pt.active = TRUE
-                AND (
-                    (
-                        pt.reference_mask IS NOT NULL
-                        AND pt.reference_mask NOT IN (
-                            'LLR1SCANT', 'LLR1SCANTWM', 'LLRBLAPMBBFLPF162329NT', 
-                            'LLRBLAPMFFLPF162329NT', 'LLRBLAPMSBBFLPF162329NT', 
-                            'LLRBLAPMSFFLPF162329NT', 'LLRBPMBBFLPF162329NT', 
-                            'LLRBPMFFLPF162329NT', 'LLRBPMSBBFLPF162329NT', 
-                            'LLRBPMSFFLPF162329NT', 'LLRBWSLP242442', 'LLRBWSLP302442', 
-                            'LLRBWSRELP242442', 'LLRBWSRELP302442', 'LLRBWSSLP2460', 
-                            'LLRBWSSLP2465', 'LLRBWSSLP2472', 'LLRBWSSLP3060', 
-                            'LLRBWSSLP3065', 'LLRBWSSLP3072', 'LLRC1DLP602024', 
-                            'LLRC1DLP712024', 'LLRCANTSS', 'LLRCANTSSWM', 'LLRCC2720', 
-                            'LLRCOUNTBR', 'LLRCRBRKIT', 'LLRCWSSLP363624', 'LLRCWSSLP423624', 
-                            'LLRCWSSLP424224', 'LLRCWSSLP424230', 'LLRCWSSLP483624', 
-                            'LLRCWSSLP484224', 'LLRCWSSLP484230', 'LLRCWSSLP484824', 
-                            'LLRCWSSLP484830', 'LLRCWSSLP603624', 'LLRCWSSLP604224', 
-                            'LLRCWSSLP604230', 'LLRCWSSLP604824', 'LLRCWSSLP604830', 
-                            'LLREHWSLP367224', 'LLREHWSLP367230', 'LLREIWSLP2460', 
-                            'LLREIWSLP2472', 'LLREIWSLP3072', 'LLREL01525MPS120', 
-                            'LLREL01525MPS72', 'LLREL01525S120', 'LLREL01525S72', 
-                            'LLREL0153611SMAM172', 'LLREL0153611SMBM172', 
-                            'LLREL0153611SMCM172', 'LLREL0153620SMA72', 
-                            'LLREL0153620SMB72', 'LLREL0153620SMC72', 'LLREL0181922E120', 
-                            'LLREL0181922E72', 'LLREL01820M22120', 'LLREL01820M2272', 
-                            'LLREL01820M22D172', 'LLREL01820M2X22120', 'LLREL01820M2X2272', 
-                            'LLREL01820M2X22U5/U5120', 'LLREL01820M2X22U5/U572', 
-                            'LLREL01820M2X40120', 'LLREL01820M2X4072', 
-                            'LLREL01826M3X4002120', 'LLREL01826M3X400272', 
-                            'LLREL01826M4X4001120', 'LLREL01826M4X400172', 'LLREL02137C1172', 
-                            'LLREL02137C2072', 'LLREL0251122120', 'LLREL025112272', 
-                            'LLREL0251133120', 'LLREL025113372', 'LLREL02511B22U572', 
-                            'LLREL02511B31U172', 'LLREL02511B33U3172', 'LLREL02511B4072', 
-                            'LLREL0252022XA120', 'LLREL0252022XA72', 'LLREL0252022YA120', 
-                            'LLREL0252022YA72', 'LLREL0252022Z120', 'LLREL0252022Z72', 
-                            'LLREL0252033XA120', 'LLREL0252033XA72', 'LLREL0252033YA120', 
-                            'LLREL0252033YA72', 'LLREL0252033Z120', 'LLREL0252033Z72', 
-                            'LLREL0335911120', 'LLREL033591172', 'LLREL0335911M1120', 
-                            'LLREL0335911M172', 'LLREL0335920120', 'LLREL033592072', 
-                            'LLREL03373EN22120', 'LLREL03373EN2272', 'LLREL03373EN22M2120', 
-                            'LLREL03373EN22M272', 'LLREL03373GN22M1120', 
-                            'LLREL03373GN22M172', 'LLREL03373GN31M1120', 
-                            'LLREL03373GN31M172', 'LLREL03373TT40120', 'LLREL03373TT4072', 
-                            'LLREL03378GN22120', 'LLREL03378GN2272', 'LLREL03378GN22M1120', 
-                            'LLREL03378GN22M172', 'LLREL03378GN22M2120', 
-                            'LLREL03378GN22M272', 'LLREL03378GN31120', 'LLREL03378GN3172', 
-                            'LLREL03378GN31M1120', 'LLREL03378GN31M172', 'LLREL03378GN40120', 
-                            'LLREL03378GN4072', 'LLREL03378TT22MMT120', 'LLREL03378TT22MMT72', 
-                            'LLREL03378TT40120', 'LLREL03378TT4072', 'LLREL0338522120', 
-                            'LLREL033852272', 'LLREL0338522M1120', 'LLREL0338522M172', 
-                            'LLREL0338522M2120', 'LLREL0338522M272', 'LLREL0338531120', 
-                            'LLREL033853172', 'LLREL0338531M1120', 'LLREL0338531M172', 
-                            'LLREL0338540120', 'LLREL033854072', 'LLREL0377021MR1120', 
-                            'LLREL0377021MR172', 'LLREL0377030120', 'LLREL037703072', 
-                            'LLREL0381621MR1120', 'LLREL0381621MR172', 'LLREL0381630120', 
-                            'LLREL038163072', 'LLREL0407311AMR172', 'LLREL0407320A72', 
-                            'LLREL0407321AMR172', 'LLREL0407330A72', 'LLREL0407332AMR272', 
-                            'LLREL0407350A72', 'LLREL0407611UB172', 'LLREL040762072', 
-                            'LLREL0407621UB172', 'LLREL040763072', 'LLREL0407632UB272', 
-                            'LLREL040765072', 'LLREL04262A11UB148', 'LLREL04262A11UB160', 
-                            'LLREL04262S11UB1120', 'LLREL04262S11UB172', 'LLREL0428611M1120', 
-                            'LLREL0428611M172', 'LLREL0428620120', 'LLREL042862072', 
-                            'LLREL0431511AA120', 'LLREL0431511AA72', 'LLREL0431511AZ120', 
-                            'LLREL0431511AZ72', 'LLREL0431520A120', 'LLREL0431520A72', 
-                            'LLREL0431520Z120', 'LLREL0431520Z72', 'LLREL0431521AA120', 
-                            'LLREL0431521AA72', 'LLREL0431521AZ120', 'LLREL0431521AZ72', 
-                            'LLREL0431530A120', 'LLREL0431530A72', 'LLREL0431530Z72', 
-                            'LLREL0431532AA120', 'LLREL0431532AA72', 'LLREL0431532AZ120', 
-                            'LLREL0431532AZ72', 'LLREL0431550A120', 'LLREL0431550A72', 
-                            'LLREL0431550Z120', 'LLREL0431550Z72', 'LLREL0475572', 
-                            'LLREL0475672', 'LLREL0481431U172', 'LLREL05451A110', 
-                            'LLREL05451A111', 'LLREL05451A112', 'LLREL05451A113', 
-                            'LLREL05451A114', 'LLREL05451A115', 'LLREL05451A116', 
-                            'LLREL05451A117', 'LLREL0806232', 'LLREL0806832', 'LLREL080863', 
-                            'LLREL080923', 'LLREL081803', 'LLREL420813', 'LLREL420823', 
-                            'LLREL5241332', 'LLREL524263C', 'LLREL524263G', 'LLREL524633', 
-                            'LLREL524903', 'LLREPTWSLP367224', 'LLREPTWSLP367230', 
-                            'LLREPWSLP367224', 'LLREPWSLP367230', 'LLREWSCCLP363624', 
-                            'LLREWSCCLP423624', 'LLREWSCCLP424224', 'LLREWSCCLP424230', 
-                            'LLREWSCCLP483624', 'LLREWSCCLP484224', 'LLREWSCCLP484230', 
-                            'LLREWSCCLP484824', 'LLREWSCCLP484830', 'LLREWSCCLP603624', 
-                            'LLREWSCCLP604224', 'LLREWSCCLP604230', 'LLREWSCCLP604824', 
-                            'LLREWSCCLP604830', 'LLREWSLP2424', 'LLREWSLP2430', 
-                            'LLREWSLP2436', 'LLREWSLP2442', 'LLREWSLP2448', 'LLREWSLP3024', 
-                            'LLREWSLP3030', 'LLREWSLP3036', 'LLREWSLP3042', 'LLREWSLP3048'
-                        )
-                    )
-                    OR (pt.reference_mask IS NULL AND pt.pricelist = TRUE)
+    query, params = _build_products_query(since)
+    itersize = getattr(settings, 'PRODUCT_SYNC_ITERSIZE', 2000)
+    lookup_size = getattr(settings, 'PRODUCT_SYNC_LOOKUP_SIZE', 1000)
+    batch_size = getattr(settings, 'PRODUCT_SYNC_BATCH_SIZE', 100)
+
+    expected_products = None
+    if progress_callback:
+        progress_callback(2, "Contando productos en el ERP")
+        try:
+            expected_products = _count_erp_products(query, params)
+        except Exception as e:
+            print(f"No se pudo contar los productos del ERP: {str(e)}")
+        progress_callback(5, f"Sincronizando {expected_products or ''} productos".replace('  ', ' '))
+
+    print("Procesando y sincronizando productos...")
+    # Con COPY la carga y las eliminaciones se aplican en una sola transacción;
+    # el avance se registra por otra conexión (ver task_registry.TASKS_DATABASE)
+    with (transaction.atomic() if loader == LOADER_COPY else nullcontext()):
+        try:
+            products = _iter_erp_products(query + PRODUCTS_ORDER, params, itersize)
+            if progress_callback:
+                products = _report_progress(products, progress_callback, expected_products)
+            products = _transform_products(products, stats)
+            products = _dedupe_products(products)
+            if full:
+                # Las llaves que llegan del ERP se guardan para depurar products_cache
+                _create_seen_table()
+                products = _record_seen(products)
+            # Solo se escriben los productos nuevos o con contenido distinto
+            products = _resolve_existing(products, stats, lookup_size)
+            if loader == LOADER_COPY:
+                upsert_stats = copy_upsert(
+                    'products_cache', PRODUCT_COPY_COLUMNS, products, 'reference_mask',
+                    compare_column='sync_hash'
                 )
-        """)
-        
-        columns = [desc[0] for desc in cursor.description]
-        
-        print("Procesando y sincronizando productos...")
-        batch_size = 100
-        current_batch = []
-        
-        # Obtener un mapa de los productos existentes en Supabase para preservar las URLs de imágenes
-        print("Obteniendo productos existentes en Supabase para preservar imágenes...")
+                stats['successful'] = upsert_stats['written']
+            else:
+                print("Conectando a Supabase...")
+                supabase: Client = create_client(
+                    settings.SUPABASE_URL,
+                    settings.SUPABASE_KEY
+                )
+                upserter = BatchUpserter(
+                    supabase, 'products_cache', on_conflict='reference_mask',
+                    batch_size=batch_size, label='productos'
+                )
+                upsert_stats = upserter.run(products)
+                stats['successful'] = upsert_stats['successful']
+                stats['failed_batches'] += upsert_stats['failed_batches']
+                stats['upstream_calls'] += upsert_stats['upstream_calls']
+        except Exception as e:
+            # Error al leer del ERP o al cargar: la marca de agua no debe avanzar
+            stats['failed_batches'] += 1
+            print(f" Error al sincronizar productos: {str(e)}")
+
+        total_products = stats['total']
+        successful_products = stats['successful']
+        failed_batches = stats['failed_batches']
+
+        # Eliminar de products_cache los productos que ya no pertenecen al catálogo
         try:
-            existing_products_result = supabase.table('products_cache').select('reference_mask,image_url').execute()
-            existing_products_map = {}
-            if existing_products_result.data:
-                for product in existing_products_result.data:
-                    if product.get('reference_mask') and product.get('image_url'):
-                        existing_products_map[product['reference_mask']] = product['image_url']
-                print(f"Se encontraron {len(existing_products_map)} productos con imágenes en Supabase")
+            if full:
+                # Los productos en caché que no vinieron del ERP ya no existen
+                if total_products and not failed_batches:
+                    deleted_products = _delete_unseen_products()
+            else:
+                deactivated_ids = _get_deactivated_product_ids(since)
+                if deactivated_ids:
+                    deleted_products, _ = ProductsCache.objects.filter(id__in=deactivated_ids).delete()
+            if deleted_products:
+                print(f"Productos eliminados de products_cache: {deleted_products}")
         except Exception as e:
-            print(f"Error al obtener productos existentes: {str(e)}")
-            existing_products_map = {}
-        
-        for row in cursor.fetchall():
-            total_products += 1
-            
-            try:
-                # Convertir a diccionario
-                product = dict(zip(columns, row))
-                
-                # Validar datos requeridos
-                if not product['id']:
-                    raise ValueError(f"ID faltante para el producto: {product.get('name_spanish', 'N/A')}")
-                
-                # Si reference_mask es nulo, usar note_pricelist
-                if product['reference_mask'] is None and product.get('note_pricelist'):
-                    product['reference_mask'] = product['note_pricelist']
-                
-                # Filtrar solo los campos que existen en la tabla products_cache
-                allowed_fields = [
-                    'id', 'name_spanish', 'reference_mask', 'type_id', 'family_id', 
-                    'line_id', 'group_id', 'type_name', 'family_name', 
-                    'line_name', 'group_name', 'is_line', 'active', 
-                    'default_code', 'description_sale', 'image_url', 'last_sync'
-                ]
-                
-                # Crear un nuevo diccionario con solo los campos permitidos y mapear name_spanish a name
-                filtered_product = {}
-                for field in allowed_fields:
-                    if field in product:
-                        if field == 'name_spanish':
-                            filtered_product['name'] = product[field]  # Usar name_spanish como name
-                        else:
-                            filtered_product[field] = product[field]
-                
-                # Verificar si el producto tiene una URL de imagen en Supabase
-                has_existing_image = False
-                if filtered_product.get('reference_mask') and filtered_product['reference_mask'] in existing_products_map:
-                    filtered_product['image_url'] = existing_products_map[filtered_product['reference_mask']]
-                    has_existing_image = True
-                    preserved_images += 1
-                    print(f"Preservando imagen para {filtered_product['reference_mask']}: {filtered_product['image_url']}")
-                
-                # Si no tiene imagen existente, intentar obtenerla de cotizador_imagenproducto
-                if not has_existing_image and filtered_product.get('reference_mask'):
-                    image_result = supabase.table('cotizador_imagenproducto')\
-                        .select('url')\
-                        .eq('clave_padre', filtered_product['reference_mask'])\
-                        .execute()
-                    
-                    # Agregar URL de imagen si existe
-                    if image_result.data:
-                        filtered_product['image_url'] = image_result.data[0]['url']
-                        products_with_images += 1
-                    else:
-                        filtered_product['image_url'] = None
-                elif not has_existing_image:
-                    filtered_product['image_url'] = None
-                
-                # Agregar timestamp
-                filtered_product['last_sync'] = datetime.now().isoformat()
-                
-                current_batch.append(filtered_product)
-                
-                # Si alcanzamos el tamaño del lote, sincronizar
-                if len(current_batch) >= batch_size:
-                    try:
-                        batch_number = total_products // batch_size
-                        print(f"Sincronizando lote {batch_number} ({len(current_batch)} productos)...")
-                        
-                        # Eliminar duplicados en el lote basado en reference_mask
-                        unique_batch = {}
-                        for item in current_batch:
-                            if item.get('reference_mask'):  # Solo incluir si tiene reference_mask (que puede venir de note_pricelist)
-                                unique_batch[item['reference_mask']] = item
-                            else:
-                                print(f" Advertencia: Producto ID {item.get('id')} sin reference_mask ni note_pricelist")
-                        unique_batch = list(unique_batch.values())
-                        
-                        if unique_batch:
-                            result = supabase.table('products_cache').upsert(unique_batch, on_conflict='reference_mask').execute()
-                            
-                            if result.data:
-                                successful_products += len(unique_batch)
-                                print(f" Lote {batch_number} sincronizado")
-                            else:
-                                raise Exception("No se recibió confirmación de Supabase")
-                        else:
-                            print(f" Lote {batch_number} no contenía productos válidos para sincronizar")
-                            
-                    except Exception as e:
-                        print(f" Error en lote {batch_number}: {str(e)}")
-                    
-                    # Limpiar el lote actual
-                    current_batch = []
-                    
-                    # Pequeña pausa para evitar sobrecarga
-                    time.sleep(0.5)
-                
-            except Exception as e:
-                print(f" Error en producto {row[2] if len(row) > 2 else 'desconocido'}: {str(e)}")
-
-        # Sincronizar el último lote si quedaron productos
-        if current_batch:
-            try:
-                print(f"\nSincronizando lote final ({len(current_batch)} productos)...")
-                
-                # Eliminar duplicados en el lote final basado en reference_mask
-                unique_batch = {}
-                for item in current_batch:
-                    if item.get('reference_mask'):  # Solo incluir si tiene reference_mask (que puede venir de note_pricelist)
-                        unique_batch[item['reference_mask']] = item
-                    else:
-                        print(f" Advertencia: Producto ID {item.get('id')} sin reference_mask ni note_pricelist")
-                unique_batch = list(unique_batch.values())
-                
-                if unique_batch:
-                    result = supabase.table('products_cache').upsert(unique_batch, on_conflict='reference_mask').execute()
-                    
-                    if result.data:
-                        successful_products += len(unique_batch)
-                        print(" Lote final sincronizado")
-                    else:
-                        raise Exception("No se recibió confirmación de Supabase")
-                else:
-                    print(" Lote final no contenía productos válidos para sincronizar")
-                    
-            except Exception as e:
-                print(f" Error en lote final: {str(e)}")
-
-        # Mostrar resumen
-        end_time = datetime.now()
-        duration = end_time - start_time
-        
-        print("\n=== Resumen de Sincronización ===")
-        print(f"Tiempo total: {duration}")
-        print(f"Productos en ERP: {total_products}")
-        print(f"Productos sincronizados: {successful_products}")
-        print(f"Productos con imágenes: {products_with_images}")
-        print(f"Imágenes preservadas: {preserved_images}")
-        print(f"Productos sin imágenes: {total_products - products_with_images - preserved_images}")
-        
-        if successful_products < total_products:
-            print(f" No se sincronizaron {total_products - successful_products} productos")
-        
-        return {
-            "total": total_products,
-            "successful": successful_products,
-            "with_images": products_with_images,
-            "preserved_images": preserved_images,
-            "duration": str(duration)
-        }
+            failed_batches += 1
+            print(f" Error al eliminar productos desactivados: {str(e)}")
+        finally:
+            if full:
+                try:
+                    _drop_seen_table()
+                except Exception as e:
+                    print(f" Error al eliminar la tabla temporal {SEEN_TABLE}: {str(e)}")
+
+    # Los conteos de paginación en caché dejan de ser válidos si cambió el catálogo
+    if stats['inserted'] or stats['updated'] or deleted_products:
+        bump_count_version(ProductsCache._meta.db_table)
+
+    if progress_callback:
+        progress_callback(98, "Actualizando marca de agua")
+
+    # Avanzar la marca de agua solo si todo se sincronizó; si no, el
+    # siguiente ciclo vuelve a leer el mismo rango
+    if not failed_batches:
+        max_change_date = stats['max_change_date']
+        if max_change_date is not None:
+            max_change_date = _from_erp_datetime(max_change_date)
+            if watermark.last_write_date is None or max_change_date > watermark.last_write_date:
+                watermark.last_write_date = max_change_date
+        elif watermark.last_write_date is None:
+            watermark.last_write_date = sync_started_at
+        if full:
+            watermark.last_full_sync = sync_started_at
+        watermark.save()
+    else:
+        print(f" {failed_batches} lotes con error; la marca de agua no se actualiza")
 
-def sync_clients_to_supabase(clients_data):
+    # Mostrar resumen
+    end_time = datetime.now()
+    duration = end_time - start_time
+    _sample_memory(stats)
+    peak_memory = stats['peak_rss_mb']
+    products_with_images = stats['with_images']
+    preserved_images = stats['preserved_images']
+    
+    print("\n=== Resumen de Sincronización ===")
+    print(f"Tiempo total: {duration}")
+    print(f"Productos en ERP: {total_products}")
+    print(f"Productos sincronizados: {successful_products}")
+    print(f"Nuevos: {stats['inserted']}, actualizados: {stats['updated']}, sin cambios: {stats['unchanged']}")
+    print(f"Productos con imágenes: {products_with_images}")
+    print(f"Imágenes preservadas: {preserved_images}")
+    print(f"Productos sin imágenes: {total_products - products_with_images - preserved_images}")
+    print(f"Productos eliminados: {deleted_products}")
+    print(f"Llamadas a Supabase: {stats['upstream_calls']}")
+    print(f"Memoria (RSS) máxima durante la sincronización: {peak_memory} MB (inicio {memory_at_start} MB)")
+    logger.info(
+        f"Sincronización de productos: {successful_products}/{total_products} en {duration}, "
+        f"memoria máxima {peak_memory} MB (inicio {memory_at_start} MB)"
+    )
+    
+    pending_products = stats['inserted'] + stats['updated']
+    if successful_products < pending_products:
+        print(f" No se sincronizaron {pending_products - successful_products} productos")
+    
+    return {
+        "total": total_products,
+        "successful": successful_products,
+        "with_images": products_with_images,
+        "preserved_images": preserved_images,
+        "inserted": stats['inserted'],
+        "updated": stats['updated'],
+        "unchanged": stats['unchanged'],
+        "deleted": deleted_products,
+        "upstream_calls": stats['upstream_calls'],
+        "batches": upsert_stats,
+        "peak_memory_mb": peak_memory,
+        "memory_delta_mb": (
+            round(peak_memory - memory_at_start, 1)
+            if peak_memory is not None and memory_at_start is not None else None
+        ),
+        "mode": 'full' if full else 'incremental',
+        "loader": loader,
+        "watermark": watermark.last_write_date.isoformat() if watermark.last_write_date else None,
+        "duration": str(duration)
+    }
+
+def sync_clients_to_supabase(clients_data, loader=None):
     """
     Sincroniza los clientes desde la API de Odoo a Supabase.
     
     Args:
         clients_data (list): Lista de diccionarios con los datos de los clientes
+        loader (str): 'rest' (upserts por la API de Supabase) o 'copy' (COPY por
+            la conexión directa, en una sola transacción). Por defecto SYNC_LOADER.
         
     Returns:
         dict: Estadísticas de la sincronización
     """
-    print("Iniciando sincronización de clientes a Supabase...")
-    
-    # Configuración de Supabase
-    print("Conectando a Supabase...")
-    supabase: Client = create_client(
-        settings.SUPABASE_URL,
-        settings.SUPABASE_KEY
-    )
+    loader = get_loader(loader)
+    print(f"Iniciando sincronización de clientes a Supabase (carga {loader})...")
 
     # Estadísticas
     total_clients = len(clients_data)
-    successful_clients = 0
     error_count = 0
     start_time = datetime.now()
     
@@ -363,96 +692,70 @@ def sync_clients_to_supabase(clients_data):
         }
     
     print(f"Procesando {total_clients} clientes...")
-    
-    # Procesar los clientes en lotes para evitar sobrecarga
-    batch_size = 50
-    current_batch = []
-    
+
+    stats = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+    existing_hashes = {}
+    try:
+        existing_hashes = dict(Cliente.objects.values_list('partner_id', 'sync_hash'))
+    except Exception as e:
+        print(f"Error al obtener clientes existentes: {str(e)}")
+
+    # Filtrar solo los campos que necesitamos, sin duplicados por partner_id
+    unique_clients = {}
     for client in clients_data:
+        # Verificar que el cliente tenga partner_id
+        if not client.get('partner_id'):
+            print(f"Cliente sin partner_id: {client}")
+            error_count += 1
+            continue
+
         try:
-            # Verificar que el cliente tenga partner_id
-            if not client.get('partner_id'):
-                print(f"Cliente sin partner_id: {client}")
-                error_count += 1
-                continue
-            
-            # Filtrar solo los campos que necesitamos
-            filtered_client = {
-                'partner_id': client.get('partner_id'),
-                'name_partner': client.get('name_partner', ''),
-                'rfc': client.get('rfc', '')
-            }
-            
-            current_batch.append(filtered_client)
-            
-            # Si alcanzamos el tamaño del lote, sincronizar
-            if len(current_batch) >= batch_size:
-                try:
-                    batch_number = (successful_clients + error_count) // batch_size
-                    print(f"Sincronizando lote {batch_number} ({len(current_batch)} clientes)...")
-                    
-                    # Eliminar duplicados en el lote basado en partner_id
-                    unique_batch = {}
-                    for item in current_batch:
-                        if item.get('partner_id'):
-                            unique_batch[item['partner_id']] = item
-                        else:
-                            print(f" Advertencia: Cliente sin partner_id")
-                    unique_batch = list(unique_batch.values())
-                    
-                    if unique_batch:
-                        result = supabase.table('cotizador_cliente').upsert(unique_batch, on_conflict='partner_id').execute()
-                        
-                        if result.data:
-                            successful_clients += len(unique_batch)
-                            print(f" Lote {batch_number} sincronizado")
-                        else:
-                            raise Exception("No se recibió confirmación de Supabase")
-                    else:
-                        print(f" Lote {batch_number} no contenía clientes válidos para sincronizar")
-                        
-                except Exception as e:
-                    print(f" Error en lote {batch_number}: {str(e)}")
-                    error_count += len(current_batch)
-                
-                # Limpiar el lote actual
-                current_batch = []
-                
-                # Pequeña pausa para evitar sobrecarga
-                time.sleep(0.5)
-            
-        except Exception as e:
-            print(f" Error en cliente {client.get('partner_id', 'desconocido')}: {str(e)}")
+            partner_id = int(client['partner_id'])
+        except (TypeError, ValueError):
+            print(f"partner_id no es un entero válido: {client['partner_id']}")
             error_count += 1
-    
-    # Sincronizar el último lote si quedaron clientes
-    if current_batch:
+            continue
+
+        unique_clients[partner_id] = {
+            'partner_id': partner_id,
+            'name_partner': client.get('name_partner', ''),
+            'rfc': client.get('rfc', '')
+        }
+
+    # Solo se escriben los clientes nuevos o con contenido distinto
+    changed_clients = list(_skip_unchanged(
+        unique_clients.values(), 'partner_id', CLIENT_HASH_FIELDS, existing_hashes, stats
+    ))
+    print(f"Clientes nuevos: {stats['inserted']}, modificados: {stats['updated']}, sin cambios: {stats['unchanged']}")
+
+    if loader == LOADER_COPY:
         try:
-            print(f"\nSincronizando lote final ({len(current_batch)} clientes)...")
-            
-            # Eliminar duplicados en el lote final basado en partner_id
-            unique_batch = {}
-            for item in current_batch:
-                if item.get('partner_id'):
-                    unique_batch[item['partner_id']] = item
-                else:
-                    print(f" Advertencia: Cliente sin partner_id")
-            unique_batch = list(unique_batch.values())
-            
-            if unique_batch:
-                result = supabase.table('cotizador_cliente').upsert(unique_batch, on_conflict='partner_id').execute()
-                
-                if result.data:
-                    successful_clients += len(unique_batch)
-                    print(" Lote final sincronizado")
-                else:
-                    raise Exception("No se recibió confirmación de Supabase")
-            else:
-                print(" Lote final no contenía clientes válidos para sincronizar")
-                
+            upsert_stats = copy_upsert(
+                'cotizador_cliente', ['partner_id', 'name_partner', 'rfc', 'sync_hash'],
+                changed_clients, 'partner_id', compare_column='sync_hash'
+            )
+            successful_clients = upsert_stats['written']
         except Exception as e:
-            print(f" Error en lote final: {str(e)}")
-            error_count += len(current_batch)
+            print(f" Error en la carga con COPY: {str(e)}")
+            upsert_stats = None
+            successful_clients = 0
+            error_count += len(changed_clients)
+    else:
+        # Configuración de Supabase
+        print("Conectando a Supabase...")
+        supabase: Client = create_client(
+            settings.SUPABASE_URL,
+            settings.SUPABASE_KEY
+        )
+
+        # Enviar los clientes en lotes concurrentes
+        upserter = BatchUpserter(
+            supabase, 'cotizador_cliente', on_conflict='partner_id',
+            batch_size=50, label='clientes'
+        )
+        upsert_stats = upserter.run(changed_clients)
+        successful_clients = upsert_stats['successful']
+        error_count += upsert_stats['failed']
     
     # Mostrar resumen
     end_time = datetime.now()
@@ -462,15 +765,22 @@ def sync_clients_to_supabase(clients_data):
     print(f"Tiempo total: {duration}")
     print(f"Clientes totales: {total_clients}")
     print(f"Clientes sincronizados: {successful_clients}")
+    print(f"Clientes sin cambios: {stats['unchanged']}")
     print(f"Errores: {error_count}")
     
-    if successful_clients < total_clients:
-        print(f" No se sincronizaron {total_clients - successful_clients} clientes")
+    if successful_clients < len(changed_clients):
+        print(f" No se sincronizaron {len(changed_clients) - successful_clients} clientes")
     
     return {
         'total': total_clients,
         'successful': successful_clients,
+        'inserted': stats['inserted'],
+        'updated': stats['updated'],
+        'unchanged': stats['unchanged'],
+        'deleted': 0,
         'errors': error_count,
+        'loader': loader,
+        'batches': upsert_stats,
         'duration': str(duration)
     }
 
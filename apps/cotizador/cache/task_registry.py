@@ -0,0 +1,157 @@
+"""
+Registro de tareas de sincronización respaldado por la base de datos.
+
+Las vistas crean el registro (y con él el candado de deduplicación) antes de
+enviar la tarea a Celery; la tarea actualiza su estado y avance conforme
+se ejecuta. Cualquier worker puede consultar el estado con ``get_task``.
+
+El estado y el avance se escriben por la conexión ``TASKS_DATABASE`` (la misma
+base que default), así se confirman de inmediato aunque la tarea corra dentro
+de una transacción de default, como la carga con COPY.
+"""
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import SyncTask
+
+logger = logging.getLogger(__name__)
+
+TASKS_DATABASE = 'tasks'
+
+
+class TaskAlreadyRunning(Exception):
+    """Ya existe una tarea activa con el mismo nombre."""
+
+    def __init__(self, task):
+        self.task = task
+        super().__init__(f"La tarea {task.name} ya está en ejecución ({task.task_id})")
+
+
+def _stale_after():
+    return timedelta(seconds=getattr(settings, 'SYNC_TASK_STALE_SECONDS', 2 * 60 * 60))
+
+
+def get_active_task(name):
+    """Retorna la tarea activa (pendiente o en ejecución) con ese nombre, si existe."""
+    return SyncTask.objects.filter(name=name, status__in=SyncTask.ACTIVE_STATUSES).first()
+
+
+def create_task(name, params=None):
+    """
+    Crea el registro de una tarea y toma el candado de su nombre.
+
+    Si hay otra tarea activa con el mismo nombre se lanza TaskAlreadyRunning,
+    salvo que lleve más de SYNC_TASK_STALE_SECONDS sin actualizarse (el worker
+    que la ejecutaba murió); en ese caso se marca como error y se reemplaza.
+    """
+    try:
+        with transaction.atomic():
+            return SyncTask.objects.create(name=name, params=params or {})
+    except IntegrityError:
+        active = get_active_task(name)
+        if active is not None:
+            if active.updated_at >= timezone.now() - _stale_after():
+                raise TaskAlreadyRunning(active)
+            logger.warning(f"Liberando tarea abandonada {active.name} ({active.task_id})")
+            fail_task(active.task_id, "La tarea dejó de reportar avance")
+
+    # La tarea activa terminó o se liberó: reintentar una vez
+    try:
+        with transaction.atomic():
+            return SyncTask.objects.create(name=name, params=params or {})
+    except IntegrityError:
+        active = get_active_task(name)
+        if active is None:
+            raise
+        raise TaskAlreadyRunning(active)
+
+
+def get_task(task_id):
+    """Retorna el registro de la tarea o None si no existe."""
+    try:
+        return SyncTask.objects.get(task_id=task_id)
+    except (SyncTask.DoesNotExist, ValueError, ValidationError):
+        return None
+
+
+def start_task(task_id, message=''):
+    """Marca la tarea como en ejecución."""
+    SyncTask.objects.using(TASKS_DATABASE).filter(task_id=task_id).update(
+        status=SyncTask.STATUS_RUNNING, message=message[:255], updated_at=timezone.now()
+    )
+
+
+def set_progress(task_id, progress, message=None):
+    """Actualiza el porcentaje de avance (0-100) y opcionalmente el mensaje."""
+    fields = {'progress': max(0, min(100, int(progress))), 'updated_at': timezone.now()}
+    if message is not None:
+        fields['message'] = message[:255]
+    SyncTask.objects.using(TASKS_DATABASE).filter(task_id=task_id).update(**fields)
+
+
+def complete_task(task_id, stats=None, message='Completada'):
+    """Marca la tarea como completada y guarda sus estadísticas."""
+    now = timezone.now()
+    task = SyncTask.objects.using(TASKS_DATABASE).filter(task_id=task_id).first()
+    if task is None:
+        return
+    task.status = SyncTask.STATUS_COMPLETED
+    task.progress = 100
+    task.message = message[:255]
+    task.stats = stats
+    task.finished_at = now
+    task.save(
+        using=TASKS_DATABASE,
+        update_fields=['status', 'progress', 'message', 'stats', 'finished_at', 'updated_at']
+    )
+
+
+def fail_task(task_id, error, tb=None):
+    """Marca la tarea como fallida."""
+    SyncTask.objects.using(TASKS_DATABASE).filter(task_id=task_id).update(
+        status=SyncTask.STATUS_ERROR,
+        error=f"{error}\n\n{tb}" if tb else str(error),
+        message='Error',
+        finished_at=timezone.now(),
+        updated_at=timezone.now(),
+    )
+
+
+def run_task(task_id, name, func, params=None, **kwargs):
+    """
+    Ejecuta ``func`` actualizando el registro de la tarea.
+
+    Si ``task_id`` es None (por ejemplo, una ejecución de Celery beat) se crea
+    el registro aquí; si ya hay una tarea activa con el mismo nombre, la
+    ejecución se omite.
+
+    ``func`` recibe ``progress_callback(percent, message=None)`` además de kwargs.
+    """
+    if task_id is None:
+        try:
+            task_id = create_task(name, params or kwargs).task_id
+        except TaskAlreadyRunning as e:
+            logger.info(f"Se omite {name}: {str(e)}")
+            return {'skipped': True, 'running_task_id': str(e.task.task_id)}
+
+    start_task(task_id, 'En ejecución')
+
+    def progress_callback(percent, message=None):
+        try:
+            set_progress(task_id, percent, message)
+        except Exception as e:
+            logger.warning(f"No se pudo actualizar el avance de {task_id}: {str(e)}")
+
+    try:
+        result = func(progress_callback=progress_callback, **kwargs)
+    except Exception as e:
+        fail_task(task_id, str(e), traceback.format_exc())
+        raise
+    complete_task(task_id, result)
+    return result
@@ -2,18 +2,96 @@ from celery import shared_task
 from celery.schedules import crontab
 from celery.utils.log import get_task_logger
 from .sync import sync_products_to_supabase
+from .task_registry import run_task
 
 logger = get_task_logger(__name__)
 
 @shared_task
-def sync_products_task():
+def sync_products_task(full=False, loader=None, task_id=None):
     """
-    Tarea Celery para sincronizar productos desde PostgreSQL a Supabase
+    Tarea Celery para sincronizar productos desde PostgreSQL a Supabase.
+    Es incremental salvo que se indique full=True; loader elige entre
+    'rest' y 'copy' (por defecto SYNC_LOADER).
+
+    El estado y el avance se guardan en SyncTask; task_id es el registro
+    creado por la vista (si no se indica, se crea uno y la ejecución se omite
+    cuando ya hay otra sincronización de productos en curso).
     """
     try:
-        result = sync_products_to_supabase()
+        result = run_task(
+            task_id, 'sync_products', sync_products_to_supabase,
+            params={'full': full, 'loader': loader},
+            full=full, loader=loader
+        )
         logger.info(f'Sincronización completada: {result}')
         return result
     except Exception as e:
         logger.error(f'Error en sincronización: {str(e)}')
         raise
+
+def _sync_images(batch_size=100, validate_urls=False, force_update=False, progress_callback=None):
+    """
+    Ejecuta el comando sync_products_cache_images y extrae las estadísticas
+    de su salida.
+    """
+    from io import StringIO
+    import time
+    from django.core.management import call_command
+
+    # Registrar tiempo de inicio
+    start_time = time.time()
+    if progress_callback:
+        progress_callback(5, 'Sincronizando imágenes')
+
+    # Capturar la salida del comando
+    output = StringIO()
+    call_command(
+        'sync_products_cache_images',
+        batch_size=batch_size,
+        validate_urls=validate_urls,
+        force_update=force_update,
+        verbosity=2,
+        stdout=output
+    )
+
+    # Calcular tiempo total de ejecución
+    execution_time = time.time() - start_time
+
+    # Procesar la salida para extraer estadísticas
+    output_text = output.getvalue()
+    stats = {}
+    for line in output_text.split('\n'):
+        if 'Total de productos procesados:' in line:
+            stats['total_productos'] = int(line.split(':')[1].strip())
+        elif 'Productos actualizados:' in line:
+            stats['actualizados'] = int(line.split(':')[1].strip())
+        elif 'Productos sin cambios:' in line:
+            stats['sin_cambios'] = int(line.split(':')[1].strip())
+        elif 'Productos sin imagen:' in line:
+            stats['sin_imagen'] = int(line.split(':')[1].strip())
+        elif 'Errores:' in line and 'Error' not in line[:5]:  # Evitar líneas de error completas
+            stats['errores'] = int(line.split(':')[1].strip())
+
+    # Añadir detalles adicionales
+    stats['execution_time_seconds'] = round(execution_time, 2)
+    stats['details'] = output_text[-2000:] if len(output_text) > 2000 else output_text
+
+    return stats
+
+@shared_task
+def sync_images_task(batch_size=100, validate_urls=False, force_update=False, task_id=None):
+    """
+    Tarea Celery para sincronizar las URLs de imágenes de cotizador_imagenproducto
+    a products_cache. El estado y el avance se guardan en SyncTask.
+    """
+    try:
+        result = run_task(
+            task_id, 'sync_images', _sync_images,
+            params={'batch_size': batch_size, 'validate_urls': validate_urls, 'force_update': force_update},
+            batch_size=batch_size, validate_urls=validate_urls, force_update=force_update
+        )
+        logger.info(f'Sincronización de imágenes completada: {result}')
+        return result
+    except Exception as e:
+        logger.error(f'Error en sincronización de imágenes: {str(e)}')
+        raise
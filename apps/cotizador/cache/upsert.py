@@ -0,0 +1,200 @@
+"""
+Envío concurrente de upserts por lotes a Supabase (PostgREST).
+
+BatchUpserter agrupa los registros en lotes y los envía mediante un pool de
+hilos acotado, reintentando con backoff exponencial y jitter cuando Supabase
+responde con 429/5xx o hay errores de red. El tamaño de lote se ajusta según
+la latencia observada: crece mientras las respuestas son rápidas y se reduce
+cuando son lentas o se recibe un 429.
+"""
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ALL_COMPLETED, FIRST_COMPLETED, wait
+
+import httpx
+from django.conf import settings
+from postgrest.exceptions import APIError
+
+logger = logging.getLogger(__name__)
+
+# Códigos HTTP que vale la pena reintentar
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+# Errores de PostgREST/PostgreSQL transitorios: conexión con la base de datos,
+# serialización, deadlock, statement timeout y límite de conexiones
+RETRYABLE_CODES = {'PGRST000', 'PGRST001', 'PGRST002', 'PGRST003',
+                   '40001', '40P01', '57014', '53300'}
+
+
+def _error_status(exc):
+    """Obtiene el status HTTP de un error, si se conoce."""
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code
+    if isinstance(exc, APIError):
+        # postgrest solo conserva el status cuando la respuesta no era JSON
+        try:
+            return int(exc.code)
+        except (TypeError, ValueError):
+            return None
+    return None
+
+
+def is_retryable(exc):
+    """Indica si un error de upsert es transitorio y se puede reintentar."""
+    if isinstance(exc, httpx.TransportError):
+        return True
+    status = _error_status(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    if isinstance(exc, APIError):
+        code = str(exc.code or '')
+        return code in RETRYABLE_CODES or code.startswith('08')
+    return False
+
+
+class BatchUpserter:
+    """
+    Envía registros a una tabla de Supabase con upserts por lotes concurrentes.
+
+    Uso:
+        upserter = BatchUpserter(supabase, 'products_cache', on_conflict='reference_mask')
+        stats = upserter.run(registros)
+    """
+
+    def __init__(self, supabase, table, on_conflict, batch_size=100,
+                 min_batch_size=None, max_batch_size=None, max_workers=None,
+                 max_retries=None, target_latency=None, label='registros'):
+        self.supabase = supabase
+        self.table = table
+        self.on_conflict = on_conflict
+        self.label = label
+        self.max_workers = max_workers or getattr(settings, 'SYNC_UPSERT_MAX_WORKERS', 4)
+        self.max_retries = max_retries if max_retries is not None else getattr(settings, 'SYNC_UPSERT_MAX_RETRIES', 5)
+        self.target_latency = target_latency or getattr(settings, 'SYNC_UPSERT_TARGET_LATENCY', 2.0)
+        self.min_batch_size = min_batch_size or max(1, batch_size // 10)
+        self.max_batch_size = max_batch_size or batch_size * 5
+        self.base_delay = 0.5
+        self.max_delay = 30
+
+        self._batch_size = batch_size
+        self._lock = threading.Lock()
+        self.stats = {
+            'batches': 0,
+            'successful': 0,
+            'failed': 0,
+            'failed_batches': 0,
+            'retries': 0,
+            'upstream_calls': 0,
+            'timings': [],
+        }
+
+    @property
+    def batch_size(self):
+        with self._lock:
+            return self._batch_size
+
+    def _adapt_batch_size(self, latency, throttled=False):
+        """Reduce el lote a la mitad si la respuesta fue lenta o limitada; si fue rápida, lo aumenta."""
+        with self._lock:
+            if throttled or latency > self.target_latency:
+                self._batch_size = max(self.min_batch_size, self._batch_size // 2)
+            elif latency < self.target_latency / 2:
+                self._batch_size = min(self.max_batch_size, int(self._batch_size * 1.5) or 1)
+
+    def _backoff(self, attempt):
+        """Espera exponencial con jitter completo."""
+        delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+        time.sleep(random.uniform(0, delay))
+
+    def _send(self, batch_number, batch):
+        """Envía un lote con reintentos. Retorna la entrada de tiempos del lote."""
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            call_started = time.monotonic()
+            with self._lock:
+                self.stats['upstream_calls'] += 1
+            try:
+                result = self.supabase.table(self.table).upsert(batch, on_conflict=self.on_conflict).execute()
+                latency = time.monotonic() - call_started
+                self._adapt_batch_size(latency)
+                if not result.data:
+                    raise Exception("No se recibió confirmación de Supabase")
+                with self._lock:
+                    self.stats['successful'] += len(batch)
+                print(f" Lote {batch_number} sincronizado ({len(batch)} {self.label}, {latency:.2f}s)")
+                return {
+                    'batch': batch_number,
+                    'size': len(batch),
+                    'seconds': round(time.monotonic() - started, 3),
+                    'attempts': attempt + 1,
+                    'status': 'ok',
+                }
+            except Exception as e:
+                latency = time.monotonic() - call_started
+                retryable = is_retryable(e)
+                if retryable and attempt < self.max_retries:
+                    self._adapt_batch_size(latency, throttled=_error_status(e) == 429)
+                    with self._lock:
+                        self.stats['retries'] += 1
+                    print(f" Reintentando lote {batch_number} (intento {attempt + 2}): {str(e)}")
+                    self._backoff(attempt)
+                    attempt += 1
+                    continue
+
+                with self._lock:
+                    self.stats['failed'] += len(batch)
+                    self.stats['failed_batches'] += 1
+                print(f" Error en lote {batch_number}: {str(e)}")
+                return {
+                    'batch': batch_number,
+                    'size': len(batch),
+                    'seconds': round(time.monotonic() - started, 3),
+                    'attempts': attempt + 1,
+                    'status': 'error',
+                    'error': str(e),
+                }
+
+    def _collect(self, futures, return_when):
+        done, pending = wait(futures, return_when=return_when)
+        for future in done:
+            self.stats['timings'].append(future.result())
+        return pending
+
+    def run(self, items):
+        """
+        Envía todos los registros del iterable y retorna las estadísticas.
+        El iterable se consume de forma perezosa: como máximo hay
+        ``max_workers * 2`` lotes en memoria a la vez.
+        """
+        # Inicializar el cliente PostgREST antes de usarlo desde varios hilos
+        self.supabase.table(self.table)
+
+        futures = set()
+        batch = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for item in items:
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    self.stats['batches'] += 1
+                    futures.add(executor.submit(self._send, self.stats['batches'], batch))
+                    batch = []
+                    if len(futures) >= self.max_workers * 2:
+                        futures = self._collect(futures, FIRST_COMPLETED)
+            if batch:
+                self.stats['batches'] += 1
+                futures.add(executor.submit(self._send, self.stats['batches'], batch))
+            self._collect(futures, ALL_COMPLETED)
+
+        self.stats['timings'].sort(key=lambda timing: timing['batch'])
+        seconds = [timing['seconds'] for timing in self.stats['timings']]
+        self.stats['avg_batch_seconds'] = round(sum(seconds) / len(seconds), 3) if seconds else 0
+        self.stats['max_batch_seconds'] = max(seconds) if seconds else 0
+        self.stats['final_batch_size'] = self.batch_size
+        logger.info(
+            f"Upsert {self.table}: {self.stats['successful']} {self.label} en {self.stats['batches']} lotes, "
+            f"{self.stats['retries']} reintentos, {self.stats['failed_batches']} lotes con error"
+        )
+        return self.stats
@@ -1,3 +1,5 @@
+from django.conf import settings
+from django.urls import re_path
 from rest_framework.routers import DefaultRouter
 from .views import ProductsCacheViewSet
 
@@ -6,3 +8,12 @@ router = DefaultRouter()
 router.register('', ProductsCacheViewSet, basename='products-cache')
 
 urlpatterns = router.urls
+
+# Vistas proxy async (servidor ASGI): tienen prioridad sobre las del router
+if settings.ASYNC_PROXY_VIEWS:
+    from . import async_views
+
+    urlpatterns = [
+        re_path(r'^detalles/(?P<clave>[^/.]+)/$', async_views.get_details, name='products-cache-get-details-async'),
+        re_path(r'^precio/(?P<reference_mask>[^/.]+)/$', async_views.precio, name='products-cache-precio-async'),
+    ] + urlpatterns
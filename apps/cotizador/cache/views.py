@@ -4,30 +4,48 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.pagination import PageNumberPagination
 from django_filters import rest_framework as filters
+import re
+import unicodedata
 import requests
-from django.db.models import Q
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+from django.db.models import Q, F, Case, When, Value, IntegerField, FloatField
 from django.conf import settings
 from urllib.parse import urlencode
 from .models import ProductsCache
-from .serializers import ProductsCacheSerializer, ProductImageUploadSerializer
+from .product_data import fetch_product_data, get_cache_stats, ProductDataError
+from .serializers import ProductsCacheSerializer, ProductImageUploadSerializer, ProductPriceBatchSerializer
 from apps.cotizador.models import CotizadorImagenproducto
+from apps.cotizador.pagination import CountingPaginator, KeysetPaginationMixin
 from apps.cotizador.utils.upload_helpers import upload_image_to_supabase
+from apps.core import ercules, resilience
 from supabase import create_client, Client
 
-class CustomPagination(PageNumberPagination):
+class CustomPagination(KeysetPaginationMixin, PageNumberPagination):
     """
-    Paginación personalizada que permite al cliente especificar el tamaño de página
+    Paginación personalizada que permite al cliente especificar el tamaño de página.
+    Con ?cursor= usa paginación por llave (ver KeysetPaginationMixin).
+
+    El total puede ser exacto o un estimado del planificador cuando el
+    resultado es grande (ver count_queryset); count_mode indica cuál.
     """
+    django_paginator_class = CountingPaginator
     page_size = 10
     page_size_query_param = 'page_size'
     max_page_size = 100
 
     def get_paginated_response(self, data):
+        if self.keyset:
+            return super().get_paginated_response(data)
+        paginator = self.page.paginator
         return Response({
-            'total': self.page.paginator.count,
+            'total': paginator.count,
+            'count_mode': 'exact' if paginator.exact else 'estimate',
+            'count_cached': paginator.cached,
             'page_size': self.get_page_size(self.request),
             'current_page': self.page.number,
-            'total_pages': self.page.paginator.num_pages,
+            'total_pages': paginator.num_pages,
             'next': self.get_next_link(),
             'previous': self.get_previous_link(),
             'results': data
@@ -71,6 +89,25 @@ class CustomPagination(PageNumberPagination):
         new_query = urlencode(query_params)
         return f"{base_url}?{new_query}" if new_query else base_url
 
+def _search_terms(value):
+    """
+    Divide el texto de búsqueda en palabras sin acentos, aptas para un tsquery.
+    """
+    normalized = unicodedata.normalize('NFKD', value)
+    normalized = ''.join(c for c in normalized if not unicodedata.combining(c))
+    return re.findall(r'\w+', normalized.lower())
+
+SEARCH_FIELDS = ('name', 'reference_mask', 'type_name', 'family_name', 'line_name', 'group_name')
+
+def _substring_query(term):
+    """
+    Q que coincide con el término como subcadena en cualquiera de los campos de búsqueda.
+    """
+    query = Q()
+    for field in SEARCH_FIELDS:
+        query |= Q(**{f'{field}__icontains': term})
+    return query
+
 class ProductFilter(filters.FilterSet):
     """
     Filtros para productos en caché.
@@ -91,6 +128,9 @@ class ProductFilter(filters.FilterSet):
     - La búsqueda con ?search= ahora soporta múltiples palabras y devuelve resultados
       que contienen TODAS las palabras en cualquiera de los campos de búsqueda.
       Ejemplo: ?search=escritorio metal (encuentra productos que contengan ambas palabras)
+    - Las palabras se buscan como prefijo y sin importar acentos (ej. ?search=escrit).
+    - Los resultados se ordenan por relevancia: primero el código exacto, luego
+      los que empiezan con el término y después por similitud.
     """
     search = filters.CharFilter(method='filter_search')
     codigo = filters.CharFilter(field_name='reference_mask', lookup_expr='exact')
@@ -102,59 +142,65 @@ class ProductFilter(filters.FilterSet):
 
     def filter_search(self, queryset, name, value):
         """
-        Búsqueda que coincide con cualquier campo especificado
+        Búsqueda que coincide con cualquier campo especificado.
+
+        Coincide por subcadena (icontains) en nombre, código, tipo, familia,
+        línea y grupo, con el término completo o con todas sus palabras, usando
+        los índices trigram. Además usa el índice de texto completo
+        (search_vector, español sin acentos) para las palabras como prefijo.
+
+        Los resultados se ordenan por: código exacto, prefijo de código o nombre,
+        relevancia del texto completo y similitud del nombre.
         """
         if not value or value.strip() == '':
             return queryset
-            
-        # Si el término de búsqueda tiene espacios, podemos buscar el término completo
-        # y también dividirlo en palabras para búsquedas más específicas
+
         value = value.strip()
-        
-        # Primero intentamos buscar el término completo (incluyendo espacios)
-        # Añadimos búsqueda exacta por código (reference_mask)
-        complete_term_query = (
-            Q(name__icontains=value) |
-            Q(type_name__icontains=value) |
-            Q(family_name__icontains=value) |
-            Q(line_name__icontains=value) |
-            Q(group_name__icontains=value) |
-            Q(reference_mask__icontains=value) |
-            Q(reference_mask__exact=value)  # Búsqueda exacta por código
-        )
-        
-        # Si el término tiene espacios, también buscamos cada palabra por separado
-        if ' ' in value:
-            # Dividir el término en palabras y eliminar palabras vacías
-            search_terms = [term for term in value.split() if term.strip()]
-            
-            if search_terms:
-                # Construir una consulta que requiera que todas las palabras estén presentes
-                multi_word_query = Q()
-                
-                for term in search_terms:
-                    term_query = (
-                        Q(name__icontains=term) |
-                        Q(type_name__icontains=term) |
-                        Q(family_name__icontains=term) |
-                        Q(line_name__icontains=term) |
-                        Q(group_name__icontains=term) |
-                        Q(reference_mask__icontains=term)
-                    )
-                    # Combinar con AND para requerir que todas las palabras coincidan
-                    multi_word_query &= term_query
-                
-                # Combinar ambas consultas con OR para encontrar coincidencias
-                # ya sea con el término completo o con todas las palabras individuales
-                return queryset.filter(complete_term_query | multi_word_query)
-        
-        # Si no hay espacios, simplemente usamos la consulta del término completo
-        return queryset.filter(complete_term_query)
+
+        # Término completo por subcadena (índices trigram sobre UPPER(campo))
+        search_query = _substring_query(value)
+
+        # Cada palabra por subcadena; todas las palabras deben estar presentes
+        words = value.split()
+        if len(words) > 1:
+            multi_word_query = Q()
+            for word in words:
+                multi_word_query &= _substring_query(word)
+            search_query |= multi_word_query
+
+        # Cada palabra como prefijo en el texto completo (sin acentos)
+        terms = _search_terms(value)
+        text_query = None
+        if terms:
+            text_query = SearchQuery(
+                ' & '.join(f'{term}:*' for term in terms),
+                search_type='raw',
+                config='spanish'
+            )
+            search_query |= Q(search_vector=text_query)
+
+        return queryset.filter(search_query).annotate(
+            search_priority=Case(
+                When(reference_mask__iexact=value, then=Value(0)),
+                When(reference_mask__istartswith=value, then=Value(1)),
+                When(name__istartswith=value, then=Value(2)),
+                default=Value(3),
+                output_field=IntegerField()
+            ),
+            search_rank=(
+                SearchRank(F('search_vector'), text_query)
+                if text_query is not None else Value(0.0, output_field=FloatField())
+            ),
+            search_similarity=TrigramSimilarity('name', value)
+        ).order_by('search_priority', '-search_rank', '-search_similarity', 'name')
 
     class Meta:
         model = ProductsCache
         fields = ['search', 'codigo', 'tipo', 'familia', 'grupo', 'linea', 'activo']
 
+# Pausas entre reintentos de un bloque de precios cuando el bulkhead está lleno
+BULKHEAD_RETRY_DELAYS = (0.5, 1, 2)
+
 class ProductsCacheViewSet(viewsets.ReadOnlyModelViewSet):
     """
     API endpoint para consultar productos en caché.
@@ -162,6 +208,8 @@ class ProductsCacheViewSet(viewsets.ReadOnlyModelViewSet):
     - Paginación:
       * Página actual: ?page=1
       * Tamaño de página: ?page_size=10 (máximo 100)
+      * Por cursor (scroll infinito): ?cursor= y después el valor de "next";
+        ordena por nombre y acepta ?count=estimate o ?count=exact
     - Búsqueda general con ?search= (busca en nombre, tipo, familia, grupo, línea y código)
     - Búsqueda exacta por código: ?codigo=777789
     - Filtros específicos por tipo, familia, grupo y línea
@@ -197,6 +245,7 @@ class ProductsCacheViewSet(viewsets.ReadOnlyModelViewSet):
     pagination_class = CustomPagination
     ordering_fields = '__all__'
     ordering = ['name']
+    keyset_ordering = ['name']
     
     def get_queryset(self):
         """
@@ -205,9 +254,11 @@ class ProductsCacheViewSet(viewsets.ReadOnlyModelViewSet):
         queryset = super().get_queryset()
         # Excluir productos de las líneas Radiant y Rapido
         queryset = queryset.exclude(line_name__in=['Radiant', 'Rapido', 'Electrical'])
-        return queryset
+        # El vector de búsqueda solo se usa en el WHERE/ORDER BY, no se serializa
+        return queryset.defer('search_vector')
 
-    def _parse_precios(self, precios_str):
+    @staticmethod
+    def _parse_precios(precios_str):
         """Obtiene el precio base del producto como un float"""
         if not precios_str:
             return None
@@ -229,7 +280,8 @@ class ProductsCacheViewSet(viewsets.ReadOnlyModelViewSet):
         except Exception:
             return None
 
-    def _parse_ids_precios(self, ids_precios_str):
+    @staticmethod
+    def _parse_ids_precios(ids_precios_str):
         """Convierte el string de ids_precios en un diccionario con valores float"""
         if not ids_precios_str:
             return {}
@@ -256,7 +308,8 @@ class ProductsCacheViewSet(viewsets.ReadOnlyModelViewSet):
         except Exception:
             return {}
 
-    def _process_product_data(self, product):
+    @classmethod
+    def _process_product_data(cls, product):
         """Procesa y estructura los datos del producto"""
         return {
             "informacion_general": {
@@ -292,8 +345,8 @@ class ProductsCacheViewSet(viewsets.ReadOnlyModelViewSet):
                 "ids_atributos": product.get("ids_atributos")
             },
             "precios": {
-                "precio_base": self._parse_precios(product.get("precios")),
-                "precios_unidades": self._parse_ids_precios(product.get("ids_precios"))
+                "precio_base": cls._parse_precios(product.get("precios")),
+                "precios_unidades": cls._parse_ids_precios(product.get("ids_precios"))
             },
             "empresa": {
                 "id": product.get("id_empresa"),
@@ -333,36 +386,21 @@ class ProductsCacheViewSet(viewsets.ReadOnlyModelViewSet):
             )
 
         try:
-            # URL de la API externa
-            api_url = "https://api2.ercules.mx/api/v1/common/product_data"
-            
-            # Parámetros de la consulta
-            params = {
-                "user_id": 2,
-                "products": 0,
+            # Consultar la API externa a través de la caché compartida
+            data = fetch_product_data({
                 "product_tmpl_ids": clave,
-                "line_ids": 0,
-                "group_ids": 0,
-                "type_ids": 0,
-                "family_ids": 0,
                 "only_line": 1
-            }
+            })
 
-            # Realizar la petición a la API externa
-            response = requests.get(api_url, params=params)
-            
-            # Verificar si la petición fue exitosa
-            if response.status_code == 200:
-                data = response.json()
-                # Procesar cada producto en la respuesta
-                processed_data = [self._process_product_data(product) for product in data]
-                return Response(processed_data)
-            else:
-                return Response(
-                    {"error": f"Error al consultar la API externa: {response.status_code}"},
-                    status=status.HTTP_502_BAD_GATEWAY
-                )
+            # Procesar cada producto en la respuesta
+            processed_data = [self._process_product_data(product) for product in data]
+            return Response(processed_data)
 
+        except ProductDataError as e:
+            return Response(
+                {"error": str(e)},
+                status=status.HTTP_502_BAD_GATEWAY
+            )
         except requests.RequestException as e:
             return Response(
                 {"error": f"Error de conexión: {str(e)}"},
@@ -389,56 +427,41 @@ class ProductsCacheViewSet(viewsets.ReadOnlyModelViewSet):
             )
 
         try:
-            # URL de la API externa
-            api_url = "https://api2.ercules.mx/api/v1/common/product_data"
-            
-            # Parámetros de la consulta
-            params = {
-                "user_id": 2,
-                "products": 0,
+            # Consultar la API externa a través de la caché compartida
+            data = fetch_product_data({
                 "product_tmpl_ids": reference_mask,
-                "line_ids": 0,
-                "group_ids": 0,
-                "type_ids": 0,
-                "family_ids": 0,
                 "only_line": 1
-            }
+            })
 
-            # Realizar la petición a la API externa
-            response = requests.get(api_url, params=params)
-            
-            # Verificar si la petición fue exitosa
-            if response.status_code == 200:
-                data = response.json()
-                if not data:
-                    return Response(
-                        {'error': f'No se encontró el producto con reference_mask: {reference_mask}'},
-                        status=status.HTTP_404_NOT_FOUND
-                    )
-                    
-                # Procesar el primer producto en la respuesta
-                processed_data = self._process_product_data(data[0])
-                
-                # Intentar obtener datos del caché si existen
-                try:
-                    cached_product = ProductsCache.objects.get(reference_mask=reference_mask)
-                    processed_data['cache'] = {
-                        'id': cached_product.id,
-                        'reference_mask': cached_product.reference_mask,
-                        'name': cached_product.name,
-                        'image_url': cached_product.image_url,
-                        'last_sync': cached_product.last_sync
-                    }
-                except ProductsCache.DoesNotExist:
-                    processed_data['cache'] = None
-                
-                return Response(processed_data)
-            else:
+            if not data:
                 return Response(
-                    {"error": f"Error al consultar la API externa: {response.status_code}"},
-                    status=status.HTTP_502_BAD_GATEWAY
+                    {'error': f'No se encontró el producto con reference_mask: {reference_mask}'},
+                    status=status.HTTP_404_NOT_FOUND
                 )
 
+            # Procesar el primer producto en la respuesta
+            processed_data = self._process_product_data(data[0])
+
+            # Intentar obtener datos del caché si existen
+            try:
+                cached_product = ProductsCache.objects.get(reference_mask=reference_mask)
+                processed_data['cache'] = {
+                    'id': cached_product.id,
+                    'reference_mask': cached_product.reference_mask,
+                    'name': cached_product.name,
+                    'image_url': cached_product.image_url,
+                    'last_sync': cached_product.last_sync
+                }
+            except ProductsCache.DoesNotExist:
+                processed_data['cache'] = None
+
+            return Response(processed_data)
+
+        except ProductDataError as e:
+            return Response(
+                {"error": str(e)},
+                status=status.HTTP_502_BAD_GATEWAY
+            )
         except requests.RequestException as e:
             return Response(
                 {"error": f"Error de conexión: {str(e)}"},
@@ -450,6 +473,122 @@ class ProductsCacheViewSet(viewsets.ReadOnlyModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @staticmethod
+    def _rows_by_code(data, chunk):
+        """
+        Primera fila de la respuesta de product_data por código (campo clave),
+        sin importar cuántos códigos tenga el bloque.
+        """
+        rows = {}
+        for product in data:
+            clave = str(product.get("clave") or "")
+            if clave in chunk and clave not in rows:
+                rows[clave] = product
+        return rows
+
+    @action(detail=False, methods=['post'], url_path='precios')
+    def precios(self, request):
+        """
+        Obtiene los detalles y precios de varios productos en una sola solicitud
+
+        Body: {"reference_masks": ["777789", "777790", ...]}
+
+        Los códigos se consultan a la API product_data en bloques de
+        PRODUCT_PRICE_CHUNK_SIZE, en paralelo, y se combinan con products_cache
+        en una sola consulta. La respuesta es un mapa por código; los códigos
+        que no se pudieron obtener se reportan en 'errores' con su status.
+
+        Las consultas en paralelo no pasan de la mitad de los lugares del
+        bulkhead del servicio, para dejar lugar a otras solicitudes; si aun
+        así está lleno, el bloque se reintenta después de una pausa.
+        """
+        serializer = ProductPriceBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        codes = serializer.validated_data['reference_masks']
+
+        # Bloques sobre los códigos ordenados: el mismo conjunto genera las
+        # mismas consultas y aprovecha la caché de product_data
+        chunk_size = max(1, getattr(settings, 'PRODUCT_PRICE_CHUNK_SIZE', 50))
+        ordered = sorted(codes)
+        chunks = [ordered[i:i + chunk_size] for i in range(0, len(ordered), chunk_size)]
+        upstream = ercules.ENDPOINTS['product_data'][3]
+        max_workers = max(1, min(
+            len(chunks),
+            getattr(settings, 'PRODUCT_PRICE_MAX_WORKERS', 3),
+            resilience.get_config(upstream)['max_concurrent'] // 2
+        ))
+
+        def fetch(chunk):
+            params = {
+                "product_tmpl_ids": ",".join(chunk),
+                "only_line": 1
+            }
+            for delay in BULKHEAD_RETRY_DELAYS:
+                try:
+                    return fetch_product_data(params)
+                except resilience.BulkheadFullError:
+                    time.sleep(delay)
+            return fetch_product_data(params)
+
+        productos = {}
+        errores = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(fetch, chunk): chunk for chunk in chunks}
+            for future in as_completed(futures):
+                chunk = futures[future]
+                try:
+                    data = future.result()
+                except ProductDataError as e:
+                    errores.update({code: {"error": str(e), "status": status.HTTP_502_BAD_GATEWAY} for code in chunk})
+                    continue
+                except requests.RequestException as e:
+                    errores.update({code: {"error": f"Error de conexión: {str(e)}", "status": status.HTTP_503_SERVICE_UNAVAILABLE} for code in chunk})
+                    continue
+                except Exception as e:
+                    errores.update({code: {"error": f"Error al obtener la información: {str(e)}", "status": status.HTTP_500_INTERNAL_SERVER_ERROR} for code in chunk})
+                    continue
+
+                rows = self._rows_by_code(data, chunk)
+                for code in chunk:
+                    if code in rows:
+                        productos[code] = self._process_product_data(rows[code])
+                    else:
+                        errores[code] = {
+                            "error": f"No se encontró el producto con reference_mask: {code}",
+                            "status": status.HTTP_404_NOT_FOUND
+                        }
+
+        # Datos de products_cache de todos los productos encontrados en una consulta
+        cached_products = ProductsCache.objects.filter(
+            reference_mask__in=list(productos)
+        ).only('id', 'reference_mask', 'name', 'image_url', 'last_sync')
+        cached_by_code = {product.reference_mask: product for product in cached_products}
+        for code, processed_data in productos.items():
+            cached_product = cached_by_code.get(code)
+            processed_data['cache'] = {
+                'id': cached_product.id,
+                'reference_mask': cached_product.reference_mask,
+                'name': cached_product.name,
+                'image_url': cached_product.image_url,
+                'last_sync': cached_product.last_sync
+            } if cached_product else None
+
+        return Response({
+            'total': len(codes),
+            'encontrados': len(productos),
+            'con_error': len(errores),
+            'productos': {code: productos[code] for code in codes if code in productos},
+            'errores': {code: errores[code] for code in codes if code in errores}
+        })
+
+    @action(detail=False, methods=['get'], url_path='cache-stats')
+    def cache_stats(self, request):
+        """
+        Estadísticas de la caché de la API product_data (hits, misses y tasa de aciertos)
+        """
+        return Response(get_cache_stats())
+
     @action(detail=False, methods=['get'])
     def tipos(self, request):
         """
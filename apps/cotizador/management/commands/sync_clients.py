@@ -1,7 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.db import transaction
 from apps.cotizador.models import Cliente
-import requests
+from apps.core import ercules
 import logging
 from datetime import datetime
 import json
@@ -47,6 +47,12 @@ class Command(BaseCommand):
             action='store_true',
             help='Omitir la sincronización con Supabase'
         )
+        parser.add_argument(
+            '--loader',
+            choices=['rest', 'copy'],
+            default=None,
+            help="Método de carga: 'rest' (API de Supabase) o 'copy' (COPY directo). Por defecto SYNC_LOADER"
+        )
 
     def handle(self, *args, **options):
         start_time = datetime.now()
@@ -62,7 +68,7 @@ class Command(BaseCommand):
         
         try:
             # Construir la URL con los parámetros
-            api_url = f"https://api.ercules.mx/api/v1/common/res_partner"
+            api_url = ercules.get_url('clientes')
             params = {
                 'user_id': user_id,
                 'fecha_ini': fecha_ini,
@@ -72,7 +78,7 @@ class Command(BaseCommand):
             
             # Realizar la petición a la API
             self.stdout.write(self.style.SUCCESS(f"Consultando API: {api_url}"))
-            response = requests.get(api_url, params=params)
+            response = ercules.get('clientes', params=params)
             
             # Verificar si la respuesta es exitosa
             if response.status_code != 200:
@@ -104,7 +110,7 @@ class Command(BaseCommand):
             if not skip_supabase:
                 self.stdout.write(self.style.SUCCESS("Sincronizando con Supabase..."))
                 try:
-                    supabase_stats = sync_clients_to_supabase(clients_data)
+                    supabase_stats = sync_clients_to_supabase(clients_data, loader=options['loader'])
                     self.stdout.write(self.style.SUCCESS(f"Sincronización con Supabase completada. Clientes sincronizados: {supabase_stats['successful']}"))
                 except Exception as e:
                     self.stdout.write(self.style.ERROR(f"Error en la sincronización con Supabase: {str(e)}"))
@@ -9,6 +9,19 @@ logger = logging.getLogger(__name__)
 class Command(BaseCommand):
     help = 'Sincroniza los productos desde la copia de Odoo directamente a Supabase'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Sincronización completa en lugar de incremental'
+        )
+        parser.add_argument(
+            '--loader',
+            choices=['rest', 'copy'],
+            default=None,
+            help="Método de carga: 'rest' (API de Supabase) o 'copy' (COPY directo). Por defecto SYNC_LOADER"
+        )
+
     def handle(self, *args, **options):
         start_time = datetime.now()
         logger.info(f"Iniciando sincronización de productos con Supabase: {start_time}")
@@ -16,7 +29,7 @@ class Command(BaseCommand):
         try:
             # Llamar directamente a la función de sincronización con Supabase
             self.stdout.write("Iniciando sincronización de productos con Supabase...")
-            result = sync_products_to_supabase()
+            result = sync_products_to_supabase(full=options['full'], loader=options['loader'])
             
             end_time = datetime.now()
             duration = end_time - start_time
@@ -26,6 +39,7 @@ class Command(BaseCommand):
             logger.info(f"Productos sincronizados: {result.get('successful', 0)}")
             logger.info(f"Productos con imágenes: {result.get('with_images', 0)}")
             logger.info(f"Productos sin imágenes: {result.get('without_images', 0)}")
+            logger.info(f"Productos eliminados: {result.get('deleted', 0)}")
             
             self.stdout.write(
                 self.style.SUCCESS(
@@ -34,6 +48,8 @@ class Command(BaseCommand):
                     f'- Productos sincronizados: {result.get("successful", 0)}\n'
                     f'- Productos con imágenes: {result.get("with_images", 0)}\n'
                     f'- Productos sin imágenes: {result.get("without_images", 0)}\n'
+                    f'- Productos eliminados: {result.get("deleted", 0)}\n'
+                    f'- Modo: {result.get("mode")}\n'
                     f'- Duración: {duration}'
                 )
             )
@@ -0,0 +1,96 @@
+from django.db import migrations
+
+# products_cache es una tabla no administrada por Django (ver ProductsCache),
+# por lo que el índice de búsqueda se crea con SQL directo.
+
+CREATE_EXTENSIONS = """
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE EXTENSION IF NOT EXISTS unaccent;
+"""
+
+DROP_EXTENSIONS = migrations.RunSQL.noop
+
+# unaccent() no es IMMUTABLE; el wrapper permite usarlo en índices y triggers.
+# search_path incluye "extensions" porque Supabase instala ahí las extensiones.
+CREATE_UNACCENT_FUNCTION = """
+CREATE OR REPLACE FUNCTION public.f_unaccent(text)
+RETURNS text
+LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+SET search_path = public, extensions
+AS $$ SELECT unaccent('unaccent', $1) $$;
+"""
+
+DROP_UNACCENT_FUNCTION = """
+DROP FUNCTION IF EXISTS public.f_unaccent(text);
+"""
+
+# Columna tsvector mantenida por trigger: el código y el nombre pesan más (A)
+# que la jerarquía tipo/familia/línea/grupo (B).
+CREATE_SEARCH_VECTOR = """
+ALTER TABLE products_cache ADD COLUMN IF NOT EXISTS search_vector tsvector;
+
+CREATE OR REPLACE FUNCTION public.products_cache_search_vector_update()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('spanish', public.f_unaccent(coalesce(NEW.reference_mask, ''))), 'A') ||
+        setweight(to_tsvector('spanish', public.f_unaccent(coalesce(NEW.name, ''))), 'A') ||
+        setweight(to_tsvector('spanish', public.f_unaccent(
+            coalesce(NEW.type_name, '') || ' ' ||
+            coalesce(NEW.family_name, '') || ' ' ||
+            coalesce(NEW.line_name, '') || ' ' ||
+            coalesce(NEW.group_name, '')
+        )), 'B');
+    RETURN NEW;
+END
+$$;
+
+DROP TRIGGER IF EXISTS products_cache_search_vector_trigger ON products_cache;
+CREATE TRIGGER products_cache_search_vector_trigger
+    BEFORE INSERT OR UPDATE ON products_cache
+    FOR EACH ROW EXECUTE FUNCTION public.products_cache_search_vector_update();
+
+-- Poblar las filas existentes (el trigger recalcula la columna)
+UPDATE products_cache SET search_vector = NULL;
+
+CREATE INDEX IF NOT EXISTS products_cache_search_vector_idx
+    ON products_cache USING gin (search_vector);
+"""
+
+DROP_SEARCH_VECTOR = """
+DROP INDEX IF EXISTS products_cache_search_vector_idx;
+DROP TRIGGER IF EXISTS products_cache_search_vector_trigger ON products_cache;
+DROP FUNCTION IF EXISTS public.products_cache_search_vector_update();
+ALTER TABLE products_cache DROP COLUMN IF EXISTS search_vector;
+"""
+
+# Índices trigram sobre la misma expresión que genera Django para icontains
+# (UPPER(campo::text) LIKE UPPER(%s)), para que la búsqueda por subcadena
+# en nombre y código use índice en lugar de un escaneo secuencial.
+CREATE_TRIGRAM_INDEXES = """
+CREATE INDEX IF NOT EXISTS products_cache_name_trgm_idx
+    ON products_cache USING gin ((UPPER(name::text)) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS products_cache_reference_mask_trgm_idx
+    ON products_cache USING gin ((UPPER(reference_mask::text)) gin_trgm_ops);
+"""
+
+DROP_TRIGRAM_INDEXES = """
+DROP INDEX IF EXISTS products_cache_name_trgm_idx;
+DROP INDEX IF EXISTS products_cache_reference_mask_trgm_idx;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cotizador', '0044_alter_kitproducto_clave_and_more'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_EXTENSIONS, DROP_EXTENSIONS),
+        migrations.RunSQL(CREATE_UNACCENT_FUNCTION, DROP_UNACCENT_FUNCTION),
+        migrations.RunSQL(CREATE_SEARCH_VECTOR, DROP_SEARCH_VECTOR),
+        migrations.RunSQL(CREATE_TRIGRAM_INDEXES, DROP_TRIGRAM_INDEXES),
+    ]
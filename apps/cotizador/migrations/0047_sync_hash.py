@@ -0,0 +1,23 @@
+# Generated by Django 5.0.1 on 2026-10-18 04:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cotizador', '0046_syncwatermark'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='sync_hash',
+            field=models.CharField(blank=True, editable=False, help_text='Hash del contenido sincronizado', max_length=32, null=True),
+        ),
+        # products_cache no es administrada por Django (ver ProductsCache)
+        migrations.RunSQL(
+            """ALTER TABLE products_cache ADD COLUMN IF NOT EXISTS sync_hash VARCHAR(32) NULL;""",
+            """ALTER TABLE products_cache DROP COLUMN IF EXISTS sync_hash;"""
+        ),
+    ]
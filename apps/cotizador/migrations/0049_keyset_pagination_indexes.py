@@ -0,0 +1,24 @@
+# Generated by Django 5.0.1 on 2026-10-18 04:44
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cotizador', '0048_synctask'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cotizacion',
+            index=models.Index(fields=['-fecha_creacion', '-id'], name='cotizacion_fecha_id_idx'),
+        ),
+        # products_cache no es administrada por Django (ver ProductsCache)
+        migrations.RunSQL(
+            """CREATE INDEX IF NOT EXISTS products_cache_name_id_idx ON products_cache (name, id);""",
+            """DROP INDEX IF EXISTS products_cache_name_id_idx;"""
+        ),
+    ]
@@ -0,0 +1,32 @@
+from django.db import migrations
+
+# Índices trigram para la búsqueda por subcadena (icontains) en tipo, familia,
+# línea y grupo, con la misma expresión que genera Django (ver 0045).
+CREATE_TRIGRAM_INDEXES = """
+CREATE INDEX IF NOT EXISTS products_cache_type_name_trgm_idx
+    ON products_cache USING gin ((UPPER(type_name::text)) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS products_cache_family_name_trgm_idx
+    ON products_cache USING gin ((UPPER(family_name::text)) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS products_cache_line_name_trgm_idx
+    ON products_cache USING gin ((UPPER(line_name::text)) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS products_cache_group_name_trgm_idx
+    ON products_cache USING gin ((UPPER(group_name::text)) gin_trgm_ops);
+"""
+
+DROP_TRIGRAM_INDEXES = """
+DROP INDEX IF EXISTS products_cache_type_name_trgm_idx;
+DROP INDEX IF EXISTS products_cache_family_name_trgm_idx;
+DROP INDEX IF EXISTS products_cache_line_name_trgm_idx;
+DROP INDEX IF EXISTS products_cache_group_name_trgm_idx;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cotizador', '0049_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_TRIGRAM_INDEXES, DROP_TRIGRAM_INDEXES),
+    ]
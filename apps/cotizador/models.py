@@ -1,18 +1,26 @@
-from django.db import models
+from django.db import models, transaction
+from django.core.exceptions import ValidationError
+from django.db.models import Count, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from django.conf import settings
 from django.utils import timezone
 from django.utils.html import mark_safe
 from decimal import Decimal
 from django.core.validators import MinValueValidator, MaxValueValidator
 import uuid
+from collections import Counter
 from django.contrib.auth.models import User
 
+# Tasa de IVA aplicada al subtotal de las cotizaciones
+IVA_RATE = Decimal('0.16')
+TOTAL_OUTPUT_FIELD = models.DecimalField(max_digits=18, decimal_places=6)
+
 class Cliente(models.Model):
     """Modelo para almacenar información de clientes"""
     partner_id = models.IntegerField(primary_key=True, help_text="ID único del cliente")
     name_partner = models.CharField(max_length=255, help_text="Nombre del cliente")
     rfc = models.CharField(max_length=20, blank=True, null=True, help_text="RFC del cliente")
-
+    sync_hash = models.CharField(max_length=32, blank=True, null=True, editable=False, help_text="Hash del contenido sincronizado")
 
     class Meta:
         verbose_name = 'Cliente'
@@ -134,16 +142,44 @@ class ProductTemplate(models.Model):
     def __str__(self):
         return f"{self.reference_mask} - {self.name}"
 
+    @staticmethod
+    def precargar_imagenes(productos):
+        """
+        Carga con una sola consulta las imágenes de varios productos.
+
+        Las imágenes viven en la base de datos default y los productos en la
+        del ERP, por lo que no se pueden anotar con una subconsulta; en su
+        lugar se arma un mapa por reference_mask y se asigna a cada producto
+        (``_prefetched_imagenes`` y ``_prefetched_imagen``).
+
+        Returns:
+            list: Los mismos productos.
+        """
+        productos = list(productos)
+        claves = {producto.reference_mask for producto in productos if producto.reference_mask}
+        imagenes = {}
+        if claves:
+            for imagen in CotizadorImagenproducto.objects.filter(clave_padre__in=claves).order_by('id'):
+                imagenes.setdefault(imagen.clave_padre, []).append(imagen)
+        for producto in productos:
+            producto._prefetched_imagenes = imagenes.get(producto.reference_mask, [])
+            producto._prefetched_imagen = producto._prefetched_imagenes[0] if producto._prefetched_imagenes else None
+        return productos
+
     def get_images(self):
         """
         Obtiene todas las imágenes asociadas a este producto a través del reference_mask
         """
+        if hasattr(self, '_prefetched_imagenes'):
+            return self._prefetched_imagenes
         return CotizadorImagenproducto.objects.filter(clave_padre=self.reference_mask)
 
     def get_primary_image(self):
         """
         Obtiene la primera imagen asociada al producto
         """
+        if hasattr(self, '_prefetched_imagen'):
+            return self._prefetched_imagen
         return self.get_images().first()
 
     def get_image_preview(self):
@@ -193,6 +229,9 @@ class Cotizacion(models.Model):
         ('cancelada', 'Cancelada'),
     ]
 
+    # Campos que se guardan al recalcular los totales
+    TOTAL_FIELDS = ['subtotal_mobiliario', 'total_descuento', 'iva', 'total_general', 'fecha_modificacion']
+
     # Campos de control
     uuid = models.UUIDField(default=uuid.uuid4, editable=False, unique=True, db_index=True)
     folio = models.CharField(max_length=50, blank=True, default='')
@@ -266,10 +305,211 @@ class Cotizacion(models.Model):
         verbose_name = 'Cotización'
         verbose_name_plural = 'Cotizaciones'
         ordering = ['-fecha_creacion']
+        indexes = [
+            # Paginación por cursor sobre el orden por defecto
+            models.Index(fields=['-fecha_creacion', '-id'], name='cotizacion_fecha_id_idx'),
+        ]
 
     def __str__(self):
         return f"{self.folio} - {self.cliente}"
 
+    def recalcular_totales(self):
+        """
+        Recalcula los totales a partir de los productos visibles con una sola
+        consulta agregada y guarda solo los campos de totales.
+        """
+        totales = self.productos.filter(mostrar_en_cotizacion=True).aggregate(
+            subtotal=Coalesce(Sum('importe'), Value(Decimal('0')), output_field=TOTAL_OUTPUT_FIELD),
+            descuento=Coalesce(
+                Sum(F('precio_lista') * F('cantidad') - F('importe'), output_field=TOTAL_OUTPUT_FIELD),
+                Value(Decimal('0')),
+                output_field=TOTAL_OUTPUT_FIELD
+            ),
+        )
+        subtotal = totales['subtotal']
+        iva = subtotal * IVA_RATE
+
+        self.subtotal_mobiliario = subtotal
+        self.total_descuento = totales['descuento']
+        self.iva = iva
+        self.total_general = subtotal + self.logistica + iva
+        self.save(update_fields=self.TOTAL_FIELDS)
+
+    def duplicar(self):
+        """
+        Crea una copia de la cotización con todos sus productos.
+
+        Los productos se copian con un solo bulk_create y los totales se
+        copian de la cotización original en lugar de recalcularse, por lo que
+        el número de consultas no depende de la cantidad de productos.
+
+        Returns:
+            Cotizacion: La nueva cotización.
+        """
+        with transaction.atomic():
+            nueva_cotizacion = Cotizacion.objects.get(pk=self.pk)
+            nueva_cotizacion.pk = None
+            nueva_cotizacion._state.adding = True
+            nueva_cotizacion.uuid = uuid.uuid4()
+            nueva_cotizacion.save()
+
+            productos = list(self.productos.all())
+            for producto in productos:
+                producto.pk = None
+                producto._state.adding = True
+                producto.cotizacion = nueva_cotizacion
+            ProductoCotizacion.objects.bulk_create(productos)
+
+        return nueva_cotizacion
+
+    @staticmethod
+    def recalcular_totales_cotizaciones(cotizacion_ids):
+        """
+        Recalcula los totales de varias cotizaciones con un solo UPDATE que
+        agrega sus productos visibles en subconsultas.
+
+        Returns:
+            int: Número de cotizaciones actualizadas.
+        """
+        productos = ProductoCotizacion.objects.filter(
+            cotizacion=OuterRef('pk'),
+            mostrar_en_cotizacion=True
+        ).order_by().values('cotizacion')
+        subtotal = Coalesce(
+            Subquery(productos.annotate(total=Sum('importe')).values('total'), output_field=TOTAL_OUTPUT_FIELD),
+            Value(Decimal('0')),
+            output_field=TOTAL_OUTPUT_FIELD
+        )
+        descuento = Coalesce(
+            Subquery(
+                productos.annotate(
+                    total=Sum(F('precio_lista') * F('cantidad') - F('importe'), output_field=TOTAL_OUTPUT_FIELD)
+                ).values('total'),
+                output_field=TOTAL_OUTPUT_FIELD
+            ),
+            Value(Decimal('0')),
+            output_field=TOTAL_OUTPUT_FIELD
+        )
+        return Cotizacion.objects.filter(pk__in=cotizacion_ids).update(
+            subtotal_mobiliario=subtotal,
+            total_descuento=descuento,
+            iva=subtotal * IVA_RATE,
+            total_general=subtotal + F('logistica') + subtotal * IVA_RATE,
+            fecha_modificacion=timezone.now()
+        )
+
+    def ajustar_totales(self, delta_subtotal, delta_descuento):
+        """
+        Ajusta los totales por la diferencia que aporta un producto creado,
+        modificado o eliminado, sin volver a sumar todos los productos.
+
+        La actualización se hace con expresiones F en un solo UPDATE, por lo
+        que es segura ante ediciones concurrentes de otros productos.
+        """
+        if not delta_subtotal and not delta_descuento:
+            return
+        subtotal = F('subtotal_mobiliario') + delta_subtotal
+        # Punto de guardado propio: si falla, no invalida la transacción de quien llama
+        with transaction.atomic():
+            Cotizacion.objects.filter(pk=self.pk).update(
+                subtotal_mobiliario=subtotal,
+                total_descuento=F('total_descuento') + delta_descuento,
+                iva=subtotal * IVA_RATE,
+                total_general=subtotal + F('logistica') + subtotal * IVA_RATE,
+                fecha_modificacion=timezone.now()
+            )
+        self.refresh_from_db(fields=self.TOTAL_FIELDS)
+
+    def aplicar_kits(self, aplicaciones):
+        """
+        Agrega kits a la cotización como productos tipo kit, en una sola transacción.
+
+        Si el kit ya está en la cotización se acumula la cantidad y se
+        actualizan sus valores. Las sumas de todos los kits se obtienen con una
+        consulta agregada, las líneas se escriben con bulk_create/bulk_update y
+        los totales se ajustan por la diferencia.
+
+        Args:
+            aplicaciones: Lista de diccionarios con ``kit`` (Kit) y, opcionalmente,
+                los valores personalizados que acepta ``Kit.calcular_totales``.
+
+        Returns:
+            list: El ProductoCotizacion de cada aplicación, en el mismo orden.
+
+        Raises:
+            ValidationError: Si algún kit no tiene productos ni valores directos.
+        """
+        with transaction.atomic():
+            # Bloquear la cotización para serializar aplicaciones concurrentes
+            list(Cotizacion.objects.select_for_update().filter(pk=self.pk).values_list('pk', flat=True))
+
+            kits = [aplicacion['kit'] for aplicacion in aplicaciones]
+            resumen = Kit.resumen_productos({kit.id for kit in kits})
+
+            lineas = {}
+            for linea in self.productos.filter(es_kit=True, kit_uuid__in=[kit.uuid for kit in kits]).order_by('id'):
+                lineas.setdefault(linea.kit_uuid, linea)
+            aporte_anterior = [linea.aporte_totales() for linea in lineas.values()]
+
+            nuevas = []
+            kits_actualizados = {}
+            for aplicacion in aplicaciones:
+                opciones = dict(aplicacion)
+                kit = opciones.pop('kit')
+                valores = kit.calcular_totales(resumen.get(kit.id), **opciones)
+
+                linea = lineas.get(kit.uuid)
+                if linea is None:
+                    linea = ProductoCotizacion(
+                        cotizacion=self,
+                        es_kit=True,
+                        clave=kit.nombre,
+                        descripcion=kit.descripcion,
+                        imagen_url=kit.imagen_url,
+                        tag=kit.tag,
+                        cantidad=0,
+                        kit_uuid=kit.uuid,
+                    )
+                    lineas[kit.uuid] = linea
+                    nuevas.append(linea)
+                linea.cantidad += valores['cantidad']
+                linea.porcentaje_descuento = valores['porcentaje_descuento']
+                linea.precio_lista = valores['precio_lista']
+                linea.costo = valores['costo']
+                linea.precio_descuento = valores['precio_descuento']
+                linea.importe = valores['importe']
+                linea.mostrar_en_cotizacion = True
+
+                # Guardar en el kit los valores calculados
+                if valores['precio_lista'] > 0:
+                    kit.valor_unitario = valores['precio_lista']
+                    kit.costo_unitario = valores['costo']
+                    kit.porcentaje_descuento = valores['porcentaje_descuento']
+                    kit.valor_unitario_con_descuento = valores['precio_descuento']
+                    kits_actualizados[kit.id] = kit
+
+            existentes = [linea for linea in lineas.values() if linea.pk]
+            if nuevas:
+                ProductoCotizacion.objects.bulk_create(nuevas)
+            if existentes:
+                ProductoCotizacion.objects.bulk_update(existentes, [
+                    'cantidad', 'porcentaje_descuento', 'precio_lista', 'costo',
+                    'precio_descuento', 'importe', 'mostrar_en_cotizacion'
+                ])
+            if kits_actualizados:
+                Kit.objects.bulk_update(kits_actualizados.values(), [
+                    'valor_unitario', 'costo_unitario', 'porcentaje_descuento',
+                    'valor_unitario_con_descuento'
+                ])
+
+            aporte_nuevo = [linea.aporte_totales() for linea in lineas.values()]
+            self.ajustar_totales(
+                sum(subtotal for subtotal, _ in aporte_nuevo) - sum(subtotal for subtotal, _ in aporte_anterior),
+                sum(descuento for _, descuento in aporte_nuevo) - sum(descuento for _, descuento in aporte_anterior)
+            )
+
+        return [lineas[aplicacion['kit'].uuid] for aplicacion in aplicaciones]
+
 class Kit(models.Model):
     """
     Modelo que representa un kit de productos con sus valores calculados.
@@ -299,6 +539,148 @@ class Kit(models.Model):
 
     def __str__(self):
         return f"{self.nombre}"
+
+    # Campo del kit -> campo de ProductoCotizacion que se propaga al editarlo
+    CAMPOS_PROPAGADOS = {
+        'nombre': 'clave',
+        'descripcion': 'descripcion',
+        'imagen_url': 'imagen_url',
+        'tag': 'tag',
+        'cantidad': 'cantidad',
+        'valor_unitario': 'precio_lista',
+        'costo_unitario': 'costo',
+        'porcentaje_descuento': 'porcentaje_descuento',
+        'valor_unitario_con_descuento': 'precio_descuento',
+    }
+    # Campos del kit que obligan a recalcular el importe de las líneas
+    CAMPOS_IMPORTE = ('valor_unitario', 'porcentaje_descuento', 'valor_unitario_con_descuento')
+
+    def lineas_cotizacion(self):
+        """Productos de cotización que representan a este kit."""
+        return ProductoCotizacion.objects.filter(kit_uuid=self.uuid, es_kit=True)
+
+    def propagar_a_cotizaciones(self, campos, padre=None, actualizar_padre=False):
+        """
+        Copia los campos modificados del kit a todas las líneas de cotización
+        que lo usan, con un solo UPDATE, y recalcula en una pasada los totales
+        de las cotizaciones afectadas.
+
+        Args:
+            campos: Nombres de los campos del kit que cambiaron.
+            padre: Valor del campo ``padre`` para las líneas.
+            actualizar_padre: Si es True también se actualiza ``padre``.
+
+        Returns:
+            dict: lineas y cotizaciones actualizadas.
+        """
+        valores = {
+            self.CAMPOS_PROPAGADOS[campo]: getattr(self, campo)
+            for campo in campos if campo in self.CAMPOS_PROPAGADOS
+        }
+        if actualizar_padre:
+            valores['padre'] = padre
+        if any(campo in self.CAMPOS_IMPORTE for campo in campos):
+            # El importe de la línea del kit es su precio con descuento (sin multiplicar por cantidad)
+            valores['importe'] = valores.get('precio_descuento', F('precio_descuento'))
+        if not valores:
+            return {'lineas': 0, 'cotizaciones': 0}
+
+        with transaction.atomic():
+            lineas = self.lineas_cotizacion()
+            cotizacion_ids = list(lineas.values_list('cotizacion_id', flat=True).distinct().order_by())
+            actualizadas = lineas.update(**valores)
+            cotizaciones = 0
+            if cotizacion_ids and ('importe' in valores or 'precio_lista' in valores or 'cantidad' in valores):
+                cotizaciones = Cotizacion.recalcular_totales_cotizaciones(cotizacion_ids)
+
+        return {'lineas': actualizadas, 'cotizaciones': cotizaciones}
+
+    @staticmethod
+    def resumen_productos(kit_ids):
+        """
+        Suma en una sola consulta los precios de los productos de cada kit.
+
+        Returns:
+            dict: {kit_id: {'productos', 'precio_lista', 'costo', 'precio_descuento'}}
+        """
+        filas = KitProducto.objects.filter(kit_id__in=kit_ids).values('kit_id').annotate(
+            productos=Count('id'),
+            precio_lista=Sum('precio_lista'),
+            costo=Sum('costo'),
+            precio_descuento=Sum('precio_descuento'),
+        ).order_by()
+        return {fila.pop('kit_id'): fila for fila in filas}
+
+    def calcular_totales(self, resumen=None, porcentaje_descuento_adicional=0, cantidad=None,
+                         valor_unitario=None, costo_unitario=None, porcentaje_descuento=None,
+                         valor_unitario_con_descuento=None):
+        """
+        Calcula los valores con los que el kit se agrega a una cotización.
+
+        Args:
+            resumen: Sumas de los productos del kit (ver ``resumen_productos``);
+                si no se indica se consultan.
+            porcentaje_descuento_adicional: Descuento aplicado sobre el precio
+                con descuento de cada producto.
+            cantidad, valor_unitario, costo_unitario, porcentaje_descuento,
+            valor_unitario_con_descuento: Valores personalizados que reemplazan
+                a los calculados.
+
+        Returns:
+            dict: cantidad, precio_lista, costo, porcentaje_descuento,
+            precio_descuento e importe.
+
+        Raises:
+            ValidationError: Si el kit no tiene productos ni valores directos.
+        """
+        if resumen is None:
+            resumen = Kit.resumen_productos([self.id]).get(self.id)
+        resumen = resumen or {}
+
+        if not resumen.get('productos') and not self.valor_unitario > 0:
+            raise ValidationError(f'El kit "{self.nombre}" no tiene productos asociados ni valores directos')
+
+        descuento_adicional = Decimal(porcentaje_descuento_adicional or 0)
+        precio_lista_total = resumen.get('precio_lista') or Decimal('0')
+        costo_total = resumen.get('costo') or Decimal('0')
+        precio_descuento_total = resumen.get('precio_descuento') or Decimal('0')
+        if descuento_adicional > 0:
+            precio_descuento_total = precio_descuento_total * (Decimal(100) - descuento_adicional) / Decimal(100)
+
+        # Calcular el descuento total efectivo
+        if precio_lista_total > 0:
+            descuento_total = Decimal(100) - (precio_descuento_total * Decimal(100) / precio_lista_total)
+        else:
+            descuento_total = self.porcentaje_descuento
+            if descuento_adicional > 0:
+                descuento_total = Decimal(100) - ((Decimal(100) - self.porcentaje_descuento) *
+                                                  (Decimal(100) - descuento_adicional) / Decimal(100))
+
+        # Usar valores personalizados si se proporcionan
+        if valor_unitario is not None:
+            precio_lista_total = valor_unitario
+        if costo_unitario is not None:
+            costo_total = costo_unitario
+        if porcentaje_descuento is not None:
+            descuento_total = porcentaje_descuento
+        if valor_unitario_con_descuento is not None:
+            precio_descuento_total = valor_unitario_con_descuento
+
+        # Si los totales calculados son 0, usar los valores del kit directamente
+        if precio_lista_total == 0 and self.valor_unitario > 0:
+            precio_lista_total = self.costo_unitario
+            costo_total = self.costo_unitario
+            precio_descuento_total = self.valor_unitario_con_descuento
+
+        return {
+            'cantidad': cantidad if cantidad is not None else self.cantidad,
+            'precio_lista': Decimal(str(precio_lista_total)),
+            'costo': Decimal(str(costo_total)),
+            'porcentaje_descuento': Decimal(str(descuento_total)),
+            'precio_descuento': Decimal(str(precio_descuento_total)),
+            # El importe de la línea del kit es su precio con descuento
+            'importe': Decimal(str(precio_descuento_total)),
+        }
         
     def agregar_producto(self, clave, cantidad=1, porcentaje_descuento=0, **kwargs):
         """
@@ -313,6 +695,64 @@ class Kit(models.Model):
         )
         return producto
         
+    def establecer_productos(self, productos):
+        """
+        Reemplaza el contenido del kit con la lista de productos indicada en
+        una sola transacción.
+
+        Los productos se identifican por ``clave``: los existentes se
+        actualizan con bulk_update, los nuevos se crean con bulk_create y los
+        que no vienen en la lista se eliminan. El precio con descuento y el
+        importe se calculan en una pasada y el kit se guarda una sola vez.
+
+        Args:
+            productos: Lista de diccionarios con ``clave`` y los campos de
+                KitProducto a establecer.
+
+        Returns:
+            list: Los KitProducto del kit, en el orden recibido.
+
+        Raises:
+            ValidationError: Si una clave viene repetida.
+        """
+        conteo = Counter(datos['clave'] for datos in productos)
+        repetidas = [clave for clave, veces in conteo.items() if veces > 1]
+        if repetidas:
+            raise ValidationError(f"Claves repetidas en el kit: {', '.join(sorted(repetidas))}")
+
+        with transaction.atomic():
+            # Bloquear el kit para que dos reemplazos no se mezclen
+            list(Kit.objects.select_for_update().filter(pk=self.pk).values_list('pk', flat=True))
+            existentes = {producto.clave: producto for producto in self.productos.all()}
+
+            resultado = []
+            nuevos = []
+            actualizados = []
+            for datos in productos:
+                producto = existentes.get(datos['clave'])
+                if producto is None:
+                    producto = KitProducto(kit=self, **datos)
+                    nuevos.append(producto)
+                else:
+                    for campo, valor in datos.items():
+                        setattr(producto, campo, valor)
+                    actualizados.append(producto)
+                producto.calcular_importe()
+                resultado.append(producto)
+
+            eliminados = [producto.id for clave, producto in existentes.items() if clave not in conteo]
+            if eliminados:
+                KitProducto.objects.filter(id__in=eliminados).delete()
+            if actualizados:
+                KitProducto.objects.bulk_update(actualizados, KitProducto.CAMPOS_EDITABLES)
+            if nuevos:
+                KitProducto.objects.bulk_create(nuevos)
+
+            # Actualizar totales del kit una sola vez
+            self.save()
+
+        return resultado
+
     def actualizar_producto(self, producto_kit_id, cantidad=None, porcentaje_descuento=None, **kwargs):
         """
         Actualiza un producto existente en el kit
@@ -356,37 +796,40 @@ class Kit(models.Model):
         Returns:
             Kit: El nuevo kit creado.
         """
-        nuevo_kit = Kit.objects.create(
-            nombre=nuevo_nombre or f"{self.nombre} (Copia)",
-            descripcion=self.descripcion,
-            imagen_url=self.imagen_url,
-            tag=self.tag,
-            cantidad=self.cantidad,
-            valor_unitario=self.valor_unitario,
-            costo_unitario=self.costo_unitario,
-            porcentaje_descuento=self.porcentaje_descuento,
-            valor_unitario_con_descuento=self.valor_unitario_con_descuento,
-            creado_por=self.creado_por
-        )
-        
-        # Duplicar productos
-        for producto in self.productos.all():
-            KitProducto.objects.create(
-                kit=nuevo_kit,
-                clave=producto.clave,
-                cantidad=producto.cantidad,
-                porcentaje_descuento=producto.porcentaje_descuento,
-                precio_lista=producto.precio_lista,
-                costo=producto.costo,
-                precio_descuento=producto.precio_descuento,
-                importe=producto.importe,
-                mostrar_en_kit=producto.mostrar_en_kit,
-                descripcion=producto.descripcion,
-                linea=producto.linea,
-                familia=producto.familia,
-                grupo=producto.grupo,
-                producto_id=producto.producto_id
+        with transaction.atomic():
+            nuevo_kit = Kit.objects.create(
+                nombre=nuevo_nombre or f"{self.nombre} (Copia)",
+                descripcion=self.descripcion,
+                imagen_url=self.imagen_url,
+                tag=self.tag,
+                cantidad=self.cantidad,
+                valor_unitario=self.valor_unitario,
+                costo_unitario=self.costo_unitario,
+                porcentaje_descuento=self.porcentaje_descuento,
+                valor_unitario_con_descuento=self.valor_unitario_con_descuento,
+                creado_por_id=self.creado_por_id
             )
+            
+            # Duplicar productos en un solo INSERT; los importes se copian tal cual
+            KitProducto.objects.bulk_create([
+                KitProducto(
+                    kit=nuevo_kit,
+                    clave=producto.clave,
+                    cantidad=producto.cantidad,
+                    porcentaje_descuento=producto.porcentaje_descuento,
+                    precio_lista=producto.precio_lista,
+                    costo=producto.costo,
+                    precio_descuento=producto.precio_descuento,
+                    importe=producto.importe,
+                    mostrar_en_kit=producto.mostrar_en_kit,
+                    descripcion=producto.descripcion,
+                    linea=producto.linea,
+                    familia=producto.familia,
+                    grupo=producto.grupo,
+                    producto_id=producto.producto_id
+                )
+                for producto in self.productos.all()
+            ])
         
         return nuevo_kit
 
@@ -422,18 +865,33 @@ class KitProducto(models.Model):
     def __str__(self):
         return f"{self.kit.nombre} - {self.clave} (x{self.cantidad})"
 
-    def save(self, *args, **kwargs):
+    # Campos que se escriben al establecer el contenido de un kit en bloque
+    CAMPOS_EDITABLES = [
+        'orden', 'cantidad', 'porcentaje_descuento', 'precio_lista', 'costo',
+        'precio_descuento', 'importe', 'descripcion', 'linea', 'familia', 'grupo',
+        'tag', 'mostrar_en_kit', 'es_opcional', 'producto_id', 'especial', 'padre',
+        'route_id'
+    ]
+
+    def calcular_importe(self):
         """
-        Sobrescribes el método save para calcular el precio con descuento y el importe
+        Calcula el precio con descuento y el importe a partir del precio de
+        lista, el porcentaje de descuento y la cantidad.
         """
-        # Calcular precio con descuento
         if self.porcentaje_descuento > 0:
             self.precio_descuento = self.precio_lista * (1 - (self.porcentaje_descuento / 100))
         else:
             self.precio_descuento = self.precio_lista
-        
-        # Calcular importe
         self.importe = self.precio_descuento * self.cantidad
+
+    def save(self, *args, **kwargs):
+        """
+        Sobrescribes el método save para calcular el precio con descuento y el importe.
+
+        Las operaciones en bloque (ver ``Kit.establecer_productos``) no pasan por
+        aquí: calculan el importe con ``calcular_importe`` y guardan el kit una vez.
+        """
+        self.calcular_importe()
         
         super().save(*args, **kwargs)
         
@@ -519,6 +977,17 @@ class ProductoCotizacion(models.Model):
 
     def __str__(self):
         return f"{self.clave} - {self.descripcion}"
+
+    def aporte_totales(self):
+        """
+        Retorna (subtotal, descuento) que este producto aporta a los totales
+        de su cotización; los productos ocultos no aportan nada.
+        """
+        if not self.mostrar_en_cotizacion:
+            return Decimal('0'), Decimal('0')
+        importe = Decimal(self.importe or 0)
+        precio_lista = Decimal(self.precio_lista or 0)
+        return importe, precio_lista * (self.cantidad or 0) - importe
     
     def save(self, *args, **kwargs):
         """
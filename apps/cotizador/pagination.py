@@ -1,6 +1,329 @@
+import base64
+import datetime
+import hashlib
+import json
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import EmptyPage, Page, Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DatabaseError, connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_count(queryset):
+    """
+    Número aproximado de filas según el planificador de PostgreSQL
+    (EXPLAIN), sin ejecutar la consulta.
+    """
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def estimate_table_count(model, using=None):
+    """
+    Número aproximado de filas de toda la tabla según las estadísticas de
+    PostgreSQL (pg_class.reltuples). Retorna None si la tabla nunca se ha
+    analizado.
+    """
+    with connections[using or 'default'].cursor() as cursor:
+        cursor.execute(
+            "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+            [model._meta.db_table]
+        )
+        row = cursor.fetchone()
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+COUNT_VERSION_KEY = 'pagination:count_version:{}'
+COUNT_CACHE_KEY = 'pagination:count:{}:{}:{}'
+
+
+def get_count_version(table):
+    """Versión actual de los conteos en caché de una tabla."""
+    return cache.get(COUNT_VERSION_KEY.format(table), 0)
+
+
+def bump_count_version(table):
+    """
+    Invalida los conteos en caché de una tabla (ej. al terminar una
+    sincronización de productos).
+    """
+    key = COUNT_VERSION_KEY.format(table)
+    cache.add(key, 0, None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # La llave expiró o se eliminó entre add e incr
+        cache.set(key, 1, None)
+        return 1
+
+
+def _count_cache_key(queryset):
+    """Llave de caché por tabla, versión y firma de los filtros (SQL + parámetros)."""
+    table = queryset.model._meta.db_table
+    sql, params = queryset.order_by().query.sql_with_params()
+    signature = hashlib.md5(f'{sql}|{params!r}'.encode('utf-8')).hexdigest()
+    return COUNT_CACHE_KEY.format(table, get_count_version(table), signature)
+
+
+def count_queryset(queryset):
+    """
+    Total de filas de un queryset usando la estrategia más barata que aplique.
+
+    1. Si el conteo de los mismos filtros está en caché (y la versión de la
+       tabla no ha cambiado), se usa ese.
+    2. Si no, se estima con el planificador: pg_class.reltuples cuando no hay
+       filtros, EXPLAIN cuando los hay.
+    3. Si el estimado no pasa de PAGINATION_EXACT_COUNT_THRESHOLD filas se
+       cuenta con COUNT(*); si lo pasa, se usa el estimado.
+
+    Retorna (total, exacto, desde_cache).
+    """
+    threshold = getattr(settings, 'PAGINATION_EXACT_COUNT_THRESHOLD', 5000)
+    timeout = getattr(settings, 'PAGINATION_COUNT_CACHE_TTL', 600)
+
+    try:
+        key = _count_cache_key(queryset)
+    except Exception:
+        # Consultas que no se pueden compilar por adelantado (ej. EmptyResultSet)
+        return queryset.count(), True, False
+
+    cached = cache.get(key)
+    if cached is not None:
+        return cached[0], cached[1], True
+
+    estimate = None
+    try:
+        if not queryset.query.where:
+            estimate = estimate_table_count(queryset.model, queryset.db)
+        if estimate is None:
+            estimate = estimate_count(queryset)
+    except DatabaseError as e:
+        logger.warning(f"No se pudo estimar el total de {queryset.model._meta.db_table}: {str(e)}")
+
+    if estimate is None or estimate <= threshold:
+        total, exact = queryset.count(), True
+    else:
+        total, exact = estimate, False
+
+    cache.set(key, (total, exact), timeout)
+    return total, exact, False
+
+
+class CountingPage(Page):
+    """
+    Página de un CountingPaginator. Con un total estimado, has_next se basa en
+    si existe al menos una fila después de la página, no en el estimado.
+    """
+    has_more = None
+
+    def has_next(self):
+        if self.has_more is None:
+            return super().has_next()
+        return self.has_more
+
+
+class CountingPaginator(Paginator):
+    """
+    Paginator que obtiene el total con count_queryset (exacto, estimado o en
+    caché) en lugar de ejecutar siempre COUNT(*).
+
+    Con un total estimado no se rechazan páginas posteriores al estimado ni se
+    recorta la última página al total.
+    """
+    exact = True
+    cached = False
+
+    @cached_property
+    def count(self):
+        total, self.exact, self.cached = count_queryset(self.object_list)
+        return total
+
+    def validate_number(self, number):
+        try:
+            return super().validate_number(number)
+        except EmptyPage:
+            if self.exact or int(number) < 1:
+                raise
+            return int(number)
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if self.exact:
+            return super().page(number)
+
+        # Una fila extra indica si hay página siguiente
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        page = self._get_page(rows[:self.per_page], number, self)
+        page.has_more = len(rows) > self.per_page
+        return page
+
+    def _get_page(self, *args, **kwargs):
+        return CountingPage(*args, **kwargs)
+
+
+class CursorJSONEncoder(DjangoJSONEncoder):
+    """
+    Igual que DjangoJSONEncoder pero sin truncar los microsegundos: el cursor
+    se compara por igualdad con los valores de la base de datos.
+    """
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+class KeysetPaginationMixin:
+    """
+    Paginación por llave (keyset) opcional, activada con ?cursor=.
+
+    En lugar de OFFSET, cada página continúa después de los valores de
+    ordenamiento de la última fila de la página anterior, por lo que el costo
+    no crece con la profundidad. El primer request usa ?cursor= vacío y las
+    siguientes páginas el valor de ``next``.
+
+    El orden es el del queryset si solo usa campos del modelo; si no (por
+    ejemplo, la relevancia de una búsqueda) se usa ``keyset_ordering`` de la
+    vista. La llave primaria se agrega como desempate para que el orden sea
+    estable.
+
+    El total se omite por defecto; ?count=estimate lo estima con el
+    planificador y ?count=exact lo cuenta.
+    """
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    keyset = False
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param not in request.query_params:
+            self.keyset = False
+            return super().paginate_queryset(queryset, request, view)
+
+        self.keyset = True
+        self.request = request
+        page_size = self.get_page_size(request)
+
+        self.ordering = self._get_keyset_ordering(queryset, view)
+        queryset = queryset.order_by(*self.ordering)
+        self.count_mode, self.total = self._get_total(queryset, request)
+
+        values = self._decode_cursor(request.query_params[self.cursor_query_param])
+        if values is not None:
+            queryset = queryset.filter(self._after(values))
+
+        rows = list(queryset[:page_size + 1])
+        self.has_next = len(rows) > page_size
+        self.page_rows = rows[:page_size]
+        return self.page_rows
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        return Response({
+            'total': self.total,
+            'count_mode': self.count_mode,
+            'page_size': self.get_page_size(self.request),
+            'next': self.get_next_cursor_link(),
+            'previous': None,
+            'results': data
+        })
+
+    def get_next_cursor_link(self):
+        if not self.has_next or not self.page_rows:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, self._encode_cursor(self.page_rows[-1]))
+
+    def _get_keyset_ordering(self, queryset, view):
+        model = queryset.model
+        field_names = {field.name for field in model._meta.concrete_fields} | {'pk'}
+
+        def usable(ordering):
+            return ordering and all(
+                isinstance(field, str) and field.lstrip('-') in field_names
+                for field in ordering
+            )
+
+        ordering = list(queryset.query.order_by)
+        if not usable(ordering):
+            ordering = list(getattr(view, 'keyset_ordering', None) or model._meta.ordering or [])
+        if not usable(ordering):
+            ordering = []
+
+        # Desempate por llave primaria en la misma dirección que el último campo
+        names = [field.lstrip('-') for field in ordering]
+        if 'pk' not in names and model._meta.pk.name not in names:
+            descending = bool(ordering) and ordering[-1].startswith('-')
+            ordering.append('-pk' if descending else 'pk')
+        return ordering
+
+    def _get_total(self, queryset, request):
+        mode = request.query_params.get(self.count_query_param, 'none').lower()
+        if mode == 'exact':
+            return 'exact', queryset.count()
+        if mode == 'estimate':
+            try:
+                return 'estimate', estimate_count(queryset)
+            except (DatabaseError, EmptyResultSet) as e:
+                # Igual que count_queryset: sin estimado se cuenta
+                logger.warning(f"No se pudo estimar el total de {queryset.model._meta.db_table}: {str(e)}")
+                return 'exact', queryset.count()
+        return 'none', None
+
+    def _after(self, values):
+        """
+        Condición "fila posterior al cursor" para un orden compuesto:
+        (a > x) OR (a = x AND b > y) OR ...
+        """
+        condition = Q()
+        equal = Q()
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+
+        # Cota redundante sobre el primer campo para que el índice acote el rango
+        first = self.ordering[0]
+        lookup = 'lte' if first.startswith('-') else 'gte'
+        return Q(**{f'{first.lstrip("-")}__{lookup}': values[0]}) & condition
+
+    def _encode_cursor(self, instance):
+        values = [getattr(instance, field.lstrip('-')) for field in self.ordering]
+        payload = json.dumps(values, cls=CursorJSONEncoder)
+        return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+    def _decode_cursor(self, cursor):
+        if not cursor:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound('Cursor inválido')
+        if not isinstance(values, list) or len(values) != len(self.ordering) or None in values:
+            raise NotFound('Cursor inválido')
+        return values
+
 
-class CustomPageNumberPagination(PageNumberPagination):
+class CustomPageNumberPagination(KeysetPaginationMixin, PageNumberPagination):
     page_size = 10  # Default page size
     page_size_query_param = 'page_size'  # Allow client to override with "?page_size=xx"
     max_page_size = 1000  # Maximum limit
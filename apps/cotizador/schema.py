@@ -0,0 +1,76 @@
+"""
+Registro de capacidades del esquema de la base de datos.
+
+Algunas columnas (por ejemplo los usuarios de la cotización) no existen en
+todas las bases de datos desplegadas. En lugar de consultar
+``information_schema`` al importar los serializers y las vistas, cada
+capacidad se resuelve la primera vez que se usa y queda guardada para el resto
+de la vida del proceso.
+
+El orden de resolución es:
+
+1. ``SCHEMA_CAPABILITIES`` en settings (ej. ``{'cotizador_cotizacion.usuario_creacion_id': True}``).
+2. Una consulta a ``information_schema.columns``.
+3. Si la base de datos no responde, la definición actual del modelo (sin
+   guardarla, para volver a consultar en el siguiente uso).
+"""
+import logging
+import threading
+
+from django.apps import apps
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_columns = {}
+
+
+def _column_in_models(table, column):
+    """Indica si algún modelo con esa tabla declara la columna."""
+    for model in apps.get_models():
+        if model._meta.db_table == table:
+            return any(field.column == column for field in model._meta.concrete_fields)
+    return False
+
+
+def column_exists(table, column, using='default'):
+    """
+    Indica si ``table.column`` existe en la base de datos ``using``.
+    El resultado se calcula una vez por proceso.
+    """
+    key = (using, table, column)
+    if key in _columns:
+        return _columns[key]
+
+    overrides = getattr(settings, 'SCHEMA_CAPABILITIES', {})
+    if f'{table}.{column}' in overrides:
+        return bool(overrides[f'{table}.{column}'])
+
+    with _lock:
+        if key not in _columns:
+            try:
+                with connections[using].cursor() as cursor:
+                    cursor.execute(
+                        """SELECT 1 FROM information_schema.columns
+                           WHERE table_name = %s AND column_name = %s
+                           LIMIT 1""",
+                        [table, column]
+                    )
+                    _columns[key] = cursor.fetchone() is not None
+            except DatabaseError as e:
+                logger.warning(f"No se pudo verificar la columna {table}.{column}: {str(e)}")
+                return _column_in_models(table, column)
+    return _columns[key]
+
+
+def reset():
+    """Olvida las capacidades calculadas (ej. después de aplicar migraciones)."""
+    with _lock:
+        _columns.clear()
+
+
+def usuario_fields_exist():
+    """Las cotizaciones tienen los campos usuario_creacion/envio/aprobacion/rechazo."""
+    return column_exists('cotizador_cotizacion', 'usuario_creacion_id')
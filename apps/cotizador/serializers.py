@@ -1,9 +1,11 @@
+from django.db import models
 from rest_framework import serializers
 from .models import (
     ProductTemplate, Cliente, Cotizacion, ProductoCotizacion,
     CotizadorImagenproducto, Kit, KitProducto
 )
 from .cache.models import ProductsCache
+from . import schema
 from decimal import Decimal
 
 class EmptyStringCharField(serializers.CharField):
@@ -18,6 +20,15 @@ class EmptyStringURLField(serializers.URLField):
             return ""
         return super().to_representation(value)
 
+class ProductTemplateListSerializer(serializers.ListSerializer):
+    """
+    Precarga las imágenes de todos los productos de la lista (o página) con
+    una sola consulta antes de serializarlos.
+    """
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.manager.BaseManager) else data
+        return super().to_representation(ProductTemplate.precargar_imagenes(iterable))
+
 class ProductTemplateSerializer(serializers.ModelSerializer):
     type_name = EmptyStringCharField(source='type.name', read_only=True)
     family_name = EmptyStringCharField(source='family.name', read_only=True)
@@ -49,6 +60,7 @@ class ProductTemplateSerializer(serializers.ModelSerializer):
             'group_name',
             'imagen'
         ]
+        list_serializer_class = ProductTemplateListSerializer
 
 class ClienteSerializer(serializers.ModelSerializer):
     class Meta:
@@ -151,16 +163,6 @@ class ConfiguracionPDFSerializer(serializers.Serializer):
 
 class CotizacionSerializer(serializers.ModelSerializer):
     productos = ProductoCotizacionSerializer(many=True, read_only=True)
-    
-    # Verificar si los campos de usuario existen en la base de datos
-    from django.db import connection
-    cursor = connection.cursor()
-    cursor.execute(
-        """SELECT column_name FROM information_schema.columns 
-           WHERE table_name = 'cotizador_cotizacion' 
-           AND column_name = 'usuario_creacion_id'"""
-    )
-    usuario_fields_exist = bool(cursor.fetchone())
 
     class Meta:
         model = Cotizacion
@@ -217,7 +219,7 @@ class CotizacionSerializer(serializers.ModelSerializer):
         super().__init__(*args, **kwargs)
         
         # Añadir campos de usuario solo si existen en la base de datos
-        if self.__class__.usuario_fields_exist:
+        if schema.usuario_fields_exist():
             self.fields['usuario_creacion'] = serializers.PrimaryKeyRelatedField(read_only=True)
             self.fields['usuario_envio'] = serializers.PrimaryKeyRelatedField(read_only=True)
             self.fields['usuario_aprobacion'] = serializers.PrimaryKeyRelatedField(read_only=True)
@@ -305,6 +307,22 @@ class CotizacionSerializer(serializers.ModelSerializer):
             
         return super().update(instance, validated_data)
 
+class CotizacionListSerializer(CotizacionSerializer):
+    """
+    Representación ligera para el listado de cotizaciones: encabezado,
+    totales y número de productos (anotado en la consulta).
+    Los productos solo se incluyen con ?expand=productos.
+    """
+    productos_count = serializers.IntegerField(read_only=True)
+
+    class Meta(CotizacionSerializer.Meta):
+        fields = CotizacionSerializer.Meta.fields + ['productos_count']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if not self.context.get('expand_productos'):
+            self.fields.pop('productos', None)
+
 class CotizadorImagenproductoSerializer(serializers.ModelSerializer):
     clave_padre = EmptyStringCharField(max_length=255)
     url = EmptyStringURLField()
@@ -330,9 +348,16 @@ class KitProductoSerializer(serializers.ModelSerializer):
         ]
     
     def get_producto_nombre(self, obj):
+        # Con un ProductoInfoResolver en el contexto se evitan consultas por fila
+        resolver = self.context.get('producto_info')
+        if resolver is not None:
+            return resolver.nombre(obj.clave)
         return obj.get_producto_nombre()
     
     def get_producto_imagen(self, obj):
+        resolver = self.context.get('producto_info')
+        if resolver is not None:
+            return resolver.imagen(obj.clave)
         return obj.get_producto_imagen()
 
 class KitProductoCreateUpdateSerializer(serializers.ModelSerializer):
@@ -418,9 +443,9 @@ class KitCreateUpdateSerializer(serializers.ModelSerializer):
         return instance
 
 
-class ApplyKitToCotizacionSerializer(serializers.Serializer):
+class KitAplicacionSerializer(serializers.Serializer):
     """
-    Serializer para aplicar un kit a una cotización.
+    Campos para aplicar un kit a una cotización.
     Permite especificar valores personalizados para el kit en la cotización.
     """
     kit_uuid = serializers.UUIDField(
@@ -471,6 +496,12 @@ class ApplyKitToCotizacionSerializer(serializers.Serializer):
         help_text="Valor unitario con descuento personalizado del kit para esta cotización"
     )
 
+
+class ApplyKitToCotizacionSerializer(KitAplicacionSerializer):
+    """
+    Serializer para aplicar un kit a una cotización.
+    """
+
     def validate_kit_uuid(self, value):
         """
         Valida que el kit exista.
@@ -482,6 +513,26 @@ class ApplyKitToCotizacionSerializer(serializers.Serializer):
             raise serializers.ValidationError("El kit especificado no existe.")
 
 
+class ApplyKitsToCotizacionSerializer(serializers.Serializer):
+    """
+    Serializer para aplicar varios kits a una cotización en una sola solicitud.
+    """
+    kits = KitAplicacionSerializer(many=True, allow_empty=False)
+
+    def validate_kits(self, value):
+        """
+        Valida que todos los kits existan (una sola consulta).
+        """
+        uuids = {item['kit_uuid'] for item in value}
+        existentes = set(Kit.objects.filter(uuid__in=uuids).values_list('uuid', flat=True))
+        faltantes = uuids - existentes
+        if faltantes:
+            raise serializers.ValidationError(
+                f"Los kits especificados no existen: {', '.join(str(uuid) for uuid in faltantes)}"
+            )
+        return value
+
+
 class KitImageUploadSerializer(serializers.Serializer):
     """
     Serializer para la carga de imágenes de kits.
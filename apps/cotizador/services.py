@@ -3,6 +3,7 @@ from typing import Dict, Any
 from django.conf import settings
 import json
 from decimal import Decimal
+from apps.core import resilience
 
 # Clase para serializar Decimal a float
 class DecimalEncoder(json.JSONEncoder):
@@ -52,10 +53,12 @@ class OdooService:
             }
             
             # Realizar la petición POST al endpoint
-            response = requests.post(
+            response = resilience.call(
+                'odoo_order', requests.post,
                 self.order_endpoint, 
                 data=payload_json,
-                headers=headers
+                headers=headers,
+                timeout=settings.ODOO_TIMEOUT
             )
             
             print("\n===== RESPUESTA DE ODOO =====")
@@ -0,0 +1,23 @@
+from celery import shared_task
+from celery.utils.log import get_task_logger
+
+logger = get_task_logger(__name__)
+
+@shared_task
+def propagar_kit_task(kit_id, campos, padre=None, actualizar_padre=False):
+    """
+    Tarea Celery para copiar los cambios de un kit a las cotizaciones que lo usan.
+    Se usa cuando el kit aparece en demasiadas cotizaciones para hacerlo
+    dentro de la solicitud; los valores se leen del kit al ejecutarse.
+    """
+    from .models import Kit
+
+    try:
+        kit = Kit.objects.get(id=kit_id)
+    except Kit.DoesNotExist:
+        logger.warning(f'El kit {kit_id} ya no existe; no se propagan cambios')
+        return {'lineas': 0, 'cotizaciones': 0}
+
+    result = kit.propagar_a_cotizaciones(campos, padre=padre, actualizar_padre=actualizar_padre)
+    logger.info(f'Cambios del kit {kit.uuid} propagados: {result}')
+    return result
@@ -1,4 +1,5 @@
-from django.urls import path, include
+from django.conf import settings
+from django.urls import path, re_path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
     CotizacionViewSet,
@@ -27,3 +28,12 @@ urlpatterns = [
     path('', include(router_no_slash.urls)),
     path('', include(router_with_slash.urls)),
 ]
+
+# Vistas proxy async (servidor ASGI): tienen prioridad sobre las del router
+if settings.ASYNC_PROXY_VIEWS:
+    from . import async_views
+
+    urlpatterns = [
+        re_path(r'^sync/external-clients/?$', async_views.external_clients, name='sync-external-clients-async'),
+        re_path(r'^sync/validate-product/?$', async_views.validate_product, name='sync-validate-product-async'),
+    ] + urlpatterns
@@ -0,0 +1,65 @@
+"""
+Resolución en bloque del nombre y la imagen de productos por su clave.
+
+KitProducto.get_producto_nombre/get_producto_imagen consultan products_cache y
+cotizador_imagenproducto por cada fila. ProductoInfoResolver reúne las claves
+de una lista (o página) y las resuelve con dos consultas ``IN``; los
+serializers lo reciben en el contexto como ``producto_info``.
+"""
+
+
+class ProductoInfoResolver:
+    """
+    Uso:
+        resolver = ProductoInfoResolver.para(productos)
+        serializer = KitProductoSerializer(productos, many=True, context={'producto_info': resolver})
+    """
+
+    def __init__(self, claves):
+        self.claves = {clave for clave in claves if clave}
+        self._nombres = None
+        self._imagenes_cache = None
+        self._imagenes = None
+
+    @classmethod
+    def para(cls, productos):
+        """Crea un resolver para las claves de los productos indicados."""
+        return cls(producto.clave for producto in productos)
+
+    def _cargar(self):
+        if self._nombres is not None:
+            return
+
+        from ..cache.models import ProductsCache
+        from ..models import CotizadorImagenproducto
+
+        self._nombres = {}
+        self._imagenes_cache = {}
+        self._imagenes = {}
+        if not self.claves:
+            return
+
+        productos = ProductsCache.objects.filter(
+            reference_mask__in=self.claves
+        ).values_list('reference_mask', 'name', 'image_url')
+        for reference_mask, name, image_url in productos:
+            self._nombres[reference_mask] = name
+            self._imagenes_cache[reference_mask] = image_url
+
+        imagenes = CotizadorImagenproducto.objects.filter(
+            clave_padre__in=self.claves
+        ).values_list('clave_padre', 'url')
+        self._imagenes = dict(imagenes)
+
+    def nombre(self, clave):
+        """Nombre del producto en products_cache, o la clave si no existe."""
+        self._cargar()
+        return self._nombres.get(clave, clave)
+
+    def imagen(self, clave):
+        """
+        URL de la imagen: primero cotizador_imagenproducto, después
+        products_cache; None si no hay ninguna.
+        """
+        self._cargar()
+        return self._imagenes.get(clave) or self._imagenes_cache.get(clave) or None
@@ -1,10 +1,11 @@
-import uuid
 from django.shortcuts import get_object_or_404
 from rest_framework import viewsets, status, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from django.db.models import Prefetch, Q
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Prefetch, Q
 from django.core.exceptions import ValidationError
 from decimal import Decimal
 from datetime import datetime
@@ -20,6 +21,7 @@ from .models import (
 from .serializers import (
     ClienteSerializer,
     CotizacionSerializer,
+    CotizacionListSerializer,
     ProductoCotizacionSerializer,
     CotizadorImagenproductoSerializer,
     KitSerializer,
@@ -27,14 +29,19 @@ from .serializers import (
     KitProductoSerializer,
     KitProductoCreateUpdateSerializer,
     ApplyKitToCotizacionSerializer,
+    ApplyKitsToCotizacionSerializer,
     KitImageUploadSerializer,
     CreateOrderSerializer
 )
 from .services import OdooService, DecimalEncoder
 from .utils.upload_helpers import upload_kit_image_to_supabase, upload_kit_image_without_uuid
+from .utils.product_info import ProductoInfoResolver
 from .cache.tasks import sync_products_task
-from .cache.sync import sync_products_to_supabase, get_clients_from_supabase
+from .cache.sync import get_clients_from_supabase
+from .cache.product_data import fetch_product_data, ProductDataError
 from .pagination import CustomPageNumberPagination
+from apps.core import ercules, resilience
+from . import schema
 from django_filters.rest_framework import DjangoFilterBackend
 import copy
 
@@ -56,16 +63,6 @@ class ClienteViewSet(viewsets.ModelViewSet):
         return queryset
 
 class CotizacionViewSet(viewsets.ModelViewSet):
-    # Verificar si los campos de usuario existen en la base de datos
-    from django.db import connection
-    cursor = connection.cursor()
-    cursor.execute(
-        """SELECT column_name FROM information_schema.columns 
-           WHERE table_name = 'cotizador_cotizacion' 
-           AND column_name = 'usuario_creacion_id'"""
-    )
-    usuario_fields_exist = bool(cursor.fetchone())
-    
     queryset = Cotizacion.objects.all()
     serializer_class = CotizacionSerializer
     permission_classes = [IsAuthenticated]
@@ -74,7 +71,26 @@ class CotizacionViewSet(viewsets.ModelViewSet):
     http_method_names = ['get', 'post', 'patch', 'delete', 'head', 'options']
     filter_backends = [filters.SearchFilter, DjangoFilterBackend]
     search_fields = ['folio', 'proyecto', 'cliente']
+    # Orden usado por la paginación por cursor (?cursor=)
+    keyset_ordering = ['-fecha_creacion']
     
+    def _expand_productos(self):
+        """
+        Indica si el listado debe incluir los productos (?expand=productos).
+        """
+        expand = self.request.query_params.get('expand', '')
+        return 'productos' in [campo.strip() for campo in expand.split(',')]
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return CotizacionListSerializer
+        return CotizacionSerializer
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['expand_productos'] = self._expand_productos()
+        return context
+
     def create(self, request, *args, **kwargs):
         print("=== DATOS RECIBIDOS AL CREAR COTIZACIÓN ===")
         print("Headers:", request.headers)
@@ -101,7 +117,7 @@ class CotizacionViewSet(viewsets.ModelViewSet):
             queryset = queryset.filter(fecha_creacion__lte=fecha_fin)
             
         # Nuevos filtros por usuario (solo si los campos existen)
-        if self.__class__.usuario_fields_exist:
+        if schema.usuario_fields_exist():
             usuario_id = self.request.query_params.get('usuario_id', None)
             usuario_email = self.request.query_params.get('usuario_email', None)
             
@@ -119,6 +135,14 @@ class CotizacionViewSet(viewsets.ModelViewSet):
                 except User.DoesNotExist:
                     # Si no existe el usuario, devolver queryset vacío
                     queryset = queryset.none()
+
+        if self.action == 'list':
+            # El listado solo muestra el número de productos; se cargan con ?expand=productos
+            queryset = queryset.annotate(productos_count=Count('productos'))
+            if self._expand_productos():
+                queryset = queryset.prefetch_related(
+                    Prefetch('productos', queryset=ProductoCotizacion.objects.order_by('id'))
+                )
                 
         return queryset
 
@@ -127,7 +151,7 @@ class CotizacionViewSet(viewsets.ModelViewSet):
         new_status = serializer.validated_data.get('estatus', instance.estatus)
         
         # Actualizar usuario según el cambio de estatus (solo si los campos existen)
-        if new_status != instance.estatus and self.__class__.usuario_fields_exist:
+        if new_status != instance.estatus and schema.usuario_fields_exist():
             if new_status == 'enviada':
                 serializer.save(usuario_envio=self.request.user)
             elif new_status == 'aprobada':
@@ -145,7 +169,7 @@ class CotizacionViewSet(viewsets.ModelViewSet):
         user = self.request.user
         
         # Si el campo de usuario existe, asignar el usuario creador
-        if self.__class__.usuario_fields_exist:
+        if schema.usuario_fields_exist():
             save_kwargs['usuario_creacion'] = user
         
         # Obtener el vendedor_id del payload si existe
@@ -175,17 +199,7 @@ class CotizacionViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'])
     def duplicate(self, request, *args, **kwargs):
         cotizacion = self.get_object()
-        nueva_cotizacion = Cotizacion.objects.get(pk=cotizacion.pk)
-        nueva_cotizacion.pk = None
-        nueva_cotizacion.uuid = uuid.uuid4()
-        nueva_cotizacion.save()
-
-        # Duplicar productos
-        for producto in cotizacion.productos.all():
-            nuevo_producto = ProductoCotizacion.objects.get(pk=producto.pk)
-            nuevo_producto.pk = None
-            nuevo_producto.cotizacion = nueva_cotizacion
-            nuevo_producto.save()
+        nueva_cotizacion = cotizacion.duplicar()
 
         serializer = self.get_serializer(nueva_cotizacion)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -202,214 +216,17 @@ class CotizacionViewSet(viewsets.ModelViewSet):
         serializer = ApplyKitToCotizacionSerializer(data=request.data)
         
         if serializer.is_valid():
-            kit_uuid = serializer.validated_data['kit_uuid']
-            mostrar_productos_individuales = serializer.validated_data['mostrar_productos_individuales']
-            porcentaje_descuento_adicional = serializer.validated_data['porcentaje_descuento_adicional']
-            
-            # Obtener valores personalizados si se proporcionan
-            cantidad_personalizada = serializer.validated_data.get('cantidad')
-            valor_unitario_personalizado = serializer.validated_data.get('valor_unitario')
-            costo_unitario_personalizado = serializer.validated_data.get('costo_unitario')
-            porcentaje_descuento_personalizado = serializer.validated_data.get('porcentaje_descuento')
-            valor_unitario_con_descuento_personalizado = serializer.validated_data.get('valor_unitario_con_descuento')
+            datos = dict(serializer.validated_data)
+            kit_uuid = datos.pop('kit_uuid')
+            # Los productos individuales no se agregan: el kit entra como un solo producto
+            datos.pop('mostrar_productos_individuales', None)
             
             try:
-                # Log de kits disponibles para depuración
-
-                # Obtener todos los kits disponibles
-                for k in Kit.objects.all():
-                    pass  # Verificar disponibilidad de kits
-                
-                # Obtener el kit
                 kit = Kit.objects.get(uuid=kit_uuid)
-                
-                # Verificar que el kit tenga productos
-                if kit.productos.count() == 0:
-                    # Si el kit no tiene productos pero tiene valores directos, los usaremos
-                    if kit.valor_unitario > 0:
-                        pass  # El kit tiene valores directos que podemos usar
-                    else:
-                        return Response({
-                            'error': f'El kit "{kit.nombre}" no tiene productos asociados ni valores directos'
-                        }, status=status.HTTP_400_BAD_REQUEST)
-                
-                # Calcular los totales del kit basados en sus productos
-                precio_lista_total = Decimal('0')
-                costo_total = Decimal('0')
-                precio_descuento_total = Decimal('0')
-                
-                # Sumar los valores de todos los productos del kit
-                for producto_kit in kit.productos.all():
-                    # Procesar producto del kit
-                    
-                    precio_lista_total += producto_kit.precio_lista
-                    costo_total += producto_kit.costo
-                    
-                    # Aplicar descuento adicional al precio con descuento del producto
-                    precio_descuento_producto = producto_kit.precio_descuento
-                    if porcentaje_descuento_adicional > 0:
-                        precio_descuento_producto = precio_descuento_producto * (Decimal(100) - porcentaje_descuento_adicional) / Decimal(100)
-                        # Aplicar descuento adicional
-                    
-                    precio_descuento_total += precio_descuento_producto
-                
-                # Calcular el descuento total efectivo
-                if precio_lista_total > 0:
-                    descuento_total = (Decimal(100) - (precio_descuento_total * Decimal(100) / precio_lista_total))
-                else:
-                    descuento_total = kit.porcentaje_descuento
-                    if porcentaje_descuento_adicional > 0:
-                        descuento_total = Decimal(100) - ((Decimal(100) - kit.porcentaje_descuento) * \
-                                                      (Decimal(100) - porcentaje_descuento_adicional) / Decimal(100))
-                
-                # Usar la cantidad personalizada si se proporciona, de lo contrario usar la cantidad del kit
-                cantidad_total = cantidad_personalizada if cantidad_personalizada is not None else kit.cantidad
-                # Usar cantidad personalizada o predeterminada
-                
-                # Usar valores personalizados si se proporcionan
-                if valor_unitario_personalizado is not None:
-                    precio_lista_total = valor_unitario_personalizado
-                    # Usar valor unitario personalizado
-                    
-                if costo_unitario_personalizado is not None:
-                    costo_total = costo_unitario_personalizado
-                    # Usar costo unitario personalizado
-                    
-                if porcentaje_descuento_personalizado is not None:
-                    descuento_total = porcentaje_descuento_personalizado
-                    # Usar porcentaje de descuento personalizado
-                    
-                if valor_unitario_con_descuento_personalizado is not None:
-                    precio_descuento_total = valor_unitario_con_descuento_personalizado
-                    # Usar valor unitario con descuento personalizado
-                    
-                # Calcular el importe basado en el precio con descuento y la cantidad
-                importe = precio_descuento_total
-                
-                # Si los totales calculados son 0, usar los valores del kit directamente
-                if precio_lista_total == 0 and kit.valor_unitario > 0:
-                    # Usar valores del kit directamente porque los totales calculados son 0
-                    precio_lista_total = kit.costo_unitario
-                    costo_total = kit.costo_unitario
-                    precio_descuento_total = kit.valor_unitario_con_descuento
-                    importe = precio_descuento_total
-
-                
-                # Asegurar que los valores sean Decimal y no None
-                precio_lista_total = Decimal(precio_lista_total) if precio_lista_total is not None else Decimal('0')
-                costo_total = Decimal(costo_total) if costo_total is not None else Decimal('0')
-                precio_descuento_total = Decimal(precio_descuento_total) if precio_descuento_total is not None else Decimal('0')
-                importe = Decimal(importe) if importe is not None else Decimal('0')
-                
-                # Crear el producto de cotización para el kit (sin agregar productos individuales)
-                try:
-                    # Asegurarnos que los valores sean Decimal antes de usarlos
-                    precio_lista_total = Decimal(str(precio_lista_total)) if precio_lista_total is not None else Decimal('0')
-                    costo_total = Decimal(str(costo_total)) if costo_total is not None else Decimal('0')
-                    precio_descuento_total = Decimal(str(precio_descuento_total)) if precio_descuento_total is not None else Decimal('0')
-                    importe = Decimal(str(importe)) if importe is not None else Decimal('0')
-                    descuento_total = Decimal(str(descuento_total)) if descuento_total is not None else Decimal('0')
-                    
-                    # Imprimir información de depuración
-                    print(f"Creando kit en cotización {cotizacion.uuid}:")
-                    print(f"  Kit UUID: {kit.uuid}")
-                    print(f"  Nombre: {kit.nombre}")
-                    print(f"  Cantidad: {cantidad_total}")
-                    print(f"  Precio lista: {precio_lista_total}")
-                    print(f"  Costo: {costo_total}")
-                    print(f"  Descuento: {descuento_total}%")
-                    print(f"  Precio con descuento: {precio_descuento_total}")
-                    print(f"  Importe: {importe}")
-                    
-                    # Primero verificamos si ya existe este kit en la cotización
-                    kit_existente = ProductoCotizacion.objects.filter(
-                        cotizacion=cotizacion,
-                        kit_uuid=kit.uuid,
-                        es_kit=True
-                    ).first()
-                    
-                    if kit_existente:
-                        print(f"El kit ya existe en la cotización con ID: {kit_existente.id}")
-                        # Actualizar valores
-                        kit_existente.cantidad += cantidad_total
-                        kit_existente.porcentaje_descuento = descuento_total
-                        kit_existente.precio_lista = precio_lista_total
-                        kit_existente.costo = costo_total
-                        kit_existente.precio_descuento = precio_descuento_total
-                        kit_existente.importe = importe
-                        kit_existente.mostrar_en_cotizacion = True  # Asegurar que sea visible
-                        kit_existente.save()
-                        producto_cotizacion = kit_existente
-                        print(f"Kit actualizado con éxito. Nueva cantidad: {kit_existente.cantidad}")
-                    else:
-                        # Crear un nuevo producto de cotización para el kit
-                        producto_cotizacion = ProductoCotizacion.objects.create(
-                            cotizacion=cotizacion,
-                            es_kit=True,
-                            clave=kit.nombre,
-                            descripcion=kit.descripcion,
-                            imagen_url=kit.imagen_url,
-                            tag=kit.tag,
-                            cantidad=cantidad_total,
-                            porcentaje_descuento=descuento_total,
-                            precio_lista=precio_lista_total,
-                            costo=costo_total,
-                            precio_descuento=precio_descuento_total,
-                            importe=importe,
-                            kit_uuid=kit.uuid,
-                            mostrar_en_cotizacion=True  # IMPORTANTE: Asegurar que sea visible
-                        )
-                        print(f"Nuevo ProductoCotizacion creado con ID: {producto_cotizacion.id}")
-                    
-                    # Forzar una limpieza del caché de relaciones
-                    cotizacion.refresh_from_db()
-                    
-                    # Verificar todos los productos en la cotización
-                    todos_productos = ProductoCotizacion.objects.filter(cotizacion=cotizacion).values_list('id', 'clave', 'mostrar_en_cotizacion')
-                    print(f"TODOS los productos en la cotización {cotizacion.uuid}:")
-                    for prod in todos_productos:
-                        print(f"  ID: {prod[0]}, Clave: {prod[1]}, Mostrar: {prod[2]}")
-                    
-                    # Verificar si el producto fue creado correctamente
-                    productos_visibles = ProductoCotizacion.objects.filter(
-                        cotizacion=cotizacion,
-                        mostrar_en_cotizacion=True
-                    ).count()
-                    print(f"Total productos VISIBLES en la cotización: {productos_visibles}")
-                except Exception as e:
-                    print(f"Error al crear el producto: {str(e)}")
-                    return Response({
-                        'error': f'Error al crear el producto: {str(e)}'
-                    }, status=status.HTTP_400_BAD_REQUEST)
-                
-                # Solo mostrar informaciu00f3n del producto si se creu00f3 exitosamente
-                try:
-                    # Producto cotización creado exitosamente
-                    pass  # Verificar valores del producto creado
-                except UnboundLocalError:
-                    pass  # No se pudo acceder al producto_cotizacion
-                
-                # Actualizar los totales de la cotización
-                try:
-                    self._actualizar_totales_cotizacion(cotizacion)
-                    pass  # Totales de cotización actualizados correctamente
-                except Exception as e:
-                    pass  # Error al actualizar totales
-                
-                # Actualizar los valores del kit con los totales calculados
-                try:
-                    if precio_lista_total > 0:
-                        # Actualizando valores del kit
-                        
-                        kit.valor_unitario = precio_lista_total
-                        kit.costo_unitario = costo_total
-                        kit.porcentaje_descuento = descuento_total
-                        kit.valor_unitario_con_descuento = precio_descuento_total
-                        kit.save()
-                        
-                        pass  # Valores del kit actualizados
-                except Exception as e:
-                    pass  # Error al actualizar los valores del kit
+                producto_cotizacion = cotizacion.aplicar_kits([{'kit': kit, **datos}])[0]
+                print(f"Kit {kit.uuid} aplicado a la cotización {cotizacion.uuid}: "
+                      f"producto {producto_cotizacion.id}, cantidad {producto_cotizacion.cantidad}, "
+                      f"importe {producto_cotizacion.importe}")
                 
                 return Response({
                     'message': f'Kit "{kit.nombre}" aplicado correctamente a la cotización',
@@ -421,40 +238,69 @@ class CotizacionViewSet(viewsets.ModelViewSet):
                 return Response({
                     'error': 'El kit especificado no existe'
                 }, status=status.HTTP_404_NOT_FOUND)
+            except ValidationError as e:
+                return Response({
+                    'error': e.messages[0]
+                }, status=status.HTTP_400_BAD_REQUEST)
             except Exception as e:
                 return Response({
                     'error': f'Error al aplicar el kit: {str(e)}'
                 }, status=status.HTTP_400_BAD_REQUEST)
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-    
-    def _actualizar_totales_cotizacion(self, cotizacion):
+
+    @action(detail=True, methods=['post'])
+    def apply_kits(self, request, uuid=None):
         """
-        Actualiza los totales de una cotización basado en sus productos.
+        Aplica varios kits a una cotización en una sola transacción.
+        
+        Recibe {"kits": [{"kit_uuid": ..., "cantidad": ..., ...}, ...]} con los
+        mismos campos que apply_kit. Si algún kit no se puede aplicar no se
+        aplica ninguno.
         """
-        productos = cotizacion.productos.filter(mostrar_en_cotizacion=True)
+        cotizacion = self.get_object()
+        serializer = ApplyKitsToCotizacionSerializer(data=request.data)
         
-        # Calcular subtotal
-        subtotal = sum(producto.importe for producto in productos)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
-        # Calcular descuento total
-        total_descuento = sum(
-            (producto.precio_lista * producto.cantidad) - producto.importe 
-            for producto in productos
+        kits = Kit.objects.in_bulk(
+            [item['kit_uuid'] for item in serializer.validated_data['kits']],
+            field_name='uuid'
         )
+        aplicaciones = []
+        for item in serializer.validated_data['kits']:
+            datos = dict(item)
+            datos.pop('mostrar_productos_individuales', None)
+            aplicaciones.append({'kit': kits[datos.pop('kit_uuid')], **datos})
         
-        # Calcular IVA (16%)
-        iva = subtotal * Decimal('0.16')
-        
-        # Calcular total general
-        total_general = subtotal + cotizacion.logistica + iva
+        try:
+            productos = cotizacion.aplicar_kits(aplicaciones)
+        except ValidationError as e:
+            return Response({
+                'error': e.messages[0]
+            }, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return Response({
+                'error': f'Error al aplicar los kits: {str(e)}'
+            }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Actualizar cotización
-        cotizacion.subtotal_mobiliario = subtotal
-        cotizacion.total_descuento = total_descuento
-        cotizacion.iva = iva
-        cotizacion.total_general = total_general
-        cotizacion.save()
+        print(f"{len(aplicaciones)} kits aplicados a la cotización {cotizacion.uuid}")
+        return Response({
+            'message': f'{len(aplicaciones)} kits aplicados correctamente a la cotización',
+            'cotizacion_uuid': str(cotizacion.uuid),
+            'productos': [
+                {
+                    'id': producto.id,
+                    'kit_uuid': str(producto.kit_uuid),
+                    'cantidad': producto.cantidad,
+                    'importe': producto.importe,
+                }
+                for producto in productos
+            ],
+            'subtotal_mobiliario': cotizacion.subtotal_mobiliario,
+            'total_general': cotizacion.total_general
+        }, status=status.HTTP_200_OK)
 
 class ProductoCotizacionViewSet(viewsets.ModelViewSet):
     queryset = ProductoCotizacion.objects.all()
@@ -491,17 +337,14 @@ class ProductoCotizacionViewSet(viewsets.ModelViewSet):
             serializer = self.get_serializer(data=request.data)
             serializer.is_valid(raise_exception=True)
             
-            # Crear el producto
-            self.perform_create(serializer)
-            
-            # Actualizar los totales de la cotización si se proporciona el UUID
-            if 'cotizacion_uuid' in request.data:
+            with transaction.atomic():
+                # Crear el producto
+                self.perform_create(serializer)
+
+                # Sumar el aporte del nuevo producto a los totales de la cotización
+                producto = serializer.instance
                 try:
-                    cotizacion = Cotizacion.objects.get(uuid=request.data['cotizacion_uuid'])
-                    cotizacion_viewset = CotizacionViewSet()
-                    cotizacion_viewset._actualizar_totales_cotizacion(cotizacion)
-                except Cotizacion.DoesNotExist:
-                    print(f"No se encontró la cotización con UUID: {request.data['cotizacion_uuid']}")
+                    producto.cotizacion.ajustar_totales(*producto.aporte_totales())
                 except Exception as e:
                     print(f"Error al actualizar totales de cotización: {str(e)}")
             
@@ -535,7 +378,19 @@ class ProductoCotizacionViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            self.perform_update(serializer)
+            with transaction.atomic():
+                subtotal_anterior, descuento_anterior = instance.aporte_totales()
+                self.perform_update(serializer)
+
+                # Ajustar los totales solo por la diferencia de este producto
+                subtotal, descuento = serializer.instance.aporte_totales()
+                try:
+                    instance.cotizacion.ajustar_totales(
+                        subtotal - subtotal_anterior,
+                        descuento - descuento_anterior
+                    )
+                except Exception as e:
+                    print(f"Error al actualizar totales de cotización: {str(e)}")
             return Response(serializer.data)
         except ProductoCotizacion.DoesNotExist:
             return Response(
@@ -556,7 +411,16 @@ class ProductoCotizacionViewSet(viewsets.ModelViewSet):
     def destroy(self, request, *args, **kwargs):
         try:
             instance = self.get_object()
-            self.perform_destroy(instance)
+            with transaction.atomic():
+                subtotal, descuento = instance.aporte_totales()
+                cotizacion = instance.cotizacion
+                self.perform_destroy(instance)
+
+                # Restar el aporte del producto eliminado
+                try:
+                    cotizacion.ajustar_totales(-subtotal, -descuento)
+                except Exception as e:
+                    print(f"Error al actualizar totales de cotización: {str(e)}")
             return Response(status=status.HTTP_204_NO_CONTENT)
         except ProductoCotizacion.DoesNotExist:
             return Response(
@@ -587,16 +451,6 @@ class KitViewSet(viewsets.ModelViewSet):
     """
     ViewSet para el modelo Kit.
     """
-    # El campo creado_por ya existe en el modelo Kit, pero verificamos para mantener consistencia
-    from django.db import connection
-    cursor = connection.cursor()
-    cursor.execute(
-        """SELECT column_name FROM information_schema.columns 
-           WHERE table_name = 'cotizador_kit' 
-           AND column_name = 'creado_por_id'"""
-    )
-    creado_por_exists = bool(cursor.fetchone())
-    
     queryset = Kit.objects.all()
     serializer_class = KitSerializer
     permission_classes = [IsAuthenticated]
@@ -701,15 +555,7 @@ class KitViewSet(viewsets.ModelViewSet):
         print(f"Tag actual en la instancia: {instance.tag}\n")
         
         # Guardar valores originales para comparación
-        original_nombre = instance.nombre
-        original_descripcion = instance.descripcion
-        original_imagen_url = instance.imagen_url
-        original_tag = instance.tag
-        original_cantidad = instance.cantidad
-        original_valor_unitario = instance.valor_unitario
-        original_costo_unitario = instance.costo_unitario
-        original_porcentaje_descuento = instance.porcentaje_descuento
-        original_valor_unitario_con_descuento = instance.valor_unitario_con_descuento
+        originales = {campo: getattr(instance, campo) for campo in Kit.CAMPOS_PROPAGADOS}
         
         # Verificar si se está enviando el campo 'padre' en la solicitud
         padre_en_request = 'padre' in request.data
@@ -723,78 +569,29 @@ class KitViewSet(viewsets.ModelViewSet):
         print(f"\nTag después de la actualización: {instance.tag}\n")
         
         # Si los valores han cambiado, actualizar los productos de cotización asociados
-        if (original_nombre != instance.nombre or
-            original_descripcion != instance.descripcion or
-            original_imagen_url != instance.imagen_url or
-            original_tag != instance.tag or
-            original_cantidad != instance.cantidad or
-            original_valor_unitario != instance.valor_unitario or
-            original_costo_unitario != instance.costo_unitario or
-            original_porcentaje_descuento != instance.porcentaje_descuento or
-            original_valor_unitario_con_descuento != instance.valor_unitario_con_descuento or
-            padre_en_request):
-            
-            # Importar aquí para evitar importaciones circulares
-            from apps.cotizador.models import ProductoCotizacion
-
-            
-            # Buscar todos los productos de cotización asociados a este kit
-            productos_cotizacion = ProductoCotizacion.objects.filter(kit_uuid=instance.uuid, es_kit=True)
-            # Actualizar productos de cotización asociados al kit
-            
-            # Actualizar cada producto de cotización
-            for producto in productos_cotizacion:
-                # Actualizar producto de cotización
-                
-                # Actualizar campos básicos
-                if original_nombre != instance.nombre:
-                    producto.clave = instance.nombre
-                if original_descripcion != instance.descripcion:
-                    producto.descripcion = instance.descripcion
-                if original_imagen_url != instance.imagen_url:
-                    producto.imagen_url = instance.imagen_url
-                if original_tag != instance.tag:
-                    producto.tag = instance.tag
-                
-                # Actualizar el campo 'padre' si se envió en la solicitud
-                if padre_en_request:
-                    producto.padre = request.data.get('padre')
-                    print(f"Actualizando campo 'padre' a {request.data.get('padre')} para producto {producto.id}")
-                
-                # Actualizar cantidad si ha cambiado
-                cantidad_anterior = producto.cantidad
-                if original_cantidad != instance.cantidad:
-                    # Actualizar cantidad
-                    producto.cantidad = instance.cantidad
-                    
-                # Actualizar valores numéricos si han cambiado
-                if original_valor_unitario != instance.valor_unitario:
-                    producto.precio_lista = instance.valor_unitario
-                if original_costo_unitario != instance.costo_unitario:
-                    producto.costo = instance.costo_unitario
-                if original_porcentaje_descuento != instance.porcentaje_descuento:
-                    producto.porcentaje_descuento = instance.porcentaje_descuento
-                if original_valor_unitario_con_descuento != instance.valor_unitario_con_descuento:
-                    producto.precio_descuento = instance.valor_unitario_con_descuento
-                
-                # Asegurar que precio_descuento tenga un valor
-                if producto.precio_descuento is None:
-                    producto.precio_descuento = producto.precio_lista * (1 - (producto.porcentaje_descuento / 100))
-                    # Calcular precio descuento
-                
-                # Recalcular el importe usando solo el precio_descuento (sin multiplicar por cantidad)
-                # Siempre actualizar el importe cuando cualquier valor relevante cambie
-                if (original_valor_unitario != instance.valor_unitario or
-                    original_porcentaje_descuento != instance.porcentaje_descuento or
-                    original_valor_unitario_con_descuento != instance.valor_unitario_con_descuento):
-                    producto.importe = producto.precio_descuento
-                
-                # Guardar los cambios
+        campos = [campo for campo, valor in originales.items() if getattr(instance, campo) != valor]
+        if campos or padre_en_request:
+            padre = request.data.get('padre')
+            propagar_async = str(request.query_params.get('propagar_async', '')).lower() in ('1', 'true', 'yes')
+            if not propagar_async:
+                umbral = getattr(settings, 'KIT_PROPAGATION_ASYNC_THRESHOLD', 500)
+                propagar_async = instance.lineas_cotizacion().count() > umbral
+            
+            if propagar_async:
+                # Demasiadas cotizaciones usan el kit: propagar en segundo plano
+                from .tasks import propagar_kit_task
                 try:
-                    producto.save()
-                    pass  # Producto actualizado correctamente
+                    propagar_kit_task.delay(instance.id, campos, padre=padre, actualizar_padre=padre_en_request)
+                    print(f"Propagación de cambios del kit {instance.uuid} enviada a Celery: {campos}")
+                    return Response(serializer.data)
                 except Exception as e:
-                    pass  # Error al actualizar producto
+                    print(f"No se pudo encolar la propagación del kit {instance.uuid}: {str(e)}")
+            
+            try:
+                resultado = instance.propagar_a_cotizaciones(campos, padre=padre, actualizar_padre=padre_en_request)
+                print(f"Cambios del kit {instance.uuid} propagados: {resultado}")
+            except Exception as e:
+                print(f"Error al actualizar productos de cotización del kit {instance.uuid}: {str(e)}")
         
         return Response(serializer.data)
     
@@ -870,14 +667,64 @@ class KitViewSet(viewsets.ModelViewSet):
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=True, methods=['post', 'put'])
+    def set_products(self, request, uuid=None):
+        """
+        Establece el contenido completo del kit en una sola operación.
+        
+        Recibe la lista de productos (o {"productos": [...]}) con los mismos
+        campos que add_product. Los productos del kit que no vengan en la lista
+        se eliminan.
+        """
+        kit = self.get_object()
+        data = request.data.get('productos', []) if isinstance(request.data, dict) else request.data
+        
+        serializer = KitProductoCreateUpdateSerializer(data=data, many=True)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        productos_data = []
+        imagenes = {}
+        for datos in serializer.validated_data:
+            datos = dict(datos)
+            producto_imagen = datos.pop('producto_imagen', None)
+            if producto_imagen:
+                imagenes[datos['clave']] = producto_imagen.replace(" ", "%20")
+            productos_data.append(datos)
+        
+        try:
+            with transaction.atomic():
+                productos = kit.establecer_productos(productos_data)
+                
+                # Guardar las URLs de imagen en CotizadorImagenproducto en una sola consulta
+                if imagenes:
+                    CotizadorImagenproducto.objects.bulk_create(
+                        [CotizadorImagenproducto(clave_padre=clave, url=url) for clave, url in imagenes.items()],
+                        update_conflicts=True,
+                        unique_fields=['clave_padre'],
+                        update_fields=['url']
+                    )
+        except ValidationError as e:
+            return Response({'error': e.messages[0]}, status=status.HTTP_400_BAD_REQUEST)
+        
+        print(f"Kit {kit.uuid}: {len(productos)} productos establecidos")
+        response_serializer = KitProductoSerializer(
+            productos, many=True,
+            context={'producto_info': ProductoInfoResolver.para(productos)}
+        )
+        return Response(response_serializer.data, status=status.HTTP_200_OK)
+
     @action(detail=True, methods=['get'])
     def products(self, request, uuid=None):
         """
         Obtiene todos los productos de un kit.
         """
         kit = self.get_object()
-        productos = kit.productos.all().order_by('orden')
-        serializer = KitProductoSerializer(productos, many=True)
+        productos = list(kit.productos.all().order_by('orden'))
+        serializer = KitProductoSerializer(
+            productos, many=True,
+            context={'producto_info': ProductoInfoResolver.para(productos)}
+        )
         return Response(serializer.data)
         
     @action(detail=False, methods=['post'])
@@ -975,6 +822,27 @@ class KitProductoViewSet(viewsets.ModelViewSet):
             return KitProductoCreateUpdateSerializer
         return KitProductoSerializer
 
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if getattr(self, 'producto_info', None) is not None:
+            context['producto_info'] = self.producto_info
+        return context
+
+    def list(self, request, *args, **kwargs):
+        """
+        Lista los productos de kit resolviendo nombres e imágenes de toda la
+        página con dos consultas.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        productos = page if page is not None else list(queryset)
+        self.producto_info = ProductoInfoResolver.para(productos)
+        
+        serializer = self.get_serializer(productos, many=True)
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
+
     def get_queryset(self):
         queryset = KitProducto.objects.all()
         
@@ -1050,73 +918,63 @@ class SyncViewSet(viewsets.ViewSet):
         }
     }
     
-    def _run_async_task(self, task_function, task_params=None):
+    def _is_full_sync(self, request):
         """
-        Método auxiliar para ejecutar tareas asíncronas y gestionar sus resultados.
-        
+        Indica si la solicitud pide una sincronización completa (?full=true o {"full": true}).
+        """
+        value = request.query_params.get('full', request.data.get('full', False))
+        return str(value).lower() in ('1', 'true', 'yes')
+
+    def _dispatch_task(self, name, celery_task, task_params=None):
+        """
+        Registra una tarea en SyncTask y la envía a los workers de Celery.
+
+        El registro funciona como candado: si ya hay una tarea activa con el
+        mismo nombre se responde 409 con su task_id en lugar de lanzar otra.
+
         Args:
-            task_function: Función a ejecutar de forma asíncrona
-            task_params: Parámetros opcionales para la función
-            
+            name: Nombre de la tarea (ej. 'sync_products')
+            celery_task: Tarea Celery que recibe task_id y los parámetros
+            task_params: Parámetros opcionales para la tarea
+
         Returns:
             Response con información sobre la tarea iniciada
         """
+        from .cache.task_registry import create_task, fail_task, TaskAlreadyRunning
+
+        task_params = task_params or {}
         try:
-            import threading
-            import uuid
-            from datetime import datetime
-            
-            task_id = f'thread-{uuid.uuid4()}'
-            
-            def run_task():
-                try:
-                    # Ejecutar la función con parámetros si se proporcionan
-                    if task_params:
-                        result = task_function(**task_params)
-                    else:
-                        result = task_function()
-                        
-                    # Almacenar los resultados para consulta posterior
-                    if not hasattr(SyncViewSet, 'task_results'):
-                        SyncViewSet.task_results = {}
-                    SyncViewSet.task_results[task_id] = {
-                        'task_id': task_id,
-                        'status': 'COMPLETED',
-                        'timestamp': datetime.now().isoformat(),
-                        'stats': result
-                    }
-                except Exception as e:
-                    import traceback
-                    if not hasattr(SyncViewSet, 'task_results'):
-                        SyncViewSet.task_results = {}
-                    SyncViewSet.task_results[task_id] = {
-                        'task_id': task_id,
-                        'status': 'ERROR',
-                        'timestamp': datetime.now().isoformat(),
-                        'error': str(e),
-                        'traceback': traceback.format_exc()
-                    }
-                    print(f"Error en tarea asíncrona: {str(e)}")
-            
-            # Iniciar en un hilo separado
-            thread = threading.Thread(target=run_task)
-            thread.daemon = True
-            thread.start()
-            
-            # Devolver respuesta inmediata
+            task = create_task(name, task_params)
+        except TaskAlreadyRunning as e:
+            running_id = str(e.task.task_id)
             return Response({
-                'status': 'success',
-                'message': 'Tarea iniciada',
-                'task_id': task_id,
-                'timestamp': datetime.now().isoformat(),
-                'check_status_url': f'/api/v1/cotizador/sync/task_status/?task_id={task_id}'
-            }, status=status.HTTP_202_ACCEPTED)
-            
+                'status': 'error',
+                'message': f'Ya hay una tarea {name} en ejecución',
+                'task_id': running_id,
+                'check_status_url': f'/api/v1/cotizador/sync/task_status/?task_id={running_id}'
+            }, status=status.HTTP_409_CONFLICT)
+
+        task_id = str(task.task_id)
+        try:
+            celery_task.delay(task_id=task_id, **task_params)
         except Exception as e:
+            # Sin broker la tarea nunca correría: liberar el candado
+            print(f"Error al enviar la tarea {name} a Celery: {str(e)}")
+            fail_task(task.task_id, f"No se pudo enviar la tarea a Celery: {str(e)}")
             return Response({
                 'status': 'error',
-                'message': str(e)
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+                'message': 'No se pudo encolar la tarea',
+                'task_id': task_id,
+                'error': str(e)
+            }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        return Response({
+            'status': 'success',
+            'message': 'Tarea iniciada',
+            'task_id': task_id,
+            'timestamp': datetime.now().isoformat(),
+            'check_status_url': f'/api/v1/cotizador/sync/task_status/?task_id={task_id}'
+        }, status=status.HTTP_202_ACCEPTED)
 
     def get_user_api(self, user):
         print(f"Obteniendo user_api para el usuario: {user}")
@@ -1312,9 +1170,9 @@ class SyncViewSet(viewsets.ViewSet):
         """
         Endpoint para activar manualmente la sincronización de productos.
         Puede ser llamado desde n8n u otras herramientas de automatización.
+        Es incremental; usar ?full=true para una sincronización completa.
         """
-        from .cache.sync import sync_products_to_supabase
-        return self._run_async_task(sync_products_to_supabase)
+        return self._dispatch_task('sync_products', sync_products_task, {'full': self._is_full_sync(request)})
     
     @action(detail=False, methods=['post'])
     def sync_products_manual(self, request):
@@ -1322,9 +1180,9 @@ class SyncViewSet(viewsets.ViewSet):
         Endpoint POST para activar manualmente la sincronización de productos.
         Diseñado para ser llamado desde una interfaz de usuario o API.
         Permite verificar que la sincronización esté correctamente configurada.
+        Es incremental; enviar {"full": true} para una sincronización completa.
         """
-        from .cache.sync import sync_products_to_supabase
-        return self._run_async_task(sync_products_to_supabase)
+        return self._dispatch_task('sync_products', sync_products_task, {'full': self._is_full_sync(request)})
 
     @action(detail=False, methods=['post'])
     def sync_images(self, request):
@@ -1333,66 +1191,15 @@ class SyncViewSet(viewsets.ViewSet):
         Sincroniza las URLs de imágenes desde la tabla cotizador_imagenproducto a products_cache.
         NOTA: Este proceso puede tardar varios minutos en completarse.
         """
-        from django.core.management import call_command
-        
+        from .cache.tasks import sync_images_task
+
         # Parámetros opcionales de la solicitud
-        batch_size = request.data.get('batch_size', 100)
-        validate_urls = request.data.get('validate_urls', False)
-        force_update = request.data.get('force_update', False)
-        
-        def sync_images_task():
-            from io import StringIO
-            import sys
-            import time
-            
-            # Registrar tiempo de inicio
-            start_time = time.time()
-            
-            # Capturar la salida del comando
-            output = StringIO()
-            original_stdout = sys.stdout
-            sys.stdout = output
-            
-            # Ejecutar el comando de sincronización
-            call_command(
-                'sync_products_cache_images',
-                batch_size=batch_size,
-                validate_urls=validate_urls,
-                force_update=force_update,
-                verbosity=2
-            )
-            
-            # Restaurar stdout
-            sys.stdout = original_stdout
-            
-            # Calcular tiempo total de ejecución
-            execution_time = time.time() - start_time
-            
-            # Procesar la salida para extraer estadísticas
-            output_text = output.getvalue()
-            lines = output_text.split('\n')
-            
-            # Extraer estadísticas
-            stats = {}
-            for line in lines:
-                if 'Total de productos procesados:' in line:
-                    stats['total_productos'] = int(line.split(':')[1].strip())
-                elif 'Productos actualizados:' in line:
-                    stats['actualizados'] = int(line.split(':')[1].strip())
-                elif 'Productos sin cambios:' in line:
-                    stats['sin_cambios'] = int(line.split(':')[1].strip())
-                elif 'Productos sin imagen:' in line:
-                    stats['sin_imagen'] = int(line.split(':')[1].strip())
-                elif 'Errores:' in line and 'Error' not in line[:5]:  # Evitar líneas de error completas
-                    stats['errores'] = int(line.split(':')[1].strip())
-            
-            # Añadir detalles adicionales
-            stats['execution_time_seconds'] = round(execution_time, 2)
-            stats['details'] = output_text[-2000:] if len(output_text) > 2000 else output_text
-            
-            return stats
-        
-        return self._run_async_task(sync_images_task)
+        params = {
+            'batch_size': request.data.get('batch_size', 100),
+            'validate_urls': request.data.get('validate_urls', False),
+            'force_update': request.data.get('force_update', False),
+        }
+        return self._dispatch_task('sync_images', sync_images_task, params)
     
     @action(detail=False, methods=['get'])
     def task_status(self, request):
@@ -1407,29 +1214,33 @@ class SyncViewSet(viewsets.ViewSet):
                 'message': 'Se requiere el parámetro task_id'
             }, status=status.HTTP_400_BAD_REQUEST)
             
-        # Verificar si tenemos resultados para esta tarea
-        if hasattr(SyncViewSet, 'task_results') and task_id in SyncViewSet.task_results:
-            return Response(SyncViewSet.task_results[task_id])
-        elif task_id.startswith('thread-'):
-            response_data = {
-                'task_id': task_id,
-                'status': 'RUNNING',
-            }
-            return Response(response_data)
-        else:
+        from .cache.task_registry import get_task
+
+        # El estado vive en la base de datos: cualquier worker puede responder
+        task = get_task(task_id)
+        if task is None:
             return Response({
                 'status': 'error',
                 'message': f'No se encontró la tarea con ID: {task_id}'
             }, status=status.HTTP_404_NOT_FOUND)
+        return Response(task.to_dict())
+
+    @action(detail=False, methods=['get'], url_path='ercules-stats')
+    def ercules_stats(self, request):
+        """
+        Métricas de las llamadas a las APIs de Ercules por endpoint
+        (solicitudes, errores y latencia promedio).
+        """
+        return Response(ercules.get_stats())
     
     @action(detail=False, methods=['get'])
     def sync_products_async(self, request):
         """
         Endpoint para activar la sincronización de productos como tarea asíncrona.
         Inicia la tarea pero no espera a que termine.
+        Es incremental; usar ?full=true para una sincronización completa.
         """
-        from .cache.sync import sync_products_to_supabase
-        return self._run_async_task(sync_products_to_supabase)
+        return self._dispatch_task('sync_products', sync_products_task, {'full': self._is_full_sync(request)})
     
     @action(detail=False, methods=['get'])
     def get_clients(self, request):
@@ -1460,7 +1271,6 @@ class SyncViewSet(viewsets.ViewSet):
     def get_wearehouses(self, request):
         try:
             import json
-            import requests
             
             user = request.user
             user_api = self.get_user_api(user)
@@ -1472,10 +1282,10 @@ class SyncViewSet(viewsets.ViewSet):
             
 
             print(f"Consultando almacenes con user_api: {user_api}")
-            url = f"https://api2.ercules.mx/api/v1/common/location_classifications?user_id={user_api}&classification=0&names=0"
-            print(f"URL de consulta: {url}")
+            params = {'user_id': user_api, 'classification': 0, 'names': 0}
+            print(f"Consultando {ercules.get_url('almacenes')} con {params}")
             
-            response = requests.get(url)
+            response = ercules.get('almacenes', params=params)
             
             # Obtener todos los datos para depuraciu00f3n
             all_data = response.json()
@@ -1730,7 +1540,10 @@ class SyncViewSet(viewsets.ViewSet):
             print("Headers preparados para la petición a Odoo")
             
             # Realizar una simple petición POST a la API de Odoo
-            response = requests.post(odoo_endpoint, data=payload_json, headers=headers)
+            response = resilience.call(
+                'odoo_order', requests.post, odoo_endpoint,
+                data=payload_json, headers=headers, timeout=settings.ODOO_TIMEOUT
+            )
             
             # Verificar si la petición fue exitosa
             response.raise_for_status()
@@ -1812,6 +1625,13 @@ class SyncViewSet(viewsets.ViewSet):
                     'data': odoo_response
                 }
                 return Response(formatted_response, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        except resilience.UpstreamUnavailable as e:
+            # Odoo está marcado como caído o saturado: fallar rápido
+            print(f"Odoo no disponible: {str(e)}")
+            return Response({
+                'status': 'error',
+                'message': f'Odoo no está disponible en este momento, intente más tarde ({e.reason})'
+            }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
         except Exception as e:
             # Si hay algún error en la petición a Odoo
             print(f"\n===== ERROR EN CREATE_ORDER =====")
@@ -1839,17 +1659,16 @@ class SyncViewSet(viewsets.ViewSet):
             }
             
             from .cache.sync import sync_clients_to_supabase
-            import requests
             from datetime import datetime
             
             start_time = datetime.now()
             
             # Construir la URL con los parámetros
-            api_url = "https://api.ercules.mx/api/v1/common/res_partner"
+            api_url = ercules.get_url('clientes')
             
             # Realizar la petición a la API
             print(f"Consultando API: {api_url}")
-            response = requests.get(api_url, params=params)
+            response = ercules.get('clientes', params=params)
             
             # Verificar si la respuesta es exitosa
             if response.status_code != 200:
@@ -1897,6 +1716,34 @@ class SyncViewSet(viewsets.ViewSet):
                 'message': f'Error en la sincronización de clientes: {str(e)}'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @staticmethod
+    def formatear_clientes_externos(clients_data):
+        """
+        Filtra y formatea los clientes de la API como se hace en el frontend:
+        excluye nombres con @ y deja un registro por partner_id.
+        """
+        client_map = {}
+        
+        for client in clients_data:
+            # Excluir clientes con @ en su nombre
+            if '@' in client.get('name_partner', ''):
+                continue
+                
+            partner_id = client.get('partner_id')
+            if partner_id and partner_id not in client_map:
+                client_map[partner_id] = {
+                    'partner_id': partner_id,
+                    'name_partner': client.get('name_partner', ''),
+                    'rfc': client.get('rfc', ''),
+                    'direccion': client.get('direccion', ''),
+                    'ciudad': client.get('ciudad', ''),
+                    'estado': client.get('estado', ''),
+                    'original_data': client
+                }
+        
+        # Convertir el diccionario a lista
+        return list(client_map.values())
+
     @action(detail=False, methods=['get'], url_path='external-clients')
     def get_external_clients(self, request):
         import json
@@ -1949,15 +1796,10 @@ class SyncViewSet(viewsets.ViewSet):
             from urllib.parse import urlencode
             print(f"Parámetros recibidos: {request.query_params}")
             print(f"Parámetros enviados a la API: {params}")
-            print(f"URL completa: https://api.ercules.mx/api/v1/common/res_partner?{urlencode(params)}")
-
-            import requests
-            
-            # Construir la URL con los parámetros
-            api_url = "https://api.ercules.mx/api/v1/common/res_partner"
+            print(f"URL completa: {ercules.get_url('clientes')}?{urlencode(params)}")
             
             # Realizar la petición a la API
-            response = requests.get(api_url, params=params)
+            response = ercules.get('clientes', params=params)
 
             print(f"Respuesta de la API: {json.dumps(response.json(), indent=4)}")
             
@@ -1971,31 +1813,7 @@ class SyncViewSet(viewsets.ViewSet):
             # Obtener los datos de la respuesta
             clients_data = response.json()
             
-            # Filtrar y formatear los datos como se hace en el frontend
-            formatted_clients = []
-            client_map = {}
-            
-            for client in clients_data:
-                # Excluir clientes con @ en su nombre
-                if '@' in client.get('name_partner', ''):
-                    continue
-                    
-                partner_id = client.get('partner_id')
-                if partner_id and partner_id not in client_map:
-                    client_map[partner_id] = {
-                        'partner_id': partner_id,
-                        'name_partner': client.get('name_partner', ''),
-                        'rfc': client.get('rfc', ''),
-                        'direccion': client.get('direccion', ''),
-                        'ciudad': client.get('ciudad', ''),
-                        'estado': client.get('estado', ''),
-                        'original_data': client
-                    }
-            
-            # Convertir el diccionario a lista
-            formatted_clients = list(client_map.values())
-            
-            return Response(formatted_clients, status=status.HTTP_200_OK)
+            return Response(self.formatear_clientes_externos(clients_data), status=status.HTTP_200_OK)
             
         except Exception as e:
             import traceback
@@ -2036,24 +1854,15 @@ class SyncViewSet(viewsets.ViewSet):
                 'only_line': request.query_params.get('only_line', '0')
             }
              
-            import requests
-            
-            # Construir la URL con los parámetros
-            api_url = "https://api2.ercules.mx/api/v1/common/product_data"
-            
-            # Realizar la petición a la API
-            response = requests.get(api_url, params=params)
-            
-            # Verificar si la respuesta es exitosa
-            if response.status_code != 200:
+            # Consultar la API a través de la caché compartida
+            try:
+                product_data = fetch_product_data(params)
+            except ProductDataError as e:
                 return Response({
                     'status': 'error',
-                    'message': f'Error al consultar la API: {response.status_code}'
+                    'message': f'Error al consultar la API: {e.status_code}'
                 }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-            
-            # Obtener los datos de la respuesta
-            product_data = response.json()
-            
+
             return Response(product_data, status=status.HTTP_200_OK)
             
         except Exception as e:
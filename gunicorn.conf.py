@@ -10,8 +10,19 @@ bind = "0.0.0.0:8099"
 # Worker processes - recommended formula is (2 x $num_cores) + 1
 workers = multiprocessing.cpu_count() * 2 + 1
 
+# Server mode: SERVER_MODE=wsgi (default) runs sync workers; SERVER_MODE=asgi
+# runs uvicorn workers so the async proxy views (ASYNC_PROXY_VIEWS) can keep
+# many upstream calls in flight per worker. Start gunicorn without an app
+# argument so this setting picks the entry point.
+server_mode = os.environ.get("SERVER_MODE", "wsgi").lower()
+
 # Worker options
-worker_class = "sync"  # Since Django is synchronous
+if server_mode == "asgi":
+    wsgi_app = "app_manager.asgi:application"
+    worker_class = "uvicorn.workers.UvicornWorker"
+else:
+    wsgi_app = "app_manager.wsgi:application"
+    worker_class = "sync"  # Since Django is synchronous
 worker_connections = 1000
 timeout = 120  # Increased from default 30 seconds to handle longer requests
 keepalive = 5